@@ -0,0 +1,220 @@
+"""Heap allocated per event by the optimized firmware's hot paths
+
+Boots the optimized script under the host simulator and repeats each
+per-event path with tracemalloc running:
+
+  advertise       restart advertising, as after every disconnect
+  get_readings    a GET_READINGS write, from the IRQ through the dispatcher
+                  to the notification, answered from the cached sample
+  stream_sample   one STREAM sample: a fresh sensor read, packed and notified
+  upload_request  a reading packed into the form body and the HTTP request
+
+For each event it reports the transient peak (the most memory held at once
+during the event, simulator bookkeeping included), the bytes allocated
+line by line in src/ (see LineAllocations) and the bytes still held
+afterwards by allocations made in src/. CPython boxes every float and most
+ints, which MicroPython mostly doesn't, so the first two are upper bounds
+on what the device allocates; retained bytes should be zero once warmed
+up, and --check fails if they grow with the number of events.
+
+Usage: python bench/alloc_bench.py [--events 200] [--check]
+"""
+import argparse
+import contextlib
+import inspect
+import os
+import statistics
+import sys
+import tracemalloc
+from array import array
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sim import Device, StandIn, World  # noqa: E402
+
+SRC = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+SCRIPT = os.path.join(SRC, 'ble-readings-server-optimized.py')
+
+# A cached object replaced by a newer one, e.g. the sensor sample, can show
+# up as retained once; a leak grows with the number of events
+RETAINED_SLACK = 256
+
+GENERATOR_FLAGS = inspect.CO_GENERATOR | inspect.CO_COROUTINE | inspect.CO_ASYNC_GENERATOR
+
+
+class Discard:
+    """stdout that keeps nothing, unlike a buffered file or StringIO"""
+
+    def write(self, text):
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+class LineAllocations:
+    """Bytes allocated during a call, counted line by line of src/ code
+
+    tracemalloc's peak is the most memory held at once, which a buffer or
+    string freed again before the call returns doesn't raise. This resets
+    the peak at every line of firmware code and at every call, and adds up
+    how far memory rose above where each step started, simulator calls
+    included. Only the largest of several allocations freed within one
+    step counts.
+    """
+
+    def __init__(self):
+        # current, peak, total, step start: kept in an array so that
+        # updating them allocates nothing that is still held at reset_peak()
+        self._mem = array('q', [0, 0, 0, 0])
+        # Bound once: self._line would allocate a method every time it's used
+        self._trace = self._line
+        self._close = self._step
+
+    def _step(self, frame):
+        mem = self._mem
+        mem[0], mem[1] = tracemalloc.get_traced_memory()
+        # Tracing gives every call a frame object, which the device doesn't
+        # allocate; a generator's is made once and kept, so it counts
+        if frame is not None and not frame.f_code.co_flags & GENERATOR_FLAGS:
+            mem[1] -= sys.getsizeof(frame)
+        if mem[1] > mem[3]:
+            mem[2] += mem[1] - mem[3]
+        mem[3] = mem[0]
+        tracemalloc.reset_peak()
+
+    def _line(self, frame, event, arg):
+        if event == 'line':
+            self._close(None)
+        return self._trace
+
+    def _call(self, frame, event, arg):
+        self._close(frame)
+        return self._trace if frame.f_code.co_filename.startswith(SRC) else None
+
+    def __call__(self, action):
+        mem = self._mem
+        mem[2] = 0
+        mem[3] = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        sys.settrace(self._call)
+        try:
+            action()
+        finally:
+            sys.settrace(None)
+        self._close(None)
+        return mem[2]
+
+
+def boot(standin):
+    """A registered device with a central connected, its tasks started"""
+    world = World()
+    standin.register(world.mac_address)
+    device = Device(SCRIPT, world, standin)
+    device.load()
+    device.call('setup')
+    device.advance(5)  # First reading and upload
+    with device.active():
+        world.central.connect()
+    device.advance(1)
+    return device
+
+
+def events(device):
+    """Event name -> function running that event once"""
+    module = device.module
+    state = module.state
+    server = state.ble_server
+    world = device.world
+    central = world.central
+    conn_handle = central.conn_handle
+
+    def get_readings():
+        central.write(b'GET_READINGS')
+        # event_task's loop body, without waiting on the flag
+        ring = server.events
+        event = ring.pop_into(server._command)
+        while event:
+            server._dispatch(event, ring.conn_handle, ring.arg, server._commands[ring.length])
+            event = ring.pop_into(server._command)
+
+    def stream_sample():
+        server.streaming.add(conn_handle)
+        server._stream_sample()
+
+    url = state.urls['readings']
+    headers = module.api_headers(False, True, None)
+
+    def upload_request():
+        temp, humidity, pressure = state.sensor.sample()
+        body = state.reading_form.pack(temp, humidity, pressure)
+        state.http._prepare('POST', url, body, None, headers)
+
+    return {
+        'advertise': server._advertise,
+        'get_readings': get_readings,
+        'stream_sample': stream_sample,
+        'upload_request': upload_request,
+    }
+
+
+def measure(device, action, count, warmup=20):
+    """Median transient peak and allocated bytes, and total src/ bytes retained"""
+    notifications = device.world.central.notifications
+    src_filter = [tracemalloc.Filter(True, os.path.join(SRC, '*'))]
+    with device.active(), contextlib.redirect_stdout(Discard()):
+        for _ in range(warmup):
+            action()
+        del notifications[:]
+        peaks = []
+        before = tracemalloc.take_snapshot().filter_traces(src_filter)
+        for _ in range(count):
+            tracemalloc.reset_peak()
+            start = tracemalloc.get_traced_memory()[0]
+            action()
+            peaks.append(tracemalloc.get_traced_memory()[1] - start)
+            # The simulated central keeps every notification
+            del notifications[:]
+        after = tracemalloc.take_snapshot().filter_traces(src_filter)
+        allocations = LineAllocations()
+        allocated = []
+        for _ in range(count):
+            allocated.append(allocations(action))
+            del notifications[:]
+    retained = sum(stat.size_diff for stat in after.compare_to(before, 'lineno'))
+    return {
+        'peak_bytes': int(statistics.median(peaks)),
+        'allocated_bytes': int(statistics.median(allocated)),
+        'retained_bytes': retained,
+        'retained_per_event': round(retained / count, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=200, help='runs of each event')
+    parser.add_argument('--check', action='store_true',
+                        help='exit with an error if any event keeps memory allocated')
+    args = parser.parse_args()
+
+    tracemalloc.start()
+    with StandIn() as standin:
+        with contextlib.redirect_stdout(Discard()):
+            device = boot(standin)
+        results = {name: measure(device, action, args.events)
+                   for name, action in events(device).items()}
+    tracemalloc.stop()
+
+    print(f'{"event":16} {"peak B":>8} {"allocated B":>12} {"retained B/event":>17}')
+    for name, result in results.items():
+        print(f'{name:16} {result["peak_bytes"]:8} {result["allocated_bytes"]:12} '
+              f'{result["retained_per_event"]:17}')
+    if args.check:
+        leaking = [name for name, result in results.items()
+                   if result['retained_bytes'] > RETAINED_SLACK]
+        if leaking:
+            sys.exit(f'memory retained by: {", ".join(leaking)}')
+
+
+if __name__ == '__main__':
+    main()
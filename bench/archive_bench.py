@@ -0,0 +1,137 @@
+"""Archive size and scan speed against the readings table
+
+Fills a SQLite store with synthetic history (see rollup_bench.py) and
+archives it with services.archive, then compares:
+
+  size   the readings table with its indexes, the same rows as CSV, the
+         JSON the REST API pages out, and the archive
+  scan   every reading decoded into NumPy arrays, from the archive and
+         from SQLite
+  range  one device over one day, from the archive and from SQLite
+
+and checks the archive decodes to exactly the rows in the store.
+
+Usage: python bench/archive_bench.py [--devices 200] [--rows 1000000]
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np  # noqa: E402
+
+from rollup_bench import INTERVAL_S, START, fill  # noqa: E402
+from services.archive import EPOCH_MS, ArchiveReader, export, store_pages  # noqa: E402
+from services.store import METRICS, ReadingStore  # noqa: E402
+
+DAY_MS = 86400 * 1000
+
+
+def table_bytes(store):
+    """Bytes of the readings table and its indexes, from SQLite's page stats"""
+    try:
+        row = store.db.execute("SELECT sum(pgsize) FROM dbstat "
+                               "WHERE name = 'readings' OR name LIKE 'readings_device%' "
+                               "OR name = 'readings_time'").fetchone()
+        return row[0]
+    except Exception:
+        # Builds without the dbstat table: the whole file
+        store.db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        return os.path.getsize(store.path)
+
+
+def export_bytes(store):
+    """Sizes of the table as CSV and as the JSON a REST export returns"""
+    cursor = store.db.execute('SELECT * FROM readings')
+    columns = [column[0] for column in cursor.description]
+    csv_size = json_size = 0
+    while True:
+        rows = cursor.fetchmany(50000)
+        if not rows:
+            return csv_size, json_size
+        text = io.StringIO()
+        csv.writer(text).writerows(rows)
+        csv_size += len(text.getvalue())
+        json_size += len(json.dumps([dict(zip(columns, row)) for row in rows]))
+
+
+def sqlite_arrays(store, mac_address=None, start=None, end=None):
+    """Readings as NumPy arrays, straight from SQLite"""
+    query = f'SELECT {EPOCH_MS}, {", ".join(METRICS)} FROM readings'
+    params = ()
+    if mac_address:
+        query += ' WHERE mac_address = ? AND created_at >= ? AND created_at < ?'
+        params = (mac_address, _iso(start), _iso(end))
+    table = np.array(store.db.execute(query, params).fetchall(), dtype=np.float64)
+    return table[:, 0].astype('datetime64[ms]'), table[:, 1:].T
+
+
+def _iso(ms):
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(ms / 1000))
+
+
+def timed(action):
+    started = time.perf_counter()
+    result = action()
+    return time.perf_counter() - started, result
+
+
+def verify(store, reader):
+    for mac_address in reader.devices():
+        series = reader.read(mac_address)
+        rows = store.db.execute(
+            f'SELECT {EPOCH_MS}, {", ".join(METRICS)} FROM readings WHERE mac_address = ? '
+            f'ORDER BY created_at, id', (mac_address,)).fetchall()
+        expected = np.array(rows, dtype=np.float64)
+        if not (np.array_equal(series['t'].astype(np.int64), expected[:, 0].astype(np.int64))
+                and all(np.array_equal(series[name], expected[:, i + 1], equal_nan=True)
+                        for i, name in enumerate(METRICS))):
+            sys.exit(f'archive differs from the store for {mac_address}')
+    print(f'Decoded all {reader.rows} readings of {len(reader.devices())} devices exactly')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--devices', type=int, default=200)
+    parser.add_argument('--rows', type=int, default=1000000, help='rows of history')
+    parser.add_argument('--block-rows', type=int, default=4096)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = ReadingStore(os.path.join(directory, 'readings.db'))
+        fill(store, args.devices, args.rows)
+        path = os.path.join(directory, 'readings.nc6a')
+        elapsed, rows = timed(lambda: export(store_pages(store), path, args.block_rows))
+        print(f'Archived {rows} readings in {elapsed:.1f} s ({rows / elapsed:,.0f} rows/s)\n')
+
+        archive = os.path.getsize(path)
+        csv_size, json_size = export_bytes(store)
+        print(f'{"size":16} {"MB":>8} {"B/row":>7} {"archive x":>9}')
+        for name, size in (('sqlite table', table_bytes(store)), ('csv', csv_size),
+                           ('json', json_size), ('archive', archive)):
+            print(f'{name:16} {size / 2 ** 20:8.1f} {size / rows:7.1f} {size / archive:9.1f}')
+
+        reader = ArchiveReader(path)
+        mac_address = reader.devices()[0]
+        day = (START * 1000 + (args.rows // args.devices * INTERVAL_S * 1000) // 2)
+        print(f'\n{"scan":16} {"archive ms":>10} {"sqlite ms":>10}')
+        for name, from_archive, from_sqlite in (
+                ('all readings', lambda: list(reader.scan()), lambda: sqlite_arrays(store)),
+                ('1 device, 1 day', lambda: reader.read(mac_address, day, day + DAY_MS),
+                 lambda: sqlite_arrays(store, mac_address, day, day + DAY_MS))):
+            archive_s, _ = timed(from_archive)
+            sqlite_s, _ = timed(from_sqlite)
+            print(f'{name:16} {archive_s * 1000:10.1f} {sqlite_s * 1000:10.1f}')
+        print()
+        verify(store, reader)
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
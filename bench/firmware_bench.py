@@ -0,0 +1,340 @@
+"""Benchmark the firmware scripts under the host simulator
+
+Runs each script unmodified against a simulated clock, sensor, BLE central
+and network, once per network profile, and measures:
+
+  loop          time spent awake per main loop iteration (per event loop
+                wakeup for asyncio scripts), excluding the idle sleep until
+                the next deadline
+  get_readings  BLE GET_READINGS write until the response is available
+  busy_get_readings
+                the same while an upload is in flight, for asyncio scripts
+                (the others can't take a command until the upload returns)
+  register      BLE REGISTER write until the response is available, on a
+                fresh unregistered device each time
+  upload        readings stored by the stand-in per second of device time
+                spent in the upload path
+  drain         the same for a queued backlog, where the script has one
+
+Times are device time: real CPU time on this host plus the simulated
+network and I2C latency, so compare runs made on the same machine.
+
+Usage: python bench/firmware_bench.py [--scripts optimized compact] [--json out.json]
+"""
+import argparse
+import contextlib
+import inspect
+import io
+import itertools
+import json
+import os
+import sys
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sim import Device, StandIn, World  # noqa: E402
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+# Script name -> (file, function that takes and uploads one reading, answers
+# BLE commands as they arrive). The legacy script polls the characteristic
+# from a blocking pairing loop, so it only gets loop and upload numbers.
+SCRIPTS = {
+    'optimized': ('ble-readings-server-optimized.py', 'take_readings', True),
+    'compact': ('ble-readings-server-compact.py', 'take_reading', True),
+    'legacy': ('ble-readings-server.py', 'takeReadings', False),
+}
+
+# Profile name -> (connect ms for DNS + TCP + TLS, round trip ms per request)
+PROFILES = {
+    'local': (0, 0),
+    'wifi': (150, 40),
+    'degraded': (1200, 400),
+}
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def summarize(timings):
+    """p50/p99/max of device-time samples in seconds, reported in ms"""
+    if not timings:
+        return {'samples': 0}
+    return {
+        'samples': len(timings),
+        'p50_ms': round(percentile(timings, 0.5) * 1000, 3),
+        'p99_ms': round(percentile(timings, 0.99) * 1000, 3),
+        'max_ms': round(max(timings) * 1000, 3),
+    }
+
+
+class Bench:
+    """One script under one network profile"""
+
+    _macs = itertools.count(1)  # Every device gets its own row in the shared stand-in
+
+    def __init__(self, script, profile, standin, i2c_ms):
+        filename, self.upload_func, self.ble = SCRIPTS[script]
+        self.path = os.path.join(SRC, filename)
+        self.connect_ms, self.rtt_ms = PROFILES[profile]
+        self.standin = standin
+        self.i2c_ms = i2c_ms
+
+    def boot(self, registered):
+        """Load the script on a new device and run its setup()"""
+        serial = next(self._macs)
+        world = World(mac=bytes([0x24, 0x58, 0x7C, 0, serial >> 8, serial & 0xFF]))
+        world.net.connect_ms = self.connect_ms
+        world.net.rtt_ms = self.rtt_ms
+        world.sensor.read_ms = self.i2c_ms
+        if registered:
+            self.standin.register(world.mac_address)
+        device = Device(self.path, world, self.standin)
+        device.load()
+        # asyncio scripts start their tasks in setup() and have no loop()
+        device.is_async = inspect.iscoroutinefunction(device.module.setup)
+        device.call('setup')
+        return device
+
+    def pair(self, device, max_iterations=100):
+        """Hold BtnA until the device advertises, then connect the central"""
+        world = device.world
+        if world.radio.advertising is None:
+            world.button.hold()
+            if device.is_async:
+                device.advance(30, until=lambda: world.radio.advertising is not None)
+            else:
+                with device.active():
+                    for _ in range(max_iterations):
+                        device.module.loop()
+                        if world.radio.advertising is not None:
+                            break
+        world.central.connect()
+
+    def respond(self, device, command):
+        """Write a command and return device seconds until the response shows up
+
+        The response is either a notification or a new characteristic
+        value for the central to read, depending on the script.
+        """
+        world = device.world
+        central = world.central
+        seen = len(central.notifications)
+
+        def responded():
+            return len(central.notifications) > seen or central.read() != command
+
+        with device.active():
+            start = world.clock.now()
+            central.write(command)
+        if not responded():
+            # The IRQ only queues the command; the main loop or a task answers it
+            if device.is_async:
+                device.advance(30, until=responded)
+            else:
+                with device.active():
+                    for _ in range(10):
+                        device.module.loop()
+                        if responded():
+                            break
+        if len(central.notifications) > seen:
+            return central.notifications[seen][0] - start
+        if central.read() != command:
+            return world.radio.written[world.radio.characteristics[0]] - start
+        return None
+
+    def loop(self, seconds):
+        device = self.boot(registered=True)
+        clock = device.world.clock
+        timings = []
+        errors = 0
+        if device.is_async:
+            return dict(summarize(self._wakeups(device, seconds)), errors=errors)
+        with device.active():
+            stop = clock.now() + seconds
+            while clock.now() < stop:
+                start = clock.now()
+                try:
+                    device.module.loop()
+                except Exception:
+                    errors += 1
+                timings.append(max(0.0, clock.now() - start - clock.last_sleep))
+        return dict(summarize(timings), errors=errors)
+
+    def _wakeups(self, device, seconds):
+        """Awake time between the event loop's sleeps"""
+        clock = device.world.clock
+        sleep = clock.sleep
+        timings = []
+        woke = [clock.now()]
+
+        def timed_sleep(duration):
+            timings.append(clock.now() - woke[0])
+            sleep(duration)
+            woke[0] = clock.now()
+
+        clock.sleep = timed_sleep
+        try:
+            device.advance(seconds)
+        finally:
+            clock.sleep = sleep
+        return timings
+
+    def get_readings(self, samples):
+        if not self.ble:
+            return None
+        device = self.boot(registered=False)
+        self.pair(device)
+        timings = [self.respond(device, b'GET_READINGS') for _ in range(samples)]
+        return summarize([t for t in timings if t is not None])
+
+    def busy_get_readings(self, samples):
+        """GET_READINGS with an upload in flight on the same device"""
+        if not self.ble:
+            return None
+        device = self.boot(registered=True)
+        if not device.is_async:
+            return None
+        self.pair(device)
+        loop = device.event_loop()
+        timings = []
+        for _ in range(samples):
+            with device.active():
+                upload = loop.create_task(device.module.__dict__[self.upload_func]())
+            timing = self.respond(device, b'GET_READINGS')
+            if timing is not None:
+                timings.append(timing)
+            device.advance(60, until=upload.done)
+        return summarize(timings)
+
+    def register(self, samples):
+        if not self.ble:
+            return None
+        timings = []
+        for _ in range(samples):
+            device = self.boot(registered=False)
+            self.pair(device)
+            timing = self.respond(device, b'REGISTER')
+            if timing is not None:
+                timings.append(timing)
+        return summarize(timings)
+
+    def upload(self, count):
+        device = self.boot(registered=True)
+        return self._throughput(device, lambda: [device.call(self.upload_func)
+                                                 for _ in range(count)])
+
+    def drain(self, count):
+        device = self.boot(registered=True)
+        module = device.module
+        if not hasattr(module, 'reading_queue'):
+            return None
+        with device.active():
+            # Pretend the device was offline while these were taken
+            now = device.world.clock.time()
+            for i in range(count):
+                module.reading_queue.append(int(now) - (count - i) * 600, 21.0, 45.0, 1013.0)
+        return self._throughput(device, lambda: device.call('drain_queue'))
+
+    def _throughput(self, device, work):
+        clock = device.world.clock
+        stored = self.standin.count('readings')
+        with device.active():
+            start = clock.now()
+            work()
+            elapsed = clock.now() - start
+        uploaded = self.standin.count('readings') - stored
+        return {
+            'readings': uploaded,
+            'seconds': round(elapsed, 3),
+            'readings_per_s': round(uploaded / elapsed, 2) if elapsed else None,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scripts', nargs='+', choices=SCRIPTS, default=['optimized', 'compact'])
+    parser.add_argument('--profiles', nargs='+', choices=PROFILES, default=list(PROFILES))
+    parser.add_argument('--hours', type=float, default=1.0,
+                        help='device time to run the main loop for')
+    parser.add_argument('--samples', type=int, default=50, help='GET_READINGS writes')
+    parser.add_argument('--registrations', type=int, default=5)
+    parser.add_argument('--uploads', type=int, default=50)
+    parser.add_argument('--backlog', type=int, default=500, help='queued readings to drain')
+    parser.add_argument('--i2c-ms', type=float, default=10.0,
+                        help='sensor conversion time per read call')
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help='print changes against results saved with --json')
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {(r['script'], r['profile']): r for r in json.load(f)['results']}
+
+    # Benches drop asyncio devices with requests still in flight
+    warnings.filterwarnings('ignore', 'coroutine .* was never awaited')
+
+    results = []
+    with StandIn() as standin:
+        for script in args.scripts:
+            for profile in args.profiles:
+                bench = Bench(script, profile, standin, args.i2c_ms)
+                # Keep the firmware's console output out of the report
+                with contextlib.redirect_stdout(io.StringIO()):
+                    result = {
+                        'script': script,
+                        'profile': profile,
+                        'loop': bench.loop(args.hours * 3600),
+                        'get_readings': bench.get_readings(args.samples),
+                        'busy_get_readings': bench.busy_get_readings(args.samples),
+                        'register': bench.register(args.registrations),
+                        'upload': bench.upload(args.uploads),
+                        'drain': bench.drain(args.backlog),
+                    }
+                results.append(result)
+                print_result(result, baseline.get((script, profile)))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'benchmark': 'firmware', 'i2c_ms': args.i2c_ms,
+                       'profiles': {name: dict(zip(('connect_ms', 'rtt_ms'), PROFILES[name]))
+                                    for name in args.profiles},
+                       'results': results}, f, indent=2)
+
+
+def change(value, before):
+    """Relative change against a baseline value, e.g. ' (-12.5%)'"""
+    if value is None or not before:
+        return ''
+    return f' ({(value - before) / before * 100:+.1f}%)'
+
+
+def print_result(result, baseline=None):
+    print(f"{result['script']} / {result['profile']}")
+    for name in ('loop', 'get_readings', 'busy_get_readings', 'register'):
+        stats = result[name]
+        if stats is None:
+            continue
+        before = (baseline or {}).get(name) or {}
+        if stats.get('samples'):
+            print(f"  {name:<17} p50 {stats['p50_ms']:>10.3f} ms{change(stats['p50_ms'], before.get('p50_ms'))}"
+                  f"  p99 {stats['p99_ms']:>10.3f} ms{change(stats['p99_ms'], before.get('p99_ms'))}"
+                  f"  max {stats['max_ms']:>10.3f} ms  n={stats['samples']}")
+        else:
+            print(f'  {name:<17} no responses')
+    for name in ('upload', 'drain'):
+        stats = result[name]
+        if stats:
+            before = (baseline or {}).get(name) or {}
+            print(f"  {name:<17} {stats['readings']} readings in {stats['seconds']} s"
+                  f" = {stats['readings_per_s']} readings/s"
+                  f"{change(stats['readings_per_s'], before.get('readings_per_s'))}")
+
+
+if __name__ == '__main__':
+    main()
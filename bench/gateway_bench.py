@@ -0,0 +1,169 @@
+"""Rows per second the ingestion gateway writes to SQLite
+
+Starts services.gateway in a child process on a fresh SQLite file and
+drives it from many keep-alive connections, each acting as a device that
+POSTs a reading as soon as the last one was answered. Devices send the
+firmware's URL-encoded reading, or with --rows-per-request, JSON arrays as
+flush_readings does.
+
+Three gateway configurations are compared:
+
+  per-request  batch_rows=1: a transaction per request, like the database
+               sees today with every device inserting its own row
+  batched      requests grouped into multi-row transactions, answered on commit
+  queued       batched, answered as soon as the rows are queued
+
+For each it reports acknowledged rows/sec, request latency percentiles,
+503 answers and the rows that actually reached the database.
+
+Usage: python bench/gateway_bench.py [--devices 200] [--seconds 5] [--rows-per-request 1]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from services.gateway import READINGS_PATH, Gateway  # noqa: E402
+from services.store import ReadingStore  # noqa: E402
+
+CONFIGS = {
+    'per-request': {'batch_rows': 1, 'flush_ms': 0},
+    'batched': {'batch_rows': 500, 'flush_ms': 20},
+    'queued': {'batch_rows': 500, 'flush_ms': 20, 'ack': 'queue'},
+}
+
+
+def run_gateway(path, options, ready, done):
+    """Child process: serve until `done` is set, then report the gateway's stats"""
+
+    async def serve():
+        store = ReadingStore(path)
+        gateway = await Gateway(store, max_pending=20000, **options).start()
+        ready.send(gateway.address)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, done.wait)
+        await gateway.close()
+        ready.send(gateway.stats())
+        store.close()
+
+    asyncio.run(serve())
+
+
+def reading_body(mac_address, rows):
+    """The firmware's form body for one row, or a JSON array of rows"""
+    readings = [{'mac_address': mac_address, 'sensor': 'm5_env_4',
+                 'temperature': round(random.uniform(18, 26), 2),
+                 'humidity': round(random.uniform(30, 60), 2),
+                 'pressure': round(random.uniform(990, 1030), 2)} for _ in range(rows)]
+    if rows == 1:
+        body = '&'.join(f'{k}={v}' for k, v in readings[0].items()).encode()
+        return body, 'application/x-www-form-urlencoded'
+    return json.dumps(readings).encode(), 'application/json'
+
+
+async def device(address, index, rows, deadline, latencies, results):
+    """One device posting back to back over a keep-alive connection"""
+    mac_address = f'{0x24587C000000 + index:012X}'
+    reader, writer = await asyncio.open_connection(*address)
+    try:
+        while time.perf_counter() < deadline:
+            body, content_type = reading_body(mac_address, rows)
+            writer.write((f'POST {READINGS_PATH} HTTP/1.1\r\n'
+                          f'Host: bench\r\n'
+                          f'Content-Type: {content_type}\r\n'
+                          f'Content-Length: {len(body)}\r\n\r\n').encode() + body)
+            started = time.perf_counter()
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line == b'\r\n':
+                    break
+                if line.lower().startswith(b'content-length:'):
+                    length = int(line.split(b':')[1])
+            if length:
+                await reader.readexactly(length)
+            latencies.append(time.perf_counter() - started)
+            results[status] = results.get(status, 0) + 1
+            if status == 503:
+                await asyncio.sleep(0.05)
+    finally:
+        writer.close()
+
+
+async def drive(address, devices, rows, seconds):
+    latencies = []
+    results = {}
+    started = time.perf_counter()
+    deadline = started + seconds
+    await asyncio.gather(*(device(address, i, rows, deadline, latencies, results)
+                           for i in range(devices)))
+    return time.perf_counter() - started, latencies, results
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else 0.0
+
+
+def bench(name, options, args):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'readings.db')
+        parent, child = multiprocessing.Pipe()
+        done = multiprocessing.Event()
+        process = multiprocessing.Process(target=run_gateway, args=(path, options, child, done))
+        process.start()
+        address = parent.recv()
+        elapsed, latencies, results = asyncio.run(
+            drive(address, args.devices, args.rows_per_request, args.seconds))
+        done.set()
+        stats = parent.recv()
+        process.join()
+        stored = ReadingStore(path).count()
+
+    accepted = results.get(201, 0) * args.rows_per_request
+    return {
+        'config': name,
+        'rows_per_s': round(accepted / elapsed),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'throttled': results.get(503, 0),
+        'errors': sum(count for status, count in results.items() if status not in (201, 503)),
+        'mean_batch': stats['mean_batch'],
+        'stored': stored,
+        'acknowledged': accepted,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--devices', type=int, default=200, help='concurrent connections')
+    parser.add_argument('--seconds', type=float, default=5, help='length of each run')
+    parser.add_argument('--rows-per-request', type=int, default=1,
+                        help='1 sends form bodies, more sends JSON arrays')
+    parser.add_argument('--config', choices=sorted(CONFIGS), action='append',
+                        help='configurations to run; all by default')
+    args = parser.parse_args()
+
+    print(f'{args.devices} devices, {args.rows_per_request} rows per request, '
+          f'{args.seconds:g} s per run')
+    print(f'{"config":12} {"rows/s":>8} {"p50 ms":>8} {"p99 ms":>8} {"503s":>6} '
+          f'{"errors":>6} {"batch":>7} {"stored":>8}')
+    for name in args.config or CONFIGS:
+        result = bench(name, CONFIGS[name], args)
+        print(f'{name:12} {result["rows_per_s"]:8} {result["p50_ms"]:8} {result["p99_ms"]:8} '
+              f'{result["throttled"]:6} {result["errors"]:6} {result["mean_batch"]:7} '
+              f'{result["stored"]:8}')
+        if result['stored'] < result['acknowledged']:
+            print(f'  {result["acknowledged"] - result["stored"]} acknowledged rows missing')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""Benchmark the pooled Supabase client against a local HTTPS stand-in
+
+Compares three ways of making the same sequence of requests:
+
+  fresh      a new connection per request (DNS, TCP and a full TLS handshake),
+             which is what requests2 does today
+  resumed    a new TCP connection per request, resuming the cached TLS session
+  keepalive  one persistent connection reused for every request
+
+Usage: python bench/http_pool_bench.py [--requests 200] [--connect-delay-ms 0]
+"""
+import argparse
+import json
+import os
+import shutil
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from nanoc6.http_pool import HTTPPool  # noqa: E402
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Answers like PostgREST does for the two calls the firmware makes"""
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._reply(200, b'[{"id":1}]')
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self._reply(201, b'')
+
+    def _reply(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+    connect_delay = 0.0
+
+    def get_request(self):
+        # Stand in for the DNS and TCP round trips of a real network
+        request = super().get_request()
+        if self.connect_delay:
+            time.sleep(self.connect_delay)
+        return request
+
+
+def make_certificate(directory):
+    cert = os.path.join(directory, 'cert.pem')
+    key = os.path.join(directory, 'key.pem')
+    subprocess.run(
+        ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+         '-subj', '/CN=localhost', '-keyout', key, '-out', cert],
+        check=True, capture_output=True)
+    return cert, key
+
+
+def start_server(cert, key, connect_delay_ms):
+    server = StandInServer(('127.0.0.1', 0), StandInHandler)
+    server.connect_delay = connect_delay_ms / 1000
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run(mode, base_url, count):
+    """Time count alternating GET/POST requests, returning per-request ms"""
+    headers = {'apikey': 'bench'}
+    pool = HTTPPool(base_url)
+    timings = []
+    connects = 0
+    for i in range(count):
+        if mode == 'fresh':
+            connects += pool.connects
+            pool = HTTPPool(base_url)
+        start = time.perf_counter()
+        if i % 2:
+            response = pool.post(f'{base_url}/readings', data='temperature=21.5',
+                                 headers=headers)
+        else:
+            response = pool.get(f'{base_url}/devices?select=id', headers=headers)
+        response.close()
+        if mode != 'keepalive':
+            pool.close()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings, connects + pool.connects, pool.resumed
+
+
+def summarize(mode, timings, connects, resumed):
+    ordered = sorted(timings)
+    return {
+        'mode': mode,
+        'requests': len(timings),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'p50_ms': round(ordered[len(ordered) // 2], 3),
+        'p99_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 3),
+        'connects': connects,
+        'tls_resumed': resumed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--connect-delay-ms', type=float, default=0.0,
+                        help='extra delay per new connection, emulating DNS and TCP setup')
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    if not shutil.which('openssl'):
+        sys.exit('openssl is needed to create the stand-in certificate')
+
+    with tempfile.TemporaryDirectory() as directory:
+        server = start_server(*make_certificate(directory), args.connect_delay_ms)
+        base_url = f'https://127.0.0.1:{server.server_address[1]}/rest/v1'
+        try:
+            # Warm up imports and the server before timing anything
+            run('keepalive', base_url, 4)
+            results = [summarize(mode, *run(mode, base_url, args.requests))
+                       for mode in ('fresh', 'resumed', 'keepalive')]
+        finally:
+            server.shutdown()
+
+    baseline = results[0]['mean_ms']
+    print(f"{'mode':<10} {'mean ms':>9} {'p50 ms':>9} {'p99 ms':>9} "
+          f"{'connects':>9} {'resumed':>8} {'saved/req':>10}")
+    for result in results:
+        result['saved_ms_per_request'] = round(baseline - result['mean_ms'], 3)
+        print(f"{result['mode']:<10} {result['mean_ms']:>9.3f} {result['p50_ms']:>9.3f} "
+              f"{result['p99_ms']:>9.3f} {result['connects']:>9} {result['tls_resumed']:>8} "
+              f"{result['saved_ms_per_request']:>10.3f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'benchmark': 'http_pool', 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""Replay a backend outage against a fleet of simulated devices
+
+Every device boots at the same moment, as after a power cut, and runs the
+firmware unmodified against a stand-in that answers 503 during the outage
+window. Requests are binned by device time to show the request-rate
+envelope the backend sees before, during and after the outage.
+
+  backoff  the firmware as shipped: exponential backoff with full jitter
+  fixed    retries at the firmware's fixed intervals, as before backoff
+
+Usage: python bench/outage_scenario.py [--devices 50] [--outage 10:30] [--mode fixed backoff]
+"""
+import argparse
+import contextlib
+import inspect
+import io
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sim import Device, SimulationEnd, StandIn, World  # noqa: E402
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+SCRIPTS = {
+    'optimized': 'ble-readings-server-optimized.py',
+    'compact': 'ble-readings-server-compact.py',
+}
+
+
+class FixedRetry:
+    """Stands in for nanoc6.backoff.Backoff with no backoff at all"""
+
+    failures = 0
+    delay_ms = 0
+
+    def ready(self):
+        return True
+
+    def remaining_ms(self):
+        return 0
+
+    def failure(self):
+        return 0
+
+    def success(self):
+        pass
+
+
+def disable_backoff(module):
+    holder = module.state if hasattr(module, 'state') else module
+    holder.api_backoff = FixedRetry()
+    holder.poll_backoff = FixedRetry()
+
+
+def run_device(script, serial, standin, seconds, registered, mode, wifi_outage=None):
+    """Boot one device and run it for `seconds`; returns the Device"""
+    world = World(mac=bytes([0x24, 0x58, 0x7C, 1, serial >> 8, serial & 0xFF]), seed=serial)
+    if wifi_outage:
+        world.net.add_outage(*wifi_outage)
+    if registered:
+        standin.register(world.mac_address)
+    standin.clock = world.clock.now
+    device = Device(os.path.join(SRC, SCRIPTS[script]), world, standin)
+    clock = world.clock
+    clock.stop_at = seconds
+    with contextlib.redirect_stdout(io.StringIO()):
+        module = device.load()
+        if mode == 'fixed':
+            disable_backoff(module)
+        try:
+            if inspect.iscoroutinefunction(module.setup):
+                # setup() starts the firmware's tasks, which then run until stop_at
+                device.call('setup')
+                device.advance(seconds)
+            else:
+                with device.active():
+                    module.setup()
+                    while True:
+                        try:
+                            module.loop()
+                        except Exception as e:
+                            print(f'Loop error: {e}')
+        except SimulationEnd:
+            pass
+    return device
+
+
+def envelope(requests, seconds, bin_s, outage):
+    bins = [0] * (int(seconds // bin_s) + 1)
+    for at, _, _, _ in requests:
+        if at < seconds:
+            bins[int(at // bin_s)] += 1
+    rates = [count / bin_s for count in bins]
+    start, end = outage
+    during = [r for i, r in enumerate(rates) if start <= i * bin_s < end]
+    after = [r for i, r in enumerate(rates) if end <= i * bin_s < end + 300]
+    return {
+        'bin_s': bin_s,
+        'rates': rates,
+        'requests': sum(bins),
+        'requests_during_outage': sum(1 for at, *_ in requests if start <= at < end),
+        'peak_rps_during_outage': max(during, default=0),
+        'peak_rps_after_recovery': max(after, default=0),
+        'stored_readings': None,
+    }
+
+
+def scenario(args, mode):
+    outage = tuple(float(m) * 60 for m in args.outage.split(':'))
+    seconds = args.minutes * 60
+    with StandIn() as standin:
+        standin.outages = [outage]
+        unregistered = int(args.devices * args.unregistered)
+        for serial in range(args.devices):
+            run_device(args.script, serial, standin, seconds, serial >= unregistered, mode)
+        result = envelope(standin.requests, seconds, args.bin, outage)
+        result['stored_readings'] = standin.count('readings')
+    result['mode'] = mode
+    return result
+
+
+def print_envelope(result, width=50):
+    rates = result['rates']
+    bin_s = result['bin_s']
+    top = max(rates) or 1
+    print(f"{result['mode']}: {result['requests']} requests, "
+          f"{result['requests_during_outage']} during the outage, "
+          f"peak {result['peak_rps_during_outage']:.1f} req/s during, "
+          f"{result['peak_rps_after_recovery']:.1f} req/s in the 5 min after, "
+          f"{result['stored_readings']} readings stored")
+    # One row per minute, showing the busiest bin in it
+    per_row = max(1, int(60 // bin_s))
+    for row in range(0, len(rates), per_row):
+        peak = max(rates[row:row + per_row])
+        print(f'  {row * bin_s / 60:5.0f} min {peak:7.1f} req/s |{"#" * round(peak / top * width)}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--script', choices=SCRIPTS, default='compact')
+    parser.add_argument('--devices', type=int, default=50)
+    parser.add_argument('--unregistered', type=float, default=0.2,
+                        help='fraction of devices waiting to be paired')
+    parser.add_argument('--minutes', type=float, default=60)
+    parser.add_argument('--outage', default='10:30', metavar='START:END',
+                        help='backend outage window in minutes after boot')
+    parser.add_argument('--bin', type=float, default=10, help='histogram bin in seconds')
+    parser.add_argument('--mode', nargs='+', choices=('fixed', 'backoff'),
+                        default=['fixed', 'backoff'])
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    results = []
+    for mode in args.mode:
+        result = scenario(args, mode)
+        results.append(result)
+        print_envelope(result)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'benchmark': 'outage', 'script': args.script, 'devices': args.devices,
+                       'outage_minutes': args.outage, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""Response size and time of downsampled series against the raw rows
+
+Fills a store with synthetic history (see rollup_bench.py), rolls it up,
+then asks services.query for windows of growing length, for one device
+and for all of them. It reports the rows the dashboard would load for
+that window today, their JSON size, and the size and server time of the
+downsampled answer. Both should stay flat as the window grows.
+
+It also checks the NumPy LTTB against a plain Python one on a long
+series: the same points must be kept.
+
+Usage: python bench/query_bench.py [--devices 50] [--rows 500000] [--points 800]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np  # noqa: E402
+
+from rollup_bench import INTERVAL_S, START, fill  # noqa: E402
+from services.query import SeriesQuery, lttb  # noqa: E402
+from services.rollup import Rollup  # noqa: E402
+from services.store import ReadingStore, iso_timestamp  # noqa: E402
+
+DAY = 86400
+WINDOWS = [('1 day', DAY), ('7 days', 7 * DAY), ('30 days', 30 * DAY), ('1 year', 365 * DAY)]
+
+
+def lttb_reference(x, y, n_out):
+    """Textbook LTTB over plain lists, one series"""
+    n = len(x)
+    if n_out >= n:
+        return list(range(n))
+    size = (n - 2) / (n_out - 2)
+    kept = [0]
+    a = 0
+    for b in range(n_out - 2):
+        low = int(b * size) + 1
+        high = int((b + 1) * size) + 1
+        if b == n_out - 3:
+            cx, cy = x[-1], y[-1]
+        else:
+            next_high = int((b + 2) * size) + 1
+            cx = sum(x[high:next_high]) / (next_high - high)
+            cy = sum(y[high:next_high]) / (next_high - high)
+        best, best_area = low, -1.0
+        for i in range(low, high):
+            area = abs((x[a] - cx) * (y[i] - y[a]) - (x[a] - x[i]) * (cy - y[a]))
+            if area > best_area:
+                best, best_area = i, area
+        kept.append(best)
+        a = best
+    kept.append(n - 1)
+    return kept
+
+
+def check_lttb(n=200000, n_out=800):
+    x = np.cumsum(np.random.uniform(200, 400, n))
+    y = np.cumsum(np.random.normal(0, 0.1, (3, n)), axis=1) + 20
+    started = time.perf_counter()
+    kept = lttb(x, y, n_out)
+    vectorized = time.perf_counter() - started
+    xs = x.tolist()
+    started = time.perf_counter()
+    reference = [lttb_reference(xs, row.tolist(), n_out) for row in y]
+    plain = time.perf_counter() - started
+    if kept.tolist() != reference:
+        sys.exit('NumPy LTTB keeps different points from the reference')
+    print(f'LTTB {n} points x 3 metrics -> {n_out}: NumPy {vectorized * 1000:.1f} ms, '
+          f'plain Python {plain * 1000:.1f} ms, same points kept')
+
+
+def raw_rows(store, start, end, mac_address=None):
+    """Every reading in the window, as the dashboard loads them"""
+    query = 'SELECT * FROM readings WHERE created_at >= ? AND created_at < ?'
+    params = [iso_timestamp(_utc(start)), iso_timestamp(_utc(end))]
+    if mac_address:
+        query += ' AND mac_address = ?'
+        params.append(mac_address)
+    cursor = store.db.execute(query + ' ORDER BY created_at DESC', params)
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def _utc(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--devices', type=int, default=50)
+    parser.add_argument('--rows', type=int, default=500000, help='rows of history')
+    parser.add_argument('--points', type=int, default=800, help='target points per metric')
+    args = parser.parse_args()
+
+    random.seed(1)
+    np.random.seed(1)
+    check_lttb()
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = ReadingStore(os.path.join(directory, 'readings.db'))
+        fill(store, args.devices, args.rows)
+        Rollup(store).catch_up()
+        end = START + args.rows // args.devices * INTERVAL_S
+        print(f'{args.rows} readings from {args.devices} devices over '
+              f'{(end - START) / DAY:.0f} days\n')
+
+        query = SeriesQuery(store)
+        mac_address = query.devices()[0]
+        print(f'{"window":8} {"devices":>7} {"raw rows":>9} {"raw KB":>8} {"source":>6} '
+              f'{"points":>7} {"KB":>6} {"ms":>7}')
+        for name, span in WINDOWS:
+            start = max(START, end - span)
+            for macs, label in (([mac_address], '1'), ([], 'all')):
+                rows = raw_rows(store, start, end, macs[0] if macs else None)
+                raw_kb = len(json.dumps(rows)) / 1024
+                started = time.perf_counter()
+                payload = query.series(macs, start, end, args.points)
+                elapsed = time.perf_counter() - started
+                points = sum(len(segment['t']) for device in payload['devices'].values()
+                             for segment in device['temperature'])
+                print(f'{name:8} {label:>7} {len(rows):9} {raw_kb:8.0f} {payload["source"]:>6} '
+                      f'{points:7} {len(json.dumps(payload)) / 1024:6.0f} {elapsed * 1000:7.1f}')
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""Rollup cost against history size, and what the dashboard's queries cost
+
+Fills a SQLite store with synthetic readings, by default 2 million rows
+from 200 devices reporting every 5 minutes (about 35 days), then times:
+
+  catch-up     rolling up the whole history once
+  increment    rolling up one more reading interval (one row per device),
+               which should cost about the same whatever the history length
+  rescan       the full GROUP BY that keeping rollups without a watermark
+               would have to run every time
+  dashboard    select every reading, as +page.server.ts does today, against
+               one row per device per hour or per day from the rollups
+
+Then it checks the rollups against the raw rows: total counts, and the
+aggregates of a sample of buckets recomputed from readings.
+
+Usage: python bench/rollup_bench.py [--devices 200] [--rows 2000000] [--db FILE]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from services.rollup import Rollup  # noqa: E402
+from services.store import READING_NAMES, ReadingStore  # noqa: E402
+
+INTERVAL_S = 300
+START = 1754006400  # 2025-08-01T00:00:00Z
+CHUNK = 50000
+
+
+def synthetic_rows(devices, count, start=START, step=0):
+    """count rows round-robin over devices, one interval per round, as value tuples"""
+    macs = [f'{0x24587C000000 + i:012X}' for i in range(devices)]
+    base = [(random.uniform(18, 24), random.uniform(35, 55), random.uniform(995, 1025))
+            for _ in range(devices)]
+    padding = (None,) * (len(READING_NAMES) - 6)
+    rows = []
+    for n in range(count):
+        device, round_ = n % devices, n // devices + step
+        seconds = start + round_ * INTERVAL_S + device  # Devices a second apart
+        temperature, humidity, pressure = base[device]
+        rows.append((macs[device], 'm5_env_4',
+                     round(temperature + random.gauss(0, 0.5), 2),
+                     round(humidity + random.gauss(0, 2), 2),
+                     round(pressure + random.gauss(0, 1), 2),
+                     time.strftime('%Y-%m-%dT%H:%M:%S.000000+00:00', time.gmtime(seconds)))
+                    + padding)
+        if len(rows) == CHUNK:
+            yield rows
+            rows = []
+    if rows:
+        yield rows
+
+
+def fill(store, devices, count, step=0):
+    for rows in synthetic_rows(devices, count, step=step):
+        store.insert_readings(rows)
+
+
+def timed(action):
+    started = time.perf_counter()
+    result = action()
+    return time.perf_counter() - started, result
+
+
+def check(store, samples=20):
+    """Compare the rollups with aggregates recomputed from readings"""
+    db = store.db
+    for resolution in ('1m', '1h', '1d'):
+        total = db.execute(f'SELECT sum(count) FROM readings_{resolution}').fetchone()[0]
+        rows = db.execute('SELECT count(*) FROM readings '
+                          'WHERE unixepoch(created_at) IS NOT NULL').fetchone()[0]
+        if total != rows:
+            sys.exit(f'readings_{resolution} counts {total} rows, readings has {rows} with a time')
+    buckets = db.execute('SELECT mac_address, bucket, count, temperature_min, temperature_max, '
+                         'temperature_mean FROM readings_1h ORDER BY random() LIMIT ?',
+                         (samples,)).fetchall()
+    for mac_address, bucket, count, low, high, mean in buckets:
+        expected = db.execute(
+            'SELECT count(*), min(temperature), max(temperature), avg(temperature) '
+            'FROM readings WHERE mac_address = ? AND created_at >= ? AND created_at < ?',
+            (mac_address, _iso(bucket), _iso(bucket + 3600))).fetchone()
+        if expected[:3] != (count, low, high) or abs(expected[3] - mean) > 1e-9:
+            sys.exit(f'readings_1h {mac_address} {bucket}: {count, low, high, mean} '
+                     f'!= {expected}')
+    print(f'Checked counts of every table and {len(buckets)} hourly buckets: OK')
+
+
+def _iso(seconds):
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(seconds))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--devices', type=int, default=200)
+    parser.add_argument('--rows', type=int, default=2000000, help='rows of history')
+    parser.add_argument('--db', help='SQLite file to use; a temporary one by default')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = ReadingStore(args.db or os.path.join(directory, 'readings.db'))
+        elapsed, _ = timed(lambda: fill(store, args.devices, args.rows))
+        print(f'Inserted {args.rows} readings from {args.devices} devices '
+              f'in {elapsed:.1f} s ({args.rows / elapsed:,.0f} rows/s)')
+
+        rollup = Rollup(store)
+        elapsed, covered = timed(rollup.catch_up)
+        print(f'{"catch-up":12} {elapsed * 1000:10.1f} ms  {covered} readings '
+              f'({covered / elapsed:,.0f} rows/s)')
+
+        rounds = args.rows // args.devices
+        increments = []
+        for step in range(rounds, rounds + 5):
+            fill(store, args.devices, args.devices, step=step)
+            increments.append(timed(rollup.catch_up))
+        elapsed, covered = sorted(increments)[len(increments) // 2]
+        print(f'{"increment":12} {elapsed * 1000:10.1f} ms  {covered} readings, median of 5')
+
+        rescan = ('SELECT mac_address, unixepoch(created_at) / 60 * 60, count(*), '
+                  'min(temperature), max(temperature), avg(temperature) '
+                  'FROM readings GROUP BY 1, 2')
+        elapsed, _ = timed(lambda: store.db.execute(rescan).fetchall())
+        print(f'{"rescan":12} {elapsed * 1000:10.1f} ms  full GROUP BY per run without a watermark')
+
+        print()
+        queries = [
+            ('readings', 'SELECT * FROM readings ORDER BY created_at DESC'),
+            ('1h rollup', 'SELECT * FROM readings_1h ORDER BY bucket'),
+            ('1d rollup', 'SELECT * FROM readings_1d ORDER BY bucket'),
+        ]
+        for name, query in queries:
+            elapsed, rows = timed(lambda: store.db.execute(query).fetchall())
+            print(f'{name:12} {elapsed * 1000:10.1f} ms  {len(rows)} rows')
+        print()
+        check(store)
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,16 @@
+"""Host-side services between the NanoC6 fleet and the database
+
+store    SQLite stand-in for the Supabase devices and readings tables
+gateway  asyncio ingestion gateway that batches readings into bulk inserts
+rollup   1-minute, 1-hour and 1-day aggregates kept up to date incrementally
+query    gap-split, LTTB-downsampled series for the charts
+archive  compressed columnar archive of old readings, read with memory mapping
+
+query and archive need NumPy (pip install -r services/requirements.txt),
+so they aren't imported here.
+"""
+from .gateway import Gateway, RequestError
+from .rollup import Rollup
+from .store import ReadingStore
+
+__all__ = ['Gateway', 'ReadingStore', 'RequestError', 'Rollup']
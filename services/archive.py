@@ -0,0 +1,384 @@
+"""Compressed columnar archive of historical readings
+
+An archive file holds per-device blocks of up to block_rows readings:
+created_at and the three metrics, each stored as its own column. A block
+index at the end of the file lists each block's device, time range, row
+count and position, so a range scan only touches the blocks it needs.
+
+  file     MAGIC, blocks, index entries, trailer
+  block    time column, then one column per metric
+  time     unit, first time, first delta, width, delta-of-delta bits
+  metric   kind, first value, shift, width, XOR bits
+  trailer  index offset, entry count, MAGIC
+
+Timestamps are milliseconds, or seconds when every time in the block is
+whole seconds. They are stored as delta-of-deltas: a device reporting on
+a fixed interval gives values near zero, which are zigzag coded and
+bit-packed. Values are XORed with the previous one, as in Gorilla.
+Readings are rounded to hundredths, so a block whose values are all
+exact hundredths XORs the zigzagged integer hundredths rather than the
+float64 bits. Consecutive readings then differ only in a few low bits.
+Other values, NULL included as NaN, XOR their float64 bits. Values come
+back exactly; times are kept to the millisecond.
+
+Gorilla gives each value its own control bits and window. Here a block
+shares one window, the bits between the lowest and highest that change
+anywhere in it. That costs a few bits per value, but every value then has
+the same width, and NumPy can unpack and un-XOR a whole column at once.
+The reader memory-maps the file, so decoding reads only the requested
+blocks' bytes.
+
+  python -m services.archive export --db readings.db readings.nc6a
+  python -m services.archive info readings.nc6a
+
+Needs NumPy (services/requirements.txt).
+"""
+import argparse
+import json
+import struct
+import sys
+import urllib.parse
+import urllib.request
+from datetime import datetime
+
+import numpy as np
+
+from .store import METRICS, ReadingStore, parse_timestamp
+
+MAGIC = b'NC6ARCH1'
+TIME_HEAD = struct.Struct('<HqqB')  # unit ms, first time, first delta, width
+METRIC_HEAD = struct.Struct('<BQBB')  # kind, first value bits, shift, width
+INDEX_ENTRY = struct.Struct('<12sqqIQI')  # mac, first ms, last ms, rows, offset, length
+TRAILER = struct.Struct('<QI8s')  # index offset, entries, MAGIC
+
+INDEX_DTYPE = np.dtype([('mac_address', 'S12'), ('t_first', '<i8'), ('t_last', '<i8'),
+                        ('rows', '<u4'), ('offset', '<u8'), ('length', '<u4')])
+
+FLOAT64 = 0
+HUNDREDTHS = 1
+
+# created_at as integer Unix milliseconds
+EPOCH_MS = 'CAST(round((julianday(created_at) - 2440587.5) * 86400000.0) AS INTEGER)'
+
+
+def _zigzag(values):
+    values = values.astype(np.int64)
+    return ((values << 1) ^ (values >> 63)).view(np.uint64)
+
+
+def _unzigzag(values):
+    values = values.view(np.uint64)
+    return ((values >> np.uint64(1)) ^ (np.uint64(0) - (values & np.uint64(1)))).view(np.int64)
+
+
+def _width(values):
+    return int(values.max()).bit_length() if len(values) else 0
+
+
+def _pack(values, width):
+    """uint64 values as `width` bits each, most significant first, in bytes"""
+    if not width or not len(values):
+        return b''
+    shifts = np.arange(width - 1, -1, -1, dtype=np.uint64)
+    bits = ((values[:, None] >> shifts) & np.uint64(1)).astype(np.uint8)
+    return np.packbits(bits).tobytes()
+
+
+def _unpack(data, count, width):
+    """Inverse of _pack, from a uint8 array"""
+    if not width or not count:
+        return np.zeros(count, dtype=np.uint64)
+    bits = np.unpackbits(data, count=count * width).reshape(count, width).astype(np.uint64)
+    shifts = np.arange(width - 1, -1, -1, dtype=np.uint64)
+    return np.bitwise_or.reduce(bits << shifts, axis=1)
+
+
+def _packed_size(count, width):
+    return (count * width + 7) // 8
+
+
+def encode_times(t):
+    """Delta-of-delta time column of int64 milliseconds"""
+    unit = 1000 if not np.any(t % 1000) else 1
+    t = t // unit
+    delta = np.diff(t)
+    dod = _zigzag(np.diff(delta))
+    width = _width(dod)
+    head = TIME_HEAD.pack(unit, int(t[0]), int(delta[0]) if len(delta) else 0, width)
+    return head + _pack(dod, width)
+
+
+def decode_times(data, pos, count):
+    """(int64 milliseconds, position after the column)"""
+    unit, first, first_delta, width = TIME_HEAD.unpack_from(data, pos)
+    pos += TIME_HEAD.size
+    size = _packed_size(max(count - 2, 0), width)
+    dod = _unzigzag(_unpack(data[pos:pos + size], max(count - 2, 0), width))
+    delta = np.concatenate(([first_delta], first_delta + np.cumsum(dod)))[:count - 1]
+    t = first + np.concatenate(([0], np.cumsum(delta)))
+    return t.astype(np.int64) * unit, pos + size
+
+
+def encode_values(values):
+    """XOR value column of float64, NaN for NULL"""
+    scaled = np.rint(values * 100)
+    if (np.all(np.isfinite(values)) and np.all(scaled / 100 == values)
+            and np.abs(scaled).max() < 2 ** 52):
+        kind = HUNDREDTHS
+        bits = _zigzag(scaled.astype(np.int64))
+    else:
+        kind = FLOAT64
+        bits = values.astype(np.float64).view(np.uint64)
+    xor = bits[1:] ^ bits[:-1]
+    changed = xor[xor != 0]
+    # The lowest bit that changes anywhere; the bits under it are always zero
+    shift = int((changed & (~changed + np.uint64(1))).min()).bit_length() - 1 if len(changed) else 0
+    xor >>= np.uint64(shift)
+    width = _width(xor)
+    return METRIC_HEAD.pack(kind, int(bits[0]), shift, width) + _pack(xor, width)
+
+
+def decode_values(data, pos, count):
+    """(float64 values, position after the column)"""
+    kind, first, shift, width = METRIC_HEAD.unpack_from(data, pos)
+    pos += METRIC_HEAD.size
+    size = _packed_size(count - 1, width)
+    xor = _unpack(data[pos:pos + size], count - 1, width) << np.uint64(shift)
+    bits = np.bitwise_xor.accumulate(np.concatenate((np.array([first], np.uint64), xor)))
+    if kind == HUNDREDTHS:
+        values = _unzigzag(bits) / 100
+    else:
+        values = bits.view(np.float64)
+    return values, pos + size
+
+
+def encode_block(t, values):
+    """One block from (n,) int64 ms times and (metrics, n) float64 values"""
+    return encode_times(t) + b''.join(encode_values(column) for column in values)
+
+
+def decode_block(data, count):
+    """(t, values) of one block from a uint8 array"""
+    t, pos = decode_times(data, 0, count)
+    values = np.empty((len(METRICS), count))
+    for i in range(len(METRICS)):
+        values[i], pos = decode_values(data, pos, count)
+    return t, values
+
+
+class ArchiveWriter:
+    """Collects time-ordered readings per device and writes full blocks"""
+
+    def __init__(self, path, block_rows=4096):
+        self.block_rows = block_rows
+        self.rows = 0
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+        self._buffers = {}  # mac -> ([ms], [temperature], [humidity], [pressure])
+        self._index = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, mac_address, t_ms, temperature, humidity, pressure):
+        buffer = self._buffers.get(mac_address)
+        if buffer is None:
+            buffer = self._buffers[mac_address] = ([], [], [], [])
+        buffer[0].append(t_ms)
+        buffer[1].append(temperature)
+        buffer[2].append(humidity)
+        buffer[3].append(pressure)
+        if len(buffer[0]) >= self.block_rows:
+            self._flush(mac_address)
+
+    def _flush(self, mac_address):
+        columns = self._buffers.pop(mac_address)
+        t = np.array(columns[0], dtype=np.int64)
+        values = np.array(columns[1:], dtype=np.float64)  # None becomes NaN
+        order = np.argsort(t, kind='stable')
+        t, values = t[order], values[:, order]
+        block = encode_block(t, values)
+        offset = self._file.tell()
+        self._file.write(block)
+        self._index.append(INDEX_ENTRY.pack(mac_address.encode('ascii'), int(t[0]), int(t[-1]),
+                                            len(t), offset, len(block)))
+        self.rows += len(t)
+
+    def close(self):
+        if self._file.closed:
+            return
+        for mac_address in list(self._buffers):
+            self._flush(mac_address)
+        offset = self._file.tell()
+        self._file.write(b''.join(self._index))
+        self._file.write(TRAILER.pack(offset, len(self._index), MAGIC))
+        self._file.close()
+
+
+class ArchiveReader:
+    """Memory-mapped archive decoded into NumPy arrays"""
+
+    def __init__(self, path):
+        self._map = np.memmap(path, dtype=np.uint8, mode='r')
+        self.size = len(self._map)
+        if bytes(self._map[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f'{path} is not a readings archive')
+        offset, count, magic = TRAILER.unpack_from(self._map, len(self._map) - TRAILER.size)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is truncated')
+        self.index = np.frombuffer(self._map, dtype=INDEX_DTYPE, count=count, offset=offset)
+
+    @property
+    def rows(self):
+        return int(self.index['rows'].sum())
+
+    def devices(self):
+        return sorted(mac.decode('ascii') for mac in np.unique(self.index['mac_address']))
+
+    def blocks(self, mac_address=None, start=None, end=None):
+        """Index entries of the blocks overlapping [start, end) Unix ms, in time order"""
+        selected = np.ones(len(self.index), dtype=bool)
+        if mac_address is not None:
+            selected &= self.index['mac_address'] == mac_address.encode('ascii')
+        if start is not None:
+            selected &= self.index['t_last'] >= start
+        if end is not None:
+            selected &= self.index['t_first'] < end
+        entries = self.index[selected]
+        return entries[np.argsort(entries['t_first'], kind='stable')]
+
+    def read(self, mac_address, start=None, end=None):
+        """One device's readings over [start, end) Unix ms
+
+        Returns a dict of 't' (datetime64[ms]) and one float64 array per
+        metric, NaN where the reading was NULL.
+        """
+        parts = [decode_block(self._map[entry['offset']:entry['offset'] + entry['length']],
+                              int(entry['rows']))
+                 for entry in self.blocks(mac_address, start, end)]
+        if parts:
+            t = np.concatenate([part[0] for part in parts])
+            values = np.concatenate([part[1] for part in parts], axis=1)
+        else:
+            t, values = np.empty(0, np.int64), np.empty((len(METRICS), 0))
+        order = np.argsort(t, kind='stable')
+        t, values = t[order], values[:, order]
+        low = np.searchsorted(t, start) if start is not None else 0
+        high = np.searchsorted(t, end) if end is not None else len(t)
+        result = {'t': t[low:high].astype('datetime64[ms]')}
+        for name, column in zip(METRICS, values[:, low:high]):
+            result[name] = column
+        return result
+
+    def scan(self, start=None, end=None):
+        """(mac_address, read() result) for every device with readings in range"""
+        for mac_address in self.devices():
+            series = self.read(mac_address, start, end)
+            if len(series['t']):
+                yield mac_address, series
+
+
+def store_pages(store, page_rows=10000, since=None):
+    """Pages of (mac, ms, temperature, humidity, pressure) in time order
+
+    Keyset paging on (created_at, id), so each page is one index range
+    read however deep into the table it is.
+    """
+    last = (parse_timestamp(since) if since else '', 0)
+    query = (f'SELECT created_at, id, mac_address, {EPOCH_MS}, {", ".join(METRICS)} '
+             f'FROM readings WHERE (created_at, id) > (?, ?) '
+             f'ORDER BY created_at, id LIMIT ?')
+    while True:
+        with store.lock:
+            rows = store.db.execute(query, last + (page_rows,)).fetchall()
+        if not rows:
+            return
+        last = (rows[-1][0], rows[-1][1])
+        yield [row[2:] for row in rows]
+
+
+def rest_pages(url, api_key, page_rows=1000, since=None):
+    """The same pages from a PostgREST readings endpoint, e.g. Supabase's
+
+    Pages on created_at=gte.<last> in created_at, id order, dropping the
+    rows of the last timestamp that the previous page already returned.
+    """
+    headers = {'apikey': api_key, 'Authorization': f'Bearer {api_key}'}
+    columns = ','.join(('id', 'mac_address', 'created_at') + METRICS)
+    last = since
+    seen = set()
+    while True:
+        params = {'select': columns, 'order': 'created_at.asc,id.asc', 'limit': page_rows}
+        if last:
+            params['created_at'] = f'gte.{last}'
+        request = urllib.request.Request(f'{url}/readings?{urllib.parse.urlencode(params)}',
+                                         headers=headers)
+        with urllib.request.urlopen(request) as response:
+            rows = json.load(response)
+        fresh = [row for row in rows if row['id'] not in seen]
+        if not fresh:
+            if len(rows) == page_rows:
+                raise RuntimeError(f'over {page_rows} readings at {last}; use larger pages')
+            return
+        last = fresh[-1]['created_at']
+        seen = {row['id'] for row in rows if row['created_at'] == last}
+        yield [(row['mac_address'], _epoch_ms(row['created_at']))
+               + tuple(row[name] for name in METRICS) for row in fresh]
+
+
+def _epoch_ms(text):
+    return round(datetime.fromisoformat(parse_timestamp(text)).timestamp() * 1000)
+
+
+def export(pages, path, block_rows=4096):
+    """Write every row from `pages` to an archive; returns the row count"""
+    with ArchiveWriter(path, block_rows) as writer:
+        for page in pages:
+            for row in page:
+                writer.add(*row)
+    return writer.rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Columnar archive of NanoC6 readings')
+    commands = parser.add_subparsers(dest='command', required=True)
+    exporting = commands.add_parser('export', help='write readings to an archive')
+    exporting.add_argument('archive')
+    source = exporting.add_mutually_exclusive_group(required=True)
+    source.add_argument('--db', help='SQLite file holding readings')
+    source.add_argument('--url',
+                        help='PostgREST base URL, e.g. https://<project>.supabase.co/rest/v1')
+    exporting.add_argument('--api-key', help='API key for --url')
+    exporting.add_argument('--since', help='only readings at or after this ISO 8601 time')
+    exporting.add_argument('--block-rows', type=int, default=4096)
+    info = commands.add_parser('info', help='summarise an archive')
+    info.add_argument('archive')
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        if args.db:
+            store = ReadingStore(args.db)
+            rows = export(store_pages(store, since=args.since), args.archive, args.block_rows)
+            store.close()
+        else:
+            if not args.api_key:
+                sys.exit('--url needs --api-key')
+            rows = export(rest_pages(args.url, args.api_key, since=args.since), args.archive,
+                          args.block_rows)
+        print(f'Archived {rows} readings to {args.archive}')
+    else:
+        reader = ArchiveReader(args.archive)
+        index = reader.index
+        print(f'{reader.rows} readings from {len(reader.devices())} devices in {len(index)} blocks')
+        if len(index):
+            first = np.datetime64(int(index['t_first'].min()), 'ms')
+            last = np.datetime64(int(index['t_last'].max()), 'ms')
+            print(f'{first} to {last}, {reader.size} bytes, '
+                  f'{reader.size / reader.rows:.1f} bytes per reading')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,389 @@
+"""Asyncio ingestion gateway for /rest/v1/readings
+
+Accepts the same POSTs the firmware sends Supabase: one URL-encoded
+reading from take_readings, or a JSON object or array from flush_readings.
+Rows are validated, queued on a shard picked from the device's MAC and
+written in large multi-row transactions, so the database sees one commit
+per batch instead of one per device request.
+
+Each shard holds at most max_pending rows, queued or being written. A
+request that doesn't fit is answered 503 with Retry-After, which the
+firmware already treats as a reason to back off, so memory stays bounded
+however far the database falls behind. With ack='commit' a request is
+answered once its batch is committed; with ack='queue' as soon as it is
+queued, and batches the database failed to take are retried while the
+queue applies backpressure. A batch the database refuses because of its
+rows is written again one request at a time, so a bad request is dropped
+on its own instead of holding up its shard. Prefer:
+return=representation always waits for the commit, as the rows' ids come
+from the database.
+
+  python -m services.gateway --db readings.db --port 8000
+"""
+import argparse
+import asyncio
+import functools
+import json
+import math
+import re
+import sqlite3
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlsplit
+
+from .http import RequestError, serve_connection
+from .store import READING_COLUMNS, READING_NAMES, ReadingStore, iso_timestamp, parse_timestamp
+
+READINGS_PATH = '/rest/v1/readings'
+STATS_PATH = '/gateway/stats'
+
+MAC_ADDRESS = re.compile(r'[0-9A-F]{12}')
+REQUIRED = ('mac_address', 'temperature', 'humidity', 'pressure')
+
+# SQLite stores integers as 64-bit; larger ones fail the whole insert
+INTEGER_MAX = (1 << 63) - 1
+
+# What the ENV unit can report; anything outside is a bad read or a bad client
+RANGES = {
+    'temperature': (-40.0, 120.0),
+    'humidity': (0.0, 100.0),
+    'pressure': (300.0, 1100.0),
+}
+
+
+def _real(name, value):
+    if isinstance(value, bool):
+        raise ValueError
+    value = float(value)
+    if not math.isfinite(value):
+        raise ValueError
+    metric = name.split('_', 1)[0]
+    if metric in RANGES and not name.endswith('_std'):
+        low, high = RANGES[metric]
+        if not low <= value <= high:
+            raise ValueError
+    elif value < 0:
+        raise ValueError
+    return value
+
+
+def _integer(name, value):
+    if isinstance(value, bool):
+        raise ValueError
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ValueError
+        value = int(value)
+    value = int(value)
+    if value < 0 or value > INTEGER_MAX or (name == 'sample_count' and value < 1):
+        raise ValueError
+    return value
+
+
+def _text(name, value):
+    if not isinstance(value, str) or len(value) > 64:
+        raise ValueError
+    if name == 'mac_address' and not MAC_ADDRESS.fullmatch(value):
+        raise ValueError
+    return value
+
+
+def _timestamp(name, value):
+    if not isinstance(value, str):
+        raise ValueError
+    return parse_timestamp(value)
+
+
+CONVERTERS = {'REAL': _real, 'INTEGER': _integer, 'TEXT': _text}
+COLUMNS = {name: (index, _timestamp if name == 'created_at' else CONVERTERS[kind])
+           for index, (name, kind) in enumerate(READING_COLUMNS)}
+CREATED_AT = READING_NAMES.index('created_at')
+
+
+def validate(row, received_at):
+    """A reading as a tuple in READING_NAMES order; raises RequestError
+
+    Missing optional columns are NULL and a missing created_at is the
+    time the request arrived, as if the database had defaulted it.
+    """
+    if not isinstance(row, dict):
+        raise RequestError(400, 'expected an object or array of objects')
+    values = [None] * len(READING_NAMES)
+    for name, value in row.items():
+        column = COLUMNS.get(name)
+        if column is None:
+            raise RequestError(400, f"Could not find the '{name}' column of 'readings'")
+        if value is None:
+            continue
+        index, convert = column
+        try:
+            values[index] = convert(name, value)
+        except (TypeError, ValueError, OverflowError):
+            raise RequestError(400, f'invalid value for {name}: {value!r}') from None
+    for name in REQUIRED:
+        if values[COLUMNS[name][0]] is None:
+            raise RequestError(400, f'{name} is required')
+    if values[CREATED_AT] is None:
+        values[CREATED_AT] = received_at
+    return tuple(values)
+
+
+def parse_rows(body, content_type):
+    """Row dicts from a form or JSON request body"""
+    if content_type.startswith('application/json'):
+        try:
+            payload = json.loads(body or b'null')
+        except ValueError as e:
+            raise RequestError(400, f'invalid JSON: {e}') from None
+        rows = payload if isinstance(payload, list) else [payload]
+    else:
+        try:
+            rows = [dict(parse_qsl(body.decode('utf-8'), keep_blank_values=True,
+                                   strict_parsing=True))]
+        except (UnicodeDecodeError, ValueError):
+            raise RequestError(400, 'invalid form body') from None
+    if not rows:
+        raise RequestError(400, 'expected an object or array of objects')
+    return rows
+
+
+class _Shard:
+    """Requests waiting for one flusher, oldest first"""
+
+    def __init__(self):
+        self.requests = []  # (rows, future or None)
+        self.queued = 0  # Rows in self.requests
+        self.pending = 0  # Rows queued or being written
+        self.ready = asyncio.Event()  # Something is queued
+        self.full = asyncio.Event()  # A whole batch is queued
+
+
+class Gateway:
+    """Validates readings and writes them to a ReadingStore in batches"""
+
+    def __init__(self, store, shards=4, batch_rows=500, flush_ms=50, max_pending=5000,
+                 ack='commit', max_body=1 << 20, max_rows=1000, api_keys=None,
+                 retry_after=5):
+        if ack not in ('commit', 'queue'):
+            raise ValueError(f'ack must be commit or queue, not {ack!r}')
+        self.store = store
+        self.batch_rows = batch_rows
+        self.flush_s = flush_ms / 1000
+        self.max_pending = max_pending
+        self.ack = ack
+        self.max_body = max_body
+        self.max_rows = max_rows
+        self.api_keys = set(api_keys) if api_keys else None
+        self.retry_after = retry_after
+        self.counts = {'requests': 0, 'rows': 0, 'rejected': 0, 'throttled': 0,
+                       'batches': 0, 'failed_batches': 0, 'dropped_rows': 0}
+        self.write_seconds = 0.0
+        self._shards = [_Shard() for _ in range(shards)]
+        # SQLite takes one writer at a time, so one thread does all the writing
+        self._writer = ThreadPoolExecutor(1, thread_name_prefix='gateway-writer')
+        self._tasks = []
+        self._server = None
+        self._closing = False
+
+    @property
+    def address(self):
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def start(self, host='127.0.0.1', port=0):
+        self._tasks = [asyncio.create_task(self._flush_loop(shard)) for shard in self._shards]
+        self._server = await asyncio.start_server(
+            functools.partial(serve_connection, handle=self.handle, max_body=self.max_body),
+            host, port)
+        return self
+
+    async def close(self):
+        """Stop accepting requests and write out everything queued"""
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+        self._closing = True
+        for shard in self._shards:
+            shard.ready.set()
+            shard.full.set()
+        await asyncio.gather(*self._tasks)
+        self._writer.shutdown()
+
+    def stats(self):
+        batches = self.counts['batches']
+        return dict(self.counts,
+                    pending=sum(shard.pending for shard in self._shards),
+                    mean_batch=round(self.counts['rows'] / batches, 1) if batches else 0,
+                    write_ms=round(self.write_seconds * 1000, 1))
+
+    def submit(self, rows, wait=None):
+        """Queue validated rows on their device's shard
+
+        Returns a future for the id of the first row once written, or None
+        when not waiting. Raises RequestError(503) if the shard is full.
+        """
+        shard = self._shards[zlib.crc32(rows[0][0].encode()) % len(self._shards)]
+        if self._closing or shard.pending + len(rows) > self.max_pending:
+            self.counts['throttled'] += 1
+            raise RequestError(503, 'ingest queue full, retry later')
+        if wait is None:
+            wait = self.ack == 'commit'
+        future = asyncio.get_running_loop().create_future() if wait else None
+        shard.requests.append((rows, future))
+        shard.queued += len(rows)
+        shard.pending += len(rows)
+        shard.ready.set()
+        if shard.queued >= self.batch_rows:
+            shard.full.set()
+        return future
+
+    async def _flush_loop(self, shard):
+        loop = asyncio.get_running_loop()
+        while True:
+            await shard.ready.wait()
+            if not shard.requests:
+                if self._closing:
+                    return
+                shard.ready.clear()
+                continue
+            # Give a partial batch flush_ms to fill up
+            if not shard.full.is_set() and not self._closing:
+                try:
+                    await asyncio.wait_for(shard.full.wait(), self.flush_s)
+                except asyncio.TimeoutError:
+                    pass
+            taken = 0
+            count = 0
+            while taken < len(shard.requests) and count < self.batch_rows:
+                count += len(shard.requests[taken][0])
+                taken += 1
+            batch = shard.requests[:taken]
+            del shard.requests[:taken]
+            shard.queued -= count
+            if shard.queued < self.batch_rows:
+                shard.full.clear()
+            await self._write(loop, batch)
+            shard.pending -= count
+
+    async def _write(self, loop, batch):
+        """Insert one batch of (rows, future) requests and answer the futures
+
+        A batch the database can't take right now is retried for as long as
+        it holds rows that were already acknowledged. One it refuses because
+        of what is in it is split into its requests, each written alone, and
+        a request that still fails is dropped.
+        """
+        while True:
+            rows = [row for request_rows, _ in batch for row in request_rows]
+            started = time.perf_counter()
+            try:
+                first_id = await loop.run_in_executor(self._writer, self.store.insert_readings,
+                                                      rows)
+            except sqlite3.OperationalError as e:
+                self.counts['failed_batches'] += 1
+                print(f'Batch of {len(rows)} rows failed: {e}')
+                # Callers still waiting hear about it and their devices retry
+                for _, future in batch:
+                    if future is not None and not future.done():
+                        future.set_exception(RequestError(503, 'database write failed'))
+                # Rows already acknowledged only live here, so keep them until written
+                batch = [(request_rows, None) for request_rows, future in batch if future is None]
+                if not batch:
+                    return
+                if self._closing:
+                    print(f'Dropped {sum(len(r) for r, _ in batch)} acknowledged rows at shutdown')
+                    return
+                await asyncio.sleep(self.retry_after)
+                continue
+            except Exception as e:
+                # Integer overflow, a constraint: the rows themselves, not the database
+                if len(batch) > 1:
+                    for request in batch:
+                        await self._write(loop, [request])
+                    return
+                (request_rows, future), = batch
+                self.counts['dropped_rows'] += len(request_rows)
+                print(f'Dropped {len(request_rows)} rows the database refused: {e}')
+                if future is not None and not future.done():
+                    future.set_exception(RequestError(400, f'rows refused by the database: {e}'))
+                return
+            self.write_seconds += time.perf_counter() - started
+            self.counts['batches'] += 1
+            self.counts['rows'] += len(rows)
+            for request_rows, future in batch:
+                if future is not None and not future.done():
+                    future.set_result(first_id)
+                first_id += len(request_rows)
+            return
+
+    async def handle(self, method, target, headers, body):
+        """(status, JSON payload or None, extra headers) for one request"""
+        path = urlsplit(target).path.rstrip('/')
+        if path == STATS_PATH and method == 'GET':
+            return 200, self.stats(), ()
+        if path != READINGS_PATH:
+            return 404, {'message': f'{path} is not served by the gateway'}, ()
+        if method != 'POST':
+            return 405, {'message': 'readings can only be inserted here'}, ()
+        self.counts['requests'] += 1
+        try:
+            if self.api_keys is not None and headers.get('apikey') not in self.api_keys:
+                raise RequestError(401, 'invalid API key')
+            rows = parse_rows(body, headers.get('content-type', ''))
+            if len(rows) > self.max_rows:
+                raise RequestError(413, f'at most {self.max_rows} rows per request')
+            received_at = iso_timestamp()
+            rows = [validate(row, received_at) for row in rows]
+            representation = 'return=representation' in headers.get('prefer', '')
+            future = self.submit(rows, wait=True if representation else None)
+            first_id = await future if future is not None else None
+        except RequestError as e:
+            if e.status != 503:
+                self.counts['rejected'] += 1
+            extra = (('Retry-After', str(self.retry_after)),) if e.status == 503 else ()
+            return e.status, {'message': str(e)}, extra
+        if representation:
+            return 201, [dict(zip(READING_NAMES, row), id=first_id + i)
+                         for i, row in enumerate(rows)], ()
+        return 201, None, ()
+
+
+async def serve(args):
+    store = ReadingStore(args.db)
+    gateway = Gateway(store, shards=args.shards, batch_rows=args.batch_rows,
+                      flush_ms=args.flush_ms, max_pending=args.max_pending, ack=args.ack,
+                      api_keys=args.api_key)
+    await gateway.start(args.host, args.port)
+    host, port = gateway.address
+    print(f'Gateway on http://{host}:{port}{READINGS_PATH}, writing to {args.db}')
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await gateway.close()
+        store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Batching ingestion gateway for NanoC6 readings')
+    parser.add_argument('--db', default='readings.db', help='SQLite file to write to')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--shards', type=int, default=4)
+    parser.add_argument('--batch-rows', type=int, default=500, help='rows per transaction')
+    parser.add_argument('--flush-ms', type=float, default=50,
+                        help='longest a partial batch waits for more rows')
+    parser.add_argument('--max-pending', type=int, default=5000,
+                        help='rows a shard holds before answering 503')
+    parser.add_argument('--ack', choices=('commit', 'queue'), default='commit',
+                        help='answer once rows are committed, or once they are queued')
+    parser.add_argument('--api-key', action='append',
+                        help='accepted apikey header; repeat for several, omit to accept any')
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Just enough HTTP/1.1 for the host services
+
+The services answer small requests from devices and the dashboard over
+keep-alive connections, so a request is read with Content-Length and
+answered with a JSON body; chunked bodies aren't supported. A handler is
+a coroutine taking (method, target, lower-cased headers, body) and
+returning (status, JSON payload or None, extra headers).
+"""
+import asyncio
+import json
+
+REASONS = {200: 'OK', 201: 'Created', 400: 'Bad Request', 401: 'Unauthorized',
+           404: 'Not Found', 405: 'Method Not Allowed', 409: 'Conflict',
+           413: 'Payload Too Large', 429: 'Too Many Requests',
+           500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+class RequestError(Exception):
+    """A request answered with an error status and message"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+async def read_request(reader, max_body):
+    """(method, target, lower-cased headers, body), or None once the client is done"""
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, target, _ = line.decode('latin-1').split(' ', 2)
+    except ValueError:
+        raise RequestError(400, 'malformed request line') from None
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    if 'chunked' in headers.get('transfer-encoding', ''):
+        raise RequestError(400, 'chunked bodies are not supported')
+    try:
+        length = int(headers.get('content-length', 0))
+    except ValueError:
+        raise RequestError(400, 'invalid Content-Length') from None
+    if length < 0:
+        raise RequestError(400, 'invalid Content-Length')
+    if length > max_body:
+        raise RequestError(413, f'body over {max_body} bytes')
+    body = await reader.readexactly(length) if length else b''
+    return method, target, headers, body
+
+
+def response(status, payload, extra=(), keep_alive=True):
+    """Status line, headers and JSON body as bytes"""
+    body = b'' if payload is None else json.dumps(payload).encode('utf-8')
+    head = [f'HTTP/1.1 {status} {REASONS.get(status, "")}',
+            'Content-Type: application/json',
+            f'Content-Length: {len(body)}']
+    head.extend(f'{name}: {value}' for name, value in extra)
+    if not keep_alive:
+        head.append('Connection: close')
+    return ('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body
+
+
+async def serve_connection(reader, writer, handle, max_body=1 << 20):
+    """Answer requests on one connection with `handle` until the client is done"""
+    try:
+        while True:
+            try:
+                request = await read_request(reader, max_body)
+            except RequestError as e:
+                # The rest of the stream can't be trusted; answer and hang up
+                writer.write(response(e.status, {'message': str(e)}, keep_alive=False))
+                await writer.drain()
+                break
+            if request is None:
+                break
+            method, target, headers, body = request
+            status, payload, extra = await handle(method, target, headers, body)
+            keep_alive = headers.get('connection', '').lower() != 'close'
+            writer.write(response(status, payload, extra, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
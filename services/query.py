@@ -0,0 +1,266 @@
+"""Downsampled readings series for the dashboard charts
+
+GET /series?mac_address=...&start=...&end=...&points=800 answers with
+each device's temperature, humidity and pressure over [start, end),
+already split where readings are more than 30 minutes apart, as the
+dashboard's splitDataByTimeGap does, and downsampled with
+Largest-Triangle-Three-Buckets to about `points` points per metric.
+mac_address may be repeated or left out for every device; start and end
+are ISO 8601 and default to the last 24 hours.
+
+Spans too long to read row by row come from the rollup tables instead:
+the finest of readings_1h and readings_1d with at most max_raw buckets in
+the span, using bucket means. A device answers with at most `points`
+points per metric plus one per gap, however much history there is.
+
+  python -m services.query --db readings.db --port 8001
+
+Needs NumPy (services/requirements.txt).
+"""
+import argparse
+import asyncio
+import functools
+import time
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from .http import serve_connection
+from .rollup import RESOLUTIONS, resolution_for
+from .store import METRICS, ReadingStore, iso_timestamp, parse_timestamp
+
+SERIES_PATH = '/series'
+MAX_GAP_S = 30 * 60
+DEFAULT_SPAN_S = 24 * 3600
+
+# created_at as Unix seconds with the fraction; unixepoch() drops it
+EPOCH_SECONDS = '(julianday(created_at) - 2440587.5) * 86400.0'
+
+
+def lttb(x, y, n_out):
+    """Indices of the points Largest-Triangle-Three-Buckets keeps
+
+    x holds n ascending times and y one row of n values per series. The
+    first and last points are always kept, and the rest are split into
+    n_out - 2 buckets. Each bucket keeps the point that makes the largest
+    triangle with the point kept in the previous bucket and the mean of
+    the next bucket. The choice depends on the previous bucket, so buckets
+    are visited in order. Each bucket does all series at once, which makes
+    the cost a few NumPy calls per bucket. Returns an (series, n_out) array.
+    """
+    n = len(x)
+    if n_out >= n:
+        return np.broadcast_to(np.arange(n), (len(y), n))
+    if n_out < 3:
+        keep = np.array([0, n - 1][:n_out] if n_out > 1 else [0])
+        return np.broadcast_to(keep, (len(y), len(keep)))
+    # Bucket b is [edges[b], edges[b + 1]); the last point isn't in any
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.intp)
+    counts = np.diff(edges)
+    mean_x = np.add.reduceat(x[:n - 1], edges[:-1]) / counts
+    mean_y = np.add.reduceat(y[:, :n - 1], edges[:-1], axis=1) / counts
+    # Third vertex for each bucket: the next bucket's mean, or the last point
+    next_x = np.append(mean_x[1:], x[-1])
+    next_y = np.concatenate([mean_y[:, 1:], y[:, -1:]], axis=1)
+
+    series = np.arange(len(y))
+    kept = np.empty((len(y), n_out), dtype=np.intp)
+    kept[:, 0] = 0
+    kept[:, -1] = n - 1
+    previous = np.zeros(len(y), dtype=np.intp)
+    for b in range(n_out - 2):
+        low, high = edges[b], edges[b + 1]
+        ax = x[previous][:, None]
+        ay = y[series, previous][:, None]
+        # Twice the triangle's area; the factor doesn't change the argmax
+        area = np.abs((ax - next_x[b]) * (y[:, low:high] - ay)
+                      - (ax - x[low:high]) * (next_y[:, b:b + 1] - ay))
+        previous = low + area.argmax(axis=1)
+        kept[:, b + 1] = previous
+    return kept
+
+
+def split_gaps(t, max_gap_s):
+    """(start, end) index pairs of the runs of t with no gap over max_gap_s"""
+    breaks = np.flatnonzero(np.diff(t) > max_gap_s) + 1
+    bounds = np.concatenate(([0], breaks, [len(t)]))
+    return list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+
+def downsample(t, values, points, max_gap_s=MAX_GAP_S):
+    """Segments of each metric, split at gaps and reduced with LTTB
+
+    t is (n,) Unix seconds, values (metrics, n). points is shared out over
+    the segments by length, each keeping at least one point. Returns a
+    list per metric of {'t': [epoch ms], 'v': [values]} segments, with
+    None where a value is NaN, which is how load() reads NULL.
+    """
+    segments = split_gaps(t, max_gap_s)
+    total = len(t)
+    result = [[] for _ in values]
+    for start, end in segments:
+        share = max(1, points * (end - start) // total) if total else 0
+        kept = lttb(t[start:end], values[:, start:end], share) + start
+        for metric, indices in enumerate(kept):
+            v = np.round(values[metric, indices], 2)
+            nulls = np.isnan(v)
+            if nulls.any():
+                # JSON has no NaN; json.dumps would write one the browser can't parse
+                v = np.where(nulls, None, v)
+            result[metric].append({
+                't': np.rint(t[indices] * 1000).astype(np.int64).tolist(),
+                'v': v.tolist(),
+            })
+    return result
+
+
+def _epoch(text):
+    return datetime.fromisoformat(parse_timestamp(text)).timestamp()
+
+
+class SeriesQuery:
+    """Answers series queries from a ReadingStore and its rollup tables"""
+
+    def __init__(self, store, max_raw=20000, max_gap_s=MAX_GAP_S, max_points=5000):
+        self.store = store
+        self.max_raw = max_raw
+        self.max_gap_s = max_gap_s
+        self.max_points = max_points
+        self._server = None
+
+    @property
+    def address(self):
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def start(self, host='127.0.0.1', port=0):
+        self._server = await asyncio.start_server(
+            functools.partial(serve_connection, handle=self.handle), host, port)
+        return self
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def _has_table(self, name):
+        with self.store.lock:
+            return self.store.db.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                (name,)).fetchone() is not None
+
+    def source(self, start, end):
+        """'raw' or the rollup resolution that [start, end) is read from"""
+        resolution = resolution_for(end - start, self.max_raw)
+        if resolution != '1m' and self._has_table(f'readings_{resolution}'):
+            return resolution
+        return 'raw'
+
+    def devices(self, source='raw'):
+        """Every mac_address in the table, one index probe per device"""
+        table = 'readings' if source == 'raw' else f'readings_{source}'
+        macs = []
+        last = ''
+        with self.store.lock:
+            while True:
+                row = self.store.db.execute(
+                    f'SELECT min(mac_address) FROM {table} WHERE mac_address > ?',
+                    (last,)).fetchone()
+                if row[0] is None:
+                    return macs
+                last = row[0]
+                macs.append(last)
+
+    def load(self, mac_address, start, end, source='raw'):
+        """(t, values) arrays of one device over [start, end) Unix seconds"""
+        if source == 'raw':
+            query = (f'SELECT {EPOCH_SECONDS}, {", ".join(METRICS)} FROM readings '
+                     f'WHERE mac_address = ? AND created_at >= ? AND created_at < ? '
+                     f'ORDER BY created_at')
+            params = (mac_address, iso_timestamp(datetime.fromtimestamp(start, timezone.utc)),
+                      iso_timestamp(datetime.fromtimestamp(end, timezone.utc)))
+        else:
+            query = (f'SELECT bucket, {", ".join(f"{m}_mean" for m in METRICS)} '
+                     f'FROM readings_{source} WHERE mac_address = ? AND bucket >= ? AND bucket < ? '
+                     f'ORDER BY bucket')
+            params = (mac_address, int(start) // RESOLUTIONS[source] * RESOLUTIONS[source], end)
+        with self.store.lock:
+            rows = self.store.db.execute(query, params).fetchall()
+        table = np.array(rows, dtype=np.float64).reshape(-1, len(METRICS) + 1)
+        return table[:, 0], table[:, 1:].T
+
+    def series(self, mac_addresses, start, end, points):
+        """The response body for one query"""
+        source = self.source(start, end)
+        # Buckets of a rollup are spaced by their size, which mustn't read as a gap
+        max_gap_s = self.max_gap_s if source == 'raw' else max(self.max_gap_s,
+                                                                2 * RESOLUTIONS[source])
+        devices = {}
+        for mac_address in mac_addresses or self.devices(source):
+            t, values = self.load(mac_address, start, end, source)
+            if not len(t):
+                continue
+            segments = downsample(t, values, points, max_gap_s)
+            devices[mac_address] = {'rows': len(t), **dict(zip(METRICS, segments))}
+        return {
+            'start': iso_timestamp(datetime.fromtimestamp(start, timezone.utc)),
+            'end': iso_timestamp(datetime.fromtimestamp(end, timezone.utc)),
+            'points': points,
+            'source': source,
+            'devices': devices,
+        }
+
+    async def handle(self, method, target, headers, body):
+        parts = urlsplit(target)
+        if parts.path.rstrip('/') != SERIES_PATH:
+            return 404, {'message': f'{parts.path} not found'}, ()
+        if method != 'GET':
+            return 405, {'message': 'series are read with GET'}, ()
+        query = parse_qs(parts.query)
+        try:
+            end = _epoch(query['end'][0]) if 'end' in query else time.time()
+            start = _epoch(query['start'][0]) if 'start' in query else end - DEFAULT_SPAN_S
+            points = int(query.get('points', ['800'])[0])
+            # series() turns both back into datetimes, which can't hold every float
+            datetime.fromtimestamp(start, timezone.utc)
+            datetime.fromtimestamp(end, timezone.utc)
+        except (ValueError, OverflowError, OSError) as e:
+            return 400, {'message': f'invalid query: {e}'}, ()
+        if not start < end:
+            return 400, {'message': 'start must be before end'}, ()
+        if not 2 <= points <= self.max_points:
+            return 400, {'message': f'points must be between 2 and {self.max_points}'}, ()
+        macs = [mac for value in query.get('mac_address', []) for mac in value.split(',') if mac]
+        loop = asyncio.get_running_loop()
+        payload = await loop.run_in_executor(None, self.series, macs, start, end, points)
+        return 200, payload, ()
+
+
+async def serve(args):
+    store = ReadingStore(args.db)
+    query = await SeriesQuery(store, max_raw=args.max_raw).start(args.host, args.port)
+    host, port = query.address
+    print(f'Series on http://{host}:{port}{SERIES_PATH}, reading {args.db}')
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await query.close()
+        store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Downsampled readings series for the dashboard')
+    parser.add_argument('--db', default='readings.db', help='SQLite file holding readings')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--max-raw', type=int, default=20000,
+                        help='longest span, in minutes, read from raw rows')
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
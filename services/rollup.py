@@ -0,0 +1,235 @@
+"""Incremental 1-minute, 1-hour and 1-day rollups of the readings table
+
+Each resolution has a table, readings_1m, readings_1h and readings_1d,
+with one row per mac_address and bucket: the bucket's start in Unix
+seconds (UTC), count, and min, max, sum, count and mean of each metric. A
+watermark holds the highest readings id already rolled up, so each run
+reads only the rows inserted since the last one, by primary key, however
+long the history is. The new rows are grouped once into minute partials,
+and those are merged into all three tables. min, max, sum and count
+combine, so readings that arrive late, e.g. a device flushing a day of
+buffered rows, land in their old buckets correctly.
+
+Rows reporting a sample window fold their _min and _max into the bucket's
+extremes, so short spikes survive the rollup. Each mean is over the rows
+that reported its metric, so a NULL doesn't pull it towards zero. A row
+whose created_at is NULL or unreadable has no bucket: it is counted in
+the watermark's skipped total and reported, not rolled up.
+
+The watermark works because SQLite ids are handed out under the write
+lock, so a row with a lower id can't commit after a higher one.
+
+  python -m services.rollup --db readings.db --interval 60
+"""
+import argparse
+import asyncio
+import time
+
+from .store import METRICS, ReadingStore
+
+RESOLUTIONS = {'1m': 60, '1h': 3600, '1d': 86400}
+
+AGGREGATES = tuple(f'{metric}_{stat}' for metric in METRICS for stat in ('min', 'max', 'sum'))
+
+# Rows with a non-NULL value of each metric, which its mean divides by
+COUNTS = tuple(f'{metric}_count' for metric in METRICS)
+
+
+def _table_schema(resolution):
+    means = tuple(f'{metric}_mean' for metric in METRICS)
+    columns = ', '.join([f'{name} REAL' for name in AGGREGATES + means]
+                        + [f'{name} INTEGER NOT NULL' for name in COUNTS])
+    return (f'CREATE TABLE IF NOT EXISTS readings_{resolution} ('
+            f'mac_address TEXT NOT NULL, bucket INTEGER NOT NULL, count INTEGER NOT NULL, '
+            f'{columns}, PRIMARY KEY (mac_address, bucket)) WITHOUT ROWID;\n'
+            f'CREATE INDEX IF NOT EXISTS readings_{resolution}_time '
+            f'ON readings_{resolution} (bucket);\n')
+
+
+SCHEMA = ''.join(_table_schema(resolution) for resolution in RESOLUTIONS) + """
+CREATE TABLE IF NOT EXISTS rollup_state (
+    name TEXT PRIMARY KEY,
+    last_id INTEGER NOT NULL,
+    skipped INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+# New readings grouped into minute partials; total() is 0.0, not NULL, for no values
+DELTA = f"""
+CREATE TEMP TABLE rollup_delta AS
+SELECT mac_address, bucket, count(*) AS count,
+       {', '.join(f'min(coalesce({m}_min, {m})) AS {m}_min, '
+                  f'max(coalesce({m}_max, {m})) AS {m}_max, '
+                  f'total({m}) AS {m}_sum, count({m}) AS {m}_count' for m in METRICS)}
+FROM (SELECT *, unixepoch(created_at) / 60 * 60 AS bucket FROM readings
+      WHERE id > ? AND id <= ?)
+WHERE bucket IS NOT NULL
+GROUP BY mac_address, bucket
+"""
+
+# New readings the delta leaves out, as they have no time to bucket them by
+UNBUCKETED = ('SELECT count(*) FROM readings '
+              'WHERE id > ? AND id <= ? AND unixepoch(created_at) IS NULL')
+
+
+def _merge(resolution, seconds):
+    """Upsert the delta, regrouped to `seconds` buckets, into one table
+
+    A mean over no values divides by zero, which SQLite makes NULL. The
+    scalar min() and max() are NULL if either side is, hence the coalesce.
+    """
+    means = ', '.join(f'{m}_sum / {m}_count' for m in METRICS)
+    grouped = ', '.join(f'min({m}_min) AS {m}_min, max({m}_max) AS {m}_max, '
+                        f'sum({m}_sum) AS {m}_sum, sum({m}_count) AS {m}_count' for m in METRICS)
+    updates = ', '.join(
+        [f'{m}_min = coalesce(min({m}_min, excluded.{m}_min), {m}_min, excluded.{m}_min), '
+         f'{m}_max = coalesce(max({m}_max, excluded.{m}_max), {m}_max, excluded.{m}_max), '
+         f'{m}_sum = {m}_sum + excluded.{m}_sum, '
+         f'{m}_count = {m}_count + excluded.{m}_count, '
+         f'{m}_mean = ({m}_sum + excluded.{m}_sum) / ({m}_count + excluded.{m}_count)'
+         for m in METRICS])
+    columns = ', '.join(AGGREGATES + COUNTS)
+    return (f'INSERT INTO readings_{resolution} (mac_address, bucket, count, {columns}, '
+            f'{", ".join(f"{m}_mean" for m in METRICS)}) '
+            f'SELECT mac_address, bucket, count, {columns}, {means} FROM ('
+            f'SELECT mac_address, bucket / {seconds} * {seconds} AS bucket, sum(count) AS count, '
+            f'{grouped} FROM rollup_delta GROUP BY 1, 2) WHERE true '
+            f'ON CONFLICT (mac_address, bucket) DO UPDATE SET count = count + excluded.count, '
+            f'{updates}')
+
+
+MERGES = tuple(_merge(resolution, seconds) for resolution, seconds in RESOLUTIONS.items())
+
+
+def resolution_for(span_seconds, max_points):
+    """Finest resolution with at most max_points buckets over a span"""
+    for resolution, seconds in RESOLUTIONS.items():
+        if span_seconds / seconds <= max_points:
+            return resolution
+    return '1d'
+
+
+class Rollup:
+    """Keeps the rollup tables of one ReadingStore up to date"""
+
+    def __init__(self, store, chunk_rows=200000, name='readings'):
+        self.store = store
+        self.chunk_rows = chunk_rows
+        self.name = name
+        with store.lock:
+            store.db.executescript(SCHEMA)
+
+    @property
+    def watermark(self):
+        with self.store.lock:
+            row = self.store.db.execute('SELECT last_id FROM rollup_state WHERE name = ?',
+                                        (self.name,)).fetchone()
+        return row[0] if row else 0
+
+    @property
+    def skipped(self):
+        """Readings passed by the watermark without a bucket, as created_at was unusable"""
+        with self.store.lock:
+            row = self.store.db.execute('SELECT skipped FROM rollup_state WHERE name = ?',
+                                        (self.name,)).fetchone()
+        return row[0] if row else 0
+
+    def run_once(self):
+        """Roll up at most chunk_rows new readings; returns the number of ids covered"""
+        db = self.store.db
+        with self.store.lock:
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                row = db.execute('SELECT last_id FROM rollup_state WHERE name = ?',
+                                 (self.name,)).fetchone()
+                start = row[0] if row else 0
+                newest = db.execute('SELECT max(id) FROM readings').fetchone()[0] or 0
+                end = min(newest, start + self.chunk_rows)
+                if end <= start:
+                    db.execute('ROLLBACK')
+                    return 0
+                db.execute(DELTA, (start, end))
+                for merge in MERGES:
+                    db.execute(merge)
+                db.execute('DROP TABLE temp.rollup_delta')
+                skipped = db.execute(UNBUCKETED, (start, end)).fetchone()[0]
+                db.execute('INSERT INTO rollup_state (name, last_id, skipped) VALUES (?, ?, ?) '
+                           'ON CONFLICT (name) DO UPDATE SET last_id = excluded.last_id, '
+                           'skipped = skipped + excluded.skipped',
+                           (self.name, end, skipped))
+                db.execute('COMMIT')
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+        if skipped:
+            print(f'Skipped {skipped} readings with ids {start + 1}-{end}: '
+                  f'created_at is NULL or not a time')
+        return end - start
+
+    def catch_up(self):
+        """Run until every committed reading is rolled up; returns the ids covered"""
+        total = 0
+        while True:
+            covered = self.run_once()
+            if not covered:
+                return total
+            total += covered
+
+    async def run(self, interval_s=60):
+        """Catch up every interval_s seconds, off the event loop"""
+        loop = asyncio.get_running_loop()
+        while True:
+            started = time.perf_counter()
+            covered = await loop.run_in_executor(None, self.catch_up)
+            if covered:
+                print(f'Rolled up {covered} readings in '
+                      f'{(time.perf_counter() - started) * 1000:.0f} ms')
+            await asyncio.sleep(interval_s)
+
+    def query(self, resolution, mac_address=None, start=None, end=None):
+        """Rollup rows as dicts, oldest first; start and end are Unix seconds"""
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f'resolution must be one of {", ".join(RESOLUTIONS)}')
+        conditions = []
+        params = []
+        if mac_address is not None:
+            conditions.append('mac_address = ?')
+            params.append(mac_address)
+        if start is not None:
+            conditions.append('bucket >= ?')
+            params.append(start)
+        if end is not None:
+            conditions.append('bucket < ?')
+            params.append(end)
+        where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+        columns = ['mac_address', 'bucket', 'count'] + [
+            f'{m}_{stat}' for m in METRICS for stat in ('min', 'max', 'mean')]
+        with self.store.lock:
+            rows = self.store.db.execute(
+                f'SELECT {", ".join(columns)} FROM readings_{resolution} {where} '
+                f'ORDER BY bucket, mac_address', params).fetchall()
+        return [dict(zip(columns, row)) for row in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Keep the readings rollup tables up to date')
+    parser.add_argument('--db', default='readings.db', help='SQLite file holding readings')
+    parser.add_argument('--interval', type=float, default=60, help='seconds between runs')
+    parser.add_argument('--once', action='store_true', help='catch up once and exit')
+    args = parser.parse_args()
+
+    store = ReadingStore(args.db)
+    rollup = Rollup(store)
+    try:
+        if args.once:
+            print(f'Rolled up {rollup.catch_up()} readings')
+        else:
+            asyncio.run(rollup.run(args.interval))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""SQLite storage for the readings and devices tables
+
+Mirrors the Supabase tables the firmware writes to, so the host services
+can run against a local file instead of the hosted database. created_at is
+kept as ISO 8601 text in UTC with microseconds, as PostgREST returns a
+timestamptz, so it sorts in time order as text and SQLite's date
+functions read it directly.
+"""
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+METRICS = ('temperature', 'humidity', 'pressure')
+
+# Extra columns a reading carries when the firmware reports a sample window
+SUMMARY_COLUMNS = ('sample_count',) + tuple(
+    f'{metric}_{stat}' for metric in METRICS for stat in ('min', 'max', 'std'))
+
+# Config.HEAP_STAT_COLUMNS, sent with UPLOAD_HEAP_STATS
+HEAP_COLUMNS = ('heap_free', 'heap_min_free', 'idf_largest', 'loop_alloc_max', 'gc_max_us')
+
+# Every readings column but id, in insert order, with its SQLite type
+READING_COLUMNS = (
+    ('mac_address', 'TEXT'),
+    ('sensor', 'TEXT'),
+    ('temperature', 'REAL'),
+    ('humidity', 'REAL'),
+    ('pressure', 'REAL'),
+    ('created_at', 'TEXT'),
+    ('sample_count', 'INTEGER'),
+) + tuple((name, 'REAL') for name in SUMMARY_COLUMNS[1:]) + tuple(
+    (name, 'INTEGER') for name in HEAP_COLUMNS)
+
+READING_NAMES = tuple(name for name, _ in READING_COLUMNS)
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS devices (
+    id INTEGER PRIMARY KEY,
+    mac_address TEXT NOT NULL UNIQUE,
+    name TEXT,
+    connected_at REAL,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS readings (
+    id INTEGER PRIMARY KEY,
+    {', '.join(f'{name} {kind}' for name, kind in READING_COLUMNS)}
+);
+CREATE INDEX IF NOT EXISTS readings_device_time ON readings (mac_address, created_at);
+CREATE INDEX IF NOT EXISTS readings_time ON readings (created_at);
+"""
+
+
+def iso_timestamp(moment=None):
+    """UTC datetime, now by default, as timestamptz text"""
+    moment = moment or datetime.now(timezone.utc)
+    return moment.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f+00:00')
+
+
+def parse_timestamp(text):
+    """ISO 8601 text, e.g. the firmware's 2025-08-05T12:00:00Z, as timestamptz text
+
+    Times without an offset are taken as UTC. Raises ValueError.
+    """
+    moment = datetime.fromisoformat(text)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return iso_timestamp(moment)
+
+
+class ReadingStore:
+    """One SQLite connection shared by the threads of a host service
+
+    Writes are serialised by a lock, as SQLite allows one writer at a time.
+    The file is opened in WAL mode, so readers in other connections or
+    processes don't block the writer.
+    """
+
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        if path != ':memory:':
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self._insert_readings = (
+            f'INSERT INTO readings ({", ".join(READING_NAMES)}) '
+            f'VALUES ({", ".join("?" * len(READING_NAMES))})')
+
+    def close(self):
+        self.db.close()
+
+    def insert_readings(self, rows):
+        """Insert value tuples in READING_NAMES order as one transaction
+
+        Returns the id of the first row; the rest follow it in order, as
+        rowids are handed out one above the largest while the transaction
+        holds the write lock.
+        """
+        with self.lock:
+            db = self.db
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                db.executemany(self._insert_readings, rows)
+                last = db.execute('SELECT last_insert_rowid()').fetchone()[0]
+                db.execute('COMMIT')
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+        return last - len(rows) + 1
+
+    def count(self, table='readings'):
+        with self.lock:
+            return self.db.execute(f'SELECT count(*) FROM {table}').fetchone()[0]
@@ -0,0 +1,15 @@
+"""Host simulator for the NanoC6 firmware
+
+Runs the scripts in src/ unmodified on CPython by providing the M5,
+hardware, unit, ubluetooth, requests2, network and machine modules they
+import, backed by a scripted world: ENV sensor, virtual BLE central,
+controllable WiFi and a local stand-in for the Supabase REST API.
+sim.fleet runs thousands of devices on one event loop in real time, as a
+load generator for an ingest endpoint.
+"""
+from .clock import Clock, SimulationEnd
+from .device import Device
+from .standin import StandIn
+from .world import SUPABASE_HOST, World
+
+__all__ = ['Clock', 'Device', 'SimulationEnd', 'StandIn', 'SUPABASE_HOST', 'World']
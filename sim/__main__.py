@@ -0,0 +1,109 @@
+"""Run a firmware script against the simulator
+
+Usage: python -m sim src/ble-readings-server-optimized.py --hours 2 --registered
+"""
+import argparse
+import contextlib
+import cProfile
+import io
+import pstats
+import tracemalloc
+
+from . import Device, StandIn, World
+from .standin import add_fault_arguments, faults_from_args
+
+
+def parse_window(value):
+    start, _, end = value.partition(':')
+    return float(start), float(end)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run NanoC6 firmware on the host')
+    parser.add_argument('script', help='firmware script, e.g. src/ble-readings-server-compact.py')
+    parser.add_argument('--hours', type=float, default=1.0, help='device time to simulate')
+    parser.add_argument('--registered', action='store_true',
+                        help='register the device in the stand-in before boot')
+    parser.add_argument('--pair-at', type=float, metavar='SECONDS',
+                        help='hold BtnA and register over BLE at this device time')
+    parser.add_argument('--outage', type=parse_window, action='append', default=[],
+                        metavar='START:END', help='WiFi outage window in seconds since boot')
+    parser.add_argument('--connect-ms', type=float, default=0.0,
+                        help='simulated DNS + TCP + TLS setup per new connection')
+    parser.add_argument('--rtt-ms', type=float, default=0.0,
+                        help='simulated round trip per request')
+    parser.add_argument('--unset-clock', action='store_true',
+                        help='boot with the RTC at its epoch, as after a power cut, until NTP sets it')
+    parser.add_argument('--real-time', action='store_true',
+                        help='sleep for real instead of fast-forwarding')
+    parser.add_argument('--quiet', action='store_true', help="hide the firmware's output")
+    parser.add_argument('--profile', metavar='FILE', help='write cProfile stats to FILE')
+    parser.add_argument('--boot-profile', action='store_true',
+                        help="print nanoc6.boot_profile's import and setup() timings at boot")
+    parser.add_argument('--heap', action='store_true',
+                        help='trace host allocations so gc.mem_alloc() reports them (slow)')
+    add_fault_arguments(parser.add_argument_group('stand-in faults, in device time'))
+    args = parser.parse_args()
+
+    world = World(fast_forward=not args.real_time, epoch=0 if args.unset_clock else None)
+    world.net.connect_ms = args.connect_ms
+    world.net.rtt_ms = args.rtt_ms
+    for start, end in args.outage:
+        world.net.add_outage(start, end)
+
+    with StandIn(clock=world.clock.now, sleep=world.clock.advance,
+                 faults=faults_from_args(args)) as standin:
+        if args.registered:
+            standin.register(world.mac_address)
+        device = Device(args.script, world, standin, boot_profile=args.boot_profile)
+        if args.pair_at is not None:
+            world.clock.on_sleep.append(pairing_script(world, args.pair_at))
+
+        profiler = cProfile.Profile() if args.profile else None
+        output = io.StringIO() if args.quiet else None
+        with contextlib.redirect_stdout(output) if output else contextlib.nullcontext():
+            if args.heap:
+                tracemalloc.start()
+            if profiler:
+                profiler.enable()
+            device.run(args.hours * 3600)
+            if profiler:
+                profiler.disable()
+            tracemalloc.stop()
+
+        if profiler:
+            profiler.dump_stats(args.profile)
+            pstats.Stats(profiler).sort_stats('cumulative').print_stats(15)
+
+        print('--- simulation summary ---')
+        print(f'device time:      {world.clock.now():.0f} s')
+        print(f'wakeups:          {world.clock.sleeps}')
+        print(f'boots:            {device.boots}')
+        failed = sum(1 for *_, status in standin.requests if not 200 <= status < 300)
+        print(f'readings stored:  {standin.count("readings")}')
+        print(f'API requests:     {len(standin.requests)} ({failed} failed)')
+        print(f'LED writes:       {world.led.writes}')
+        print(f'advertisements:   {world.radio.advertise_count}')
+        print(f'BLE notifies:     {len(world.central.notifications)}')
+        print(f'sensor I2C reads: {world.sensor.transactions}')
+
+
+def pairing_script(world, at):
+    """Hold BtnA at a given time, then register from the virtual central"""
+    state = {'step': 0}
+
+    def step():
+        now = world.clock.now()
+        if state['step'] == 0 and now >= at:
+            world.button.hold()
+            state['step'] = 1
+        elif state['step'] == 1 and world.radio.advertising:
+            world.central.connect()
+            world.central.write(b'REGISTER')
+            state['step'] = 2
+
+    return step
+
+
+if __name__ == '__main__':
+    main()
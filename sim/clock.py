@@ -0,0 +1,127 @@
+import time
+import types
+
+TICKS_PERIOD = 1 << 30  # MicroPython ticks wrap at this value
+_TICKS_MAX = TICKS_PERIOD - 1
+_TICKS_HALFPERIOD = TICKS_PERIOD // 2
+
+
+class SimulationEnd(BaseException):
+    """Raised from a sleep once the clock passes its stop time
+
+    A BaseException, so the firmware's `except Exception` handlers don't
+    swallow it.
+    """
+
+
+class Clock:
+    """Device clock for the simulator
+
+    In fast-forward mode, time spent running firmware code is real but every
+    sleep, and any injected latency, is skipped instantly. Hours of device
+    time run in seconds while the CPU cost of each wakeup is still measured.
+    """
+
+    def __init__(self, fast_forward=True, epoch=None):
+        self.fast_forward = fast_forward
+        self.epoch = time.time() if epoch is None else epoch
+        self.stop_at = None  # Seconds since boot at which sleeps raise SimulationEnd
+        self.skipped = 0.0
+        self.sleeps = 0  # Number of times the firmware went to sleep
+        self.slept = 0.0
+        self.last_sleep = 0.0  # Length of the most recent sleep, in seconds
+        self.on_sleep = []  # Callbacks run before each sleep, e.g. scheduled work
+        self.timers = []  # [due, callback] entries that fire during sleeps
+        self._origin = time.perf_counter()
+
+    def now(self):
+        """Seconds since boot"""
+        return time.perf_counter() - self._origin + self.skipped
+
+    def advance(self, seconds):
+        """Let simulated time pass without sleeping for real in fast-forward"""
+        if seconds <= 0:
+            return
+        if self.fast_forward:
+            self.skipped += seconds
+        else:
+            time.sleep(seconds)
+
+    def add_timer(self, seconds, callback):
+        """Run callback once `seconds` from now, within whichever sleep spans it"""
+        timer = [self.now() + max(0.0, seconds), callback]
+        self.timers.append(timer)
+        return timer
+
+    def cancel_timer(self, timer):
+        if timer in self.timers:
+            self.timers.remove(timer)
+
+    def sleep(self, seconds):
+        for callback in self.on_sleep:
+            callback()
+        self.sleeps += 1
+        end = self.now() + max(0.0, seconds)
+        if self.stop_at is not None:
+            end = min(end, self.stop_at)
+        # A timer interrupt runs its callback mid-sleep, as on the device
+        while self.timers:
+            timer = min(self.timers, key=lambda timer: timer[0])
+            if timer[0] > end:
+                break
+            self.timers.remove(timer)
+            self.advance(timer[0] - self.now())
+            timer[1]()
+        if self.stop_at is not None and end >= self.stop_at:
+            self.advance(self.stop_at - self.now())
+            raise SimulationEnd()
+        self.slept += max(0.0, seconds)
+        self.last_sleep = max(0.0, seconds)
+        self.advance(end - self.now())
+
+    def ticks_ms(self):
+        return int(self.now() * 1000) & _TICKS_MAX
+
+    def ticks_us(self):
+        return int(self.now() * 1000000) & _TICKS_MAX
+
+    def time(self):
+        return self.epoch + self.now()
+
+    def module(self):
+        """A MicroPython-flavoured `time` module driven by this clock"""
+        module = types.ModuleType('time')
+        # Host threads (the stand-in, C datetime) look up attributes on the
+        # `time` in sys.modules, so start from the real module
+        module.__dict__.update((k, v) for k, v in vars(time).items() if not k.startswith('__'))
+        clock = self
+
+        def ticks_add(ticks, delta):
+            return (ticks + delta) & _TICKS_MAX
+
+        def ticks_diff(end, start):
+            return ((end - start + _TICKS_HALFPERIOD) & _TICKS_MAX) - _TICKS_HALFPERIOD
+
+        def gmtime(secs=None):
+            return time.gmtime(clock.time() if secs is None else secs)
+
+        def localtime(secs=None):
+            return time.localtime(clock.time() if secs is None else secs)
+
+        module.ticks_ms = self.ticks_ms
+        module.ticks_us = self.ticks_us
+        module.ticks_cpu = self.ticks_us
+        module.ticks_add = ticks_add
+        module.ticks_diff = ticks_diff
+        module.sleep = self.sleep
+        module.sleep_ms = lambda ms: self.sleep(ms / 1000)
+        module.sleep_us = lambda us: self.sleep(us / 1000000)
+        module.time = lambda: int(clock.time())
+        module.time_ns = lambda: int(clock.time() * 1e9)
+        module.gmtime = gmtime
+        module.localtime = localtime
+        module.mktime = time.mktime
+        # Host-side helpers some shared modules fall back to
+        module.monotonic = self.now
+        module.perf_counter = self.now
+        return module
@@ -0,0 +1,150 @@
+import asyncio
+import contextlib
+import functools
+import importlib
+import inspect
+import os
+import sys
+import types
+
+from . import shims
+from .clock import SimulationEnd
+from .world import DeepSleep, DeviceReset, SUPABASE_HOST, World
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+_DEEPSLEEP_RESET = 4
+_SOFT_RESET = 5
+
+
+@functools.lru_cache(maxsize=None)
+def _compile(path, mtime):
+    """Script code, compiled once however many devices run it"""
+    with open(path) as f:
+        return compile(f.read(), path, 'exec')
+
+
+class Device:
+    """One simulated NanoC6 running an unmodified firmware script
+
+    The script sees this device's World through the shim modules, imports
+    the shared nanoc6 package from src/, and keeps its files in the
+    device's own flash directory. With boot_profile, every boot starts
+    nanoc6.boot_profile before the script runs, as the built main.py does.
+    """
+
+    def __init__(self, script, world=None, standin=None, boot_profile=False):
+        self.script = os.path.abspath(script)
+        self.world = world or World()
+        self.boot_profile = boot_profile
+        self.module = None
+        self.boots = 0
+        if standin is not None:
+            self.world.net.hosts[SUPABASE_HOST] = standin.address
+        self._modules = shims.load_modules(self.world)
+
+    @contextlib.contextmanager
+    def active(self):
+        """Make this device's modules and flash visible to firmware code"""
+        saved = {name: sys.modules.get(name) for name in self._modules}
+        cwd = os.getcwd()
+        sys.modules.update(self._modules)
+        sys.path.insert(0, SRC_DIR)
+        os.chdir(self.world.flash_dir)
+        try:
+            yield
+        finally:
+            os.chdir(cwd)
+            sys.path.remove(SRC_DIR)
+            for name, module in saved.items():
+                if module is None:
+                    sys.modules.pop(name, None)
+                else:
+                    sys.modules[name] = module
+            # Shared firmware modules are bound to this device's clock and radio
+            for name in [n for n in sys.modules if n == 'nanoc6' or n.startswith('nanoc6.')]:
+                del sys.modules[name]
+
+    def load(self, as_main=False):
+        """Execute the script, returning its module for direct calls"""
+        code = _compile(self.script, os.path.getmtime(self.script))
+        self.module = types.ModuleType('__main__' if as_main else '__firmware__')
+        self.module.__file__ = self.script
+        self.boots += 1
+        with self.active():
+            if self.boot_profile:
+                importlib.import_module('nanoc6.boot_profile').start()
+            exec(code, self.module.__dict__)
+        return self.module
+
+    def call(self, name, *args):
+        """Call a firmware function with this device's modules in place
+
+        Coroutine functions are run to completion on the device's event
+        loop; tasks they start keep running whenever the loop runs again.
+        """
+        with self.active():
+            result = getattr(self.module, name)(*args)
+            if inspect.iscoroutine(result):
+                result = self.event_loop().run_until_complete(result)
+            return result
+
+    def event_loop(self):
+        """The asyncio event loop firmware on this device runs on"""
+        return self._modules['asyncio'].get_event_loop()
+
+    def advance(self, seconds, until=None):
+        """Run the device's event loop for `seconds` of device time
+
+        With `until`, stop as soon as until() returns true, checking every
+        millisecond of device time. Returns the device seconds that passed.
+        """
+        loop = self.event_loop()
+        clock = self.world.clock
+        start = clock.now()
+
+        async def wait():
+            while clock.now() - start < seconds:
+                if until and until():
+                    return
+                await asyncio.sleep(0.001 if until else seconds - (clock.now() - start))
+
+        with self.active():
+            loop.run_until_complete(wait())
+        return clock.now() - start
+
+    def run(self, seconds):
+        """Boot the script as __main__ and run it for `seconds` of device time
+
+        Deep sleep and machine.reset() reboot the script the way the
+        hardware would, keeping flash, NVS and (for deep sleep) RTC memory.
+        """
+        clock = self.world.clock
+        clock.stop_at = clock.now() + seconds
+        try:
+            while True:
+                try:
+                    self.load(as_main=True)
+                    return  # The script finished on its own
+                except DeepSleep as sleep:
+                    self._reboot(_DEEPSLEEP_RESET, sleep.ms)
+                    clock.advance(min(sleep.ms / 1000, clock.stop_at - clock.now()))
+                    if clock.now() >= clock.stop_at:
+                        return
+                except DeviceReset:
+                    self._reboot(_SOFT_RESET)
+        except SimulationEnd:
+            return
+        finally:
+            clock.stop_at = None
+
+    def _reboot(self, cause, detail=None):
+        world = self.world
+        world.resets.append((world.clock.now(), cause, detail))
+        world.reset_cause = cause
+        if cause != _DEEPSLEEP_RESET:
+            world.rtc_memory = b''
+        world.radio.__init__()
+        world.central.conn_handle = None
+        world.scheduled.clear()
+        self._modules = shims.load_modules(world)
@@ -0,0 +1,419 @@
+"""Load generator: thousands of simulated NanoC6 devices on one event loop
+
+Every device runs ble-readings-server-optimized.py unmodified, in real
+time, with its own MAC address, a clock off from real time by a few
+seconds and its own sensor trace. Its registration checks, registration
+and readings go over real sockets to the ingest endpoint: an in-process
+stand-in by default, or --target, e.g. `python -m sim.standin` or
+`python -m services.gateway` on another core or host, which gives numbers
+about the backend rather than about this process.
+
+Devices boot together, as when power comes back after a site outage,
+or spread over --boot-spread seconds. The report gives achieved
+requests/s, latency percentiles per endpoint, the boot storm against the
+rest of the run, and the request rate over time, where readings
+scheduled from a shared boot show up as bursts every reading interval.
+Registered devices boot with their registration cached, as after a power
+cut; --cold makes them ask first, as on their first boot.
+
+  python -m sim.fleet --devices 2000 --seconds 120
+  python -m sim.fleet --devices 5000 --target http://127.0.0.1:8000 \
+      --config READING_INTERVAL_MS=60000 --json fleet.json
+
+Button and LED polling are idled, as they make no requests and would
+take the generator's CPU time. Loop lag is reported too: when it grows
+to a sizeable part of the latencies, the generator is the bottleneck and
+the fleet should be split over processes.
+"""
+import argparse
+import ast
+import asyncio
+import contextlib
+import gc
+import http.client
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+from .device import SRC_DIR, Device
+from .standin import StandIn, add_fault_arguments, faults_from_args
+from .world import SUPABASE_HOST, World
+
+SCRIPT = os.path.join(SRC_DIR, 'ble-readings-server-optimized.py')
+
+# Firmware tasks that only keep the hardware in step, every few seconds
+IDLE_TASKS = ('led_task',)
+
+# Statuses a sizing run counts as failed; 0 is a request that got no answer
+FAILED = (0, 429, 500, 502, 503, 504)
+
+
+def mac_for(serial):
+    return bytes([0x24, 0x58, 0x7C, (serial >> 16) & 0xFF, (serial >> 8) & 0xFF, serial & 0xFF])
+
+
+def sensor_trace(rng, clock):
+    """ENV readings of one device: its own room, daily swing and noise"""
+    temperature = rng.uniform(17.0, 27.0)
+    humidity = rng.uniform(30.0, 65.0)
+    pressure = rng.uniform(995.0, 1030.0)
+    swing = rng.uniform(0.5, 3.0)
+    phase = rng.uniform(0, 2 * math.pi)
+    noise = random.Random(rng.getrandbits(32)).gauss
+
+    def trace(now):
+        day = math.sin(2 * math.pi * (clock.epoch + now) / 86400 + phase)
+        return (temperature + swing * day + noise(0, 0.05),
+                humidity - 2 * swing * day + noise(0, 0.2),
+                pressure + noise(0, 0.1))
+
+    return trace
+
+
+def endpoint(method, url):
+    """'GET devices' for the firmware's https://.../rest/v1/devices?..."""
+    return f'{method} {url.partition("?")[0].rsplit("/", 1)[-1]}'
+
+
+def parse_config(value):
+    name, _, literal = value.partition('=')
+    try:
+        return name, ast.literal_eval(literal)
+    except (ValueError, SyntaxError):
+        raise argparse.ArgumentTypeError(f'{value!r} is not NAME=<Python literal>') from None
+
+
+async def _idle():
+    await asyncio.Event().wait()
+
+
+def _skip_collect():
+    pass
+
+
+def register_at(url, macs):
+    """POST each device to the target's devices table, as pairing would
+
+    Returns how many the target holds. A target without the table, such as
+    the gateway, answers 404; devices then keep their cached registration.
+    """
+    parts = urlsplit(url)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=10)
+    registered = 0
+    try:
+        for mac_address in macs:
+            body = json.dumps({'mac_address': mac_address, 'name': f'NanoC6-{mac_address[-6:]}'})
+            connection.request('POST', '/rest/v1/devices', body,
+                               {'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            response.read()
+            if response.status == 404:
+                break
+            registered += response.status in (201, 409)  # 409: already there
+    finally:
+        connection.close()
+    return registered
+
+
+class Fleet:
+    """Virtual devices sharing the running asyncio event loop in real time
+
+    Each is a sim.Device on a real-time clock whose network opens asyncio
+    connections (Network.live), so their requests are in flight together.
+    Every request the firmware's HTTP pool sends is logged in `records`
+    as (seconds since start, latency in seconds, endpoint, status).
+    """
+
+    def __init__(self, address, devices, unregistered=0.0, cold=False, skew_s=2.0,
+                 boot_spread_s=0.0, config=(), seed=0, flash_dir=None, script=SCRIPT):
+        self.address = address
+        self.count = devices
+        self.unregistered = int(devices * unregistered)
+        self.cold = cold
+        self.skew_s = skew_s
+        self.boot_spread_s = boot_spread_s
+        self.config = dict(config)
+        self.seed = seed
+        self.flash_dir = flash_dir or tempfile.mkdtemp(prefix='nanoc6-fleet-')
+        self.script = script
+        self.devices = []  # (Device, boot at seconds)
+        self.records = []
+        self.lag = []  # Event loop lag samples, seconds
+        self.booted = 0
+        self.boot_errors = 0
+        self.started = None
+
+    @property
+    def registered_macs(self):
+        return [device.world.mac_address for device, _ in self.devices[self.unregistered:]]
+
+    def build(self):
+        """Load the firmware once per device; the slow part, done before timing"""
+        for serial in range(self.count):
+            self.devices.append(self._load(serial))
+        # Thousands of loaded scripts would make every later collection walk them
+        gc.collect()
+        gc.freeze()
+
+    def _load(self, serial):
+        rng = random.Random((self.seed << 32) | serial)
+        mac = mac_for(serial)
+        flash_dir = os.path.join(self.flash_dir, mac.hex())
+        os.mkdir(flash_dir)
+        world = World(mac=mac, fast_forward=False, seed=serial, flash_dir=flash_dir,
+                      epoch=time.time() + rng.gauss(0, self.skew_s))
+        world.net.hosts[SUPABASE_HOST] = self.address
+        world.net.live = True
+        world.sensor.trace = sensor_trace(rng, world.clock)
+        device = Device(self.script, world)
+        # One process holds every device's heap, so a full collection
+        # after each reading cycle would stall the whole fleet
+        device._modules['gc'].collect = _skip_collect
+        module = device.load()
+        for name, value in self.config.items():
+            if not hasattr(module.Config, name):
+                raise ValueError(f'the firmware has no Config.{name}')
+            setattr(module.Config, name, value)
+        for name in IDLE_TASKS:
+            setattr(module, name, _idle)
+        if serial >= self.unregistered and not self.cold:
+            module.state.registration.save(True, serial + 1)
+        pool = module.state.http
+        pool.request = self._timed(pool.request)
+        return device, rng.uniform(0, self.boot_spread_s)
+
+    def _timed(self, request):
+        records = self.records
+        now = time.monotonic
+
+        async def timed(method, url, *args, **kwargs):
+            sent = now()
+            try:
+                response = await request(method, url, *args, **kwargs)
+            except Exception:
+                records.append((sent - self.started, now() - sent, endpoint(method, url), 0))
+                raise
+            records.append((sent - self.started, now() - sent, endpoint(method, url),
+                            response.status_code))
+            return response
+
+        return timed
+
+    async def _boot(self, device, at):
+        await asyncio.sleep(at)
+        try:
+            await device.module.setup()
+            self.booted += 1
+        except Exception as e:
+            self.boot_errors += 1
+            print(f'Boot failed: {e}')
+
+    async def _watch_lag(self, period=0.1):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(period)
+            self.lag.append(time.monotonic() - started - period)
+
+    async def run(self, seconds):
+        """Boot every device and let the fleet run for `seconds`"""
+        self.started = time.monotonic()
+        started = [asyncio.create_task(self._watch_lag())]
+        started += [asyncio.create_task(self._boot(device, at)) for device, at in self.devices]
+        await asyncio.sleep(seconds)
+        current = asyncio.current_task()
+        tasks = [task for task in asyncio.all_tasks() if task is not current]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for device, _ in self.devices:
+            device.module.state.http.close()
+        await asyncio.sleep(0)
+
+    @property
+    def connections(self):
+        return sum(device.module.state.http.connects for device, _ in self.devices)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else 0.0
+
+
+def latency_stats(latencies):
+    """p50/p90/p99/max of latencies in seconds, reported in ms"""
+    return {f'{name}_ms': round(value * 1000, 1) for name, value in (
+        ('p50', percentile(latencies, 0.5)), ('p90', percentile(latencies, 0.9)),
+        ('p99', percentile(latencies, 0.99)), ('max', max(latencies, default=0.0)))}
+
+
+def phase(records, rates, bin_s, start, end):
+    """Requests sent in [start, end) seconds: rates, latency and failures"""
+    inside = [record for record in records if start <= record[0] < end]
+    bins = rates[int(start // bin_s):math.ceil(end / bin_s)]
+    return {
+        'start_s': start,
+        'end_s': end,
+        'requests': len(inside),
+        'mean_rps': round(len(inside) / (end - start), 1) if end > start else 0.0,
+        'peak_rps': max(bins, default=0.0),
+        'failed': sum(1 for *_, status in inside if status in FAILED),
+        **latency_stats([latency for _, latency, _, _ in inside]),
+    }
+
+
+def report(fleet, seconds, storm_s, bin_s):
+    records = fleet.records
+    counts = [0] * math.ceil(seconds / bin_s)
+    for sent, *_ in records:
+        counts[min(len(counts) - 1, int(sent // bin_s))] += 1
+    rates = [count / bin_s for count in counts]
+
+    endpoints = {}
+    for name in sorted({record[2] for record in records}):
+        chosen = [record for record in records if record[2] == name]
+        statuses = {}
+        for *_, status in chosen:
+            statuses[status] = statuses.get(status, 0) + 1
+        endpoints[name] = {
+            'requests': len(chosen),
+            'rps': round(len(chosen) / seconds, 1),
+            **latency_stats([latency for _, latency, _, _ in chosen]),
+            'statuses': dict(sorted(statuses.items())),
+        }
+
+    storm_end = min(seconds, fleet.boot_spread_s + storm_s)
+    return {
+        'devices': fleet.count,
+        'unregistered': fleet.unregistered,
+        'booted': fleet.booted,
+        'boot_errors': fleet.boot_errors,
+        'seconds': seconds,
+        'requests': len(records),
+        'rps': round(len(records) / seconds, 1),
+        'connections': fleet.connections,
+        'latency': latency_stats([latency for _, latency, _, _ in records]),
+        'endpoints': endpoints,
+        'storm': phase(records, rates, bin_s, 0.0, storm_end),
+        'after_storm': phase(records, rates, bin_s, storm_end, seconds),
+        'loop_lag': latency_stats(fleet.lag),
+        'bin_s': bin_s,
+        'rates': rates,
+    }
+
+
+def print_report(result, target, width=50):
+    print(f"{result['devices']} devices ({result['unregistered']} unregistered) for "
+          f"{result['seconds']:.0f} s against {target}: {result['booted']} booted, "
+          f"{result['boot_errors']} failed to boot")
+    print(f"{result['requests']} requests, {result['rps']} req/s achieved, "
+          f"{result['connections']} connections opened\n")
+
+    print(f'{"endpoint":15} {"requests":>9} {"req/s":>8} {"p50 ms":>8} {"p90 ms":>8} '
+          f'{"p99 ms":>8} {"max ms":>8}  statuses')
+    rows = list(result['endpoints'].items()) + [('all', {
+        'requests': result['requests'], 'rps': result['rps'], **result['latency'],
+        'statuses': {}})]
+    for name, row in rows:
+        statuses = ' '.join(f'{status}:{count}' for status, count in row['statuses'].items())
+        print(f"{name:15} {row['requests']:9} {row['rps']:8.1f} {row['p50_ms']:8.1f} "
+              f"{row['p90_ms']:8.1f} {row['p99_ms']:8.1f} {row['max_ms']:8.1f}  {statuses}")
+    print()
+
+    for label, key in (('boot storm', 'storm'), ('after it', 'after_storm')):
+        part = result[key]
+        print(f"{label:10} {part['start_s']:4.0f}-{part['end_s']:<4.0f} s: "
+              f"{part['requests']:7} requests, mean {part['mean_rps']:7.1f} req/s, "
+              f"peak {part['peak_rps']:7.1f} req/s, p99 {part['p99_ms']:7.1f} ms, "
+              f"{part['failed']} failed")
+    lag = result['loop_lag']
+    print(f"generator loop lag: p50 {lag['p50_ms']} ms, p99 {lag['p99_ms']} ms, "
+          f"max {lag['max_ms']} ms\n")
+
+    # At most about 60 rows, each showing its busiest bin
+    rates = result['rates']
+    bin_s = result['bin_s']
+    per_row = max(1, math.ceil(len(rates) / 60))
+    top = max(rates, default=0) or 1
+    print(f'request rate, busiest {bin_s:g} s in each {per_row * bin_s:g} s:')
+    for row in range(0, len(rates), per_row):
+        peak = max(rates[row:row + per_row])
+        print(f'  {row * bin_s:6.0f} s {peak:8.1f} req/s |{"#" * round(peak / top * width)}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Drive an ingest endpoint with a virtual fleet')
+    parser.add_argument('--devices', type=int, default=1000)
+    parser.add_argument('--seconds', type=float, default=60, help='run time after the first boot')
+    parser.add_argument('--target', metavar='URL',
+                        help='endpoint the firmware\'s Supabase host resolves to, e.g. '
+                             'http://127.0.0.1:8000; an in-process stand-in by default')
+    parser.add_argument('--unregistered', type=float, default=0.0,
+                        help='fraction of devices waiting to be paired, polling registration')
+    parser.add_argument('--cold', action='store_true',
+                        help='boot without a cached registration, checking it before reading')
+    parser.add_argument('--boot-spread', type=float, default=0.0, metavar='SECONDS',
+                        help='boot devices at random over this long; 0 boots them together')
+    parser.add_argument('--skew', type=float, default=2.0, metavar='SECONDS',
+                        help='standard deviation of device clocks from real time')
+    parser.add_argument('--config', type=parse_config, action='append', default=[],
+                        metavar='NAME=VALUE',
+                        help='firmware Config override, e.g. READING_INTERVAL_MS=60000 '
+                             'or BATCH_UPLOADS=True')
+    parser.add_argument('--storm', type=float, default=30.0, metavar='SECONDS',
+                        help='how long after the last boot counts as the boot storm')
+    parser.add_argument('--bin', type=float, default=1.0, help='request rate bin in seconds')
+    parser.add_argument('--json', help='write the report to this file')
+    # Its --seed also picks the fleet's clocks, sensors, boot times and jitter
+    add_fault_arguments(parser.add_argument_group('in-process stand-in faults'))
+    args = parser.parse_args()
+    random.seed(args.seed)  # Backoff jitter
+
+    with contextlib.ExitStack() as stack:
+        if args.target:
+            parts = urlsplit(args.target)
+            address = (parts.hostname, parts.port or 80)
+            target = args.target
+        else:
+            standin = stack.enter_context(StandIn(faults=faults_from_args(args)))
+            address = standin.address
+            target = f'an in-process stand-in ({standin.url})'
+        flash_dir = stack.enter_context(tempfile.TemporaryDirectory(prefix='nanoc6-fleet-'))
+        # Thousands of devices' prints would flood the terminal
+        firmware_output = stack.enter_context(open(os.devnull, 'w'))
+        fleet = Fleet(address, args.devices, args.unregistered, args.cold, args.skew,
+                      args.boot_spread, args.config, args.seed, flash_dir)
+
+        print(f'Loading {args.devices} devices...', file=sys.stderr)
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(firmware_output):
+            try:
+                fleet.build()
+            except ValueError as e:
+                parser.error(str(e))
+        print(f'Loaded in {time.perf_counter() - started:.1f} s', file=sys.stderr)
+
+        if args.target:
+            registered = register_at(args.target, fleet.registered_macs)
+            print(f'{registered} devices registered at the target', file=sys.stderr)
+        else:
+            for mac_address in fleet.registered_macs:
+                standin.register(mac_address)
+
+        with contextlib.redirect_stdout(firmware_output):
+            asyncio.run(fleet.run(args.seconds))
+        result = report(fleet, args.seconds, args.storm, args.bin)
+
+    print_report(result, target)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'benchmark': 'fleet', 'target': target, 'config': dict(args.config),
+                       **result}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
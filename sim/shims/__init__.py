@@ -0,0 +1,50 @@
+"""Host stand-ins for the MicroPython and UIFlow modules the firmware imports
+
+Every device gets its own copy of each module, with `world` bound to that
+device's sim.world.World, so many devices can share one process.
+"""
+import importlib.util
+import os
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Firmware import name -> shim file
+MODULES = {
+    'M5': 'm5',
+    'hardware': 'hardware',
+    'unit': 'unit',
+    'ubluetooth': 'ubluetooth',
+    'bluetooth': 'ubluetooth',
+    'network': 'network',
+    'machine': 'machine',
+    'micropython': 'micropython',
+    'requests2': 'requests2',
+    'socket': 'socket',
+    'usocket': 'socket',
+    'ssl': 'ssl',
+    'ubinascii': 'ubinascii',
+    'esp32': 'esp32',
+    'gc': 'gc',
+    'ntptime': 'ntptime',
+    'asyncio': 'asyncio',
+    'uasyncio': 'asyncio',
+}
+
+
+def load_modules(world):
+    """Build this device's firmware-visible modules, keyed by import name"""
+    loaded = {}
+    modules = {}
+    for name, shim in MODULES.items():
+        if shim not in loaded:
+            spec = importlib.util.spec_from_file_location(
+                f'sim.shims.{shim}', os.path.join(_HERE, f'{shim}.py'))
+            module = importlib.util.module_from_spec(spec)
+            module.world = world
+            spec.loader.exec_module(module)
+            loaded[shim] = module
+        modules[name] = loaded[shim]
+    time_module = world.clock.module()
+    modules['time'] = time_module
+    modules['utime'] = time_module
+    return modules
@@ -0,0 +1,265 @@
+"""MicroPython-flavoured asyncio running on the device clock
+
+The event loop is CPython's, with its clock replaced by the simulated one
+and its idle wait turned into a device sleep, so timers fire in device
+time and fast-forward still works. open_connection() routes firmware hosts
+to local stand-ins and charges connect and round-trip time as awaitable
+sleeps, so other tasks keep running while a request is in flight.
+
+With world.net.live the connection is a real asyncio one instead, for
+devices that share a running event loop in real time (sim.fleet), where a
+blocking socket would stall every other device.
+"""
+# `world` is bound by sim.shims.load_modules
+import asyncio as _asyncio
+import selectors as _selectors
+import socket as _socket
+
+# asyncio imports its policy lazily from `asyncio`, which is this module
+# while firmware runs, so create it now
+_asyncio.get_event_loop_policy()
+
+CancelledError = _asyncio.CancelledError
+TimeoutError = _asyncio.TimeoutError
+Event = _asyncio.Event
+Lock = _asyncio.Lock
+Task = _asyncio.Task
+sleep = _asyncio.sleep
+gather = _asyncio.gather
+wait_for = _asyncio.wait_for
+create_task = _asyncio.create_task
+current_task = _asyncio.current_task
+
+
+def sleep_ms(ms):
+    return _asyncio.sleep(ms / 1000)
+
+
+def wait_for_ms(awaitable, timeout):
+    return _asyncio.wait_for(awaitable, timeout / 1000)
+
+
+class ThreadSafeFlag:
+    """Set from an IRQ, awaited by one task; wait() clears it"""
+
+    def __init__(self):
+        self._event = _asyncio.Event()
+
+    def set(self):
+        self._event.set()
+
+    def clear(self):
+        self._event.clear()
+
+    async def wait(self):
+        await self._event.wait()
+        self._event.clear()
+
+
+class _Selector(_selectors.DefaultSelector):
+    """Selector that sleeps on the device clock when nothing is ready"""
+
+    def __init__(self, clock):
+        super().__init__()
+        self.clock = clock
+        self.loop = None
+
+    def select(self, timeout=None):
+        ready = super().select(0)
+        if ready or timeout == 0:
+            return ready
+        # BLE writes and button presses arrive from sleep callbacks; run them
+        # first so a task they wake isn't held back until the next timer
+        for callback in self.clock.on_sleep:
+            callback()
+        if self.loop._ready:
+            return []
+        self.clock.sleep(1.0 if timeout is None else timeout)
+        return super().select(0)
+
+
+class SimEventLoop(_asyncio.SelectorEventLoop):
+    def __init__(self, clock):
+        selector = _Selector(clock)
+        super().__init__(selector)
+        selector.loop = self
+        self.clock = clock
+        self.fatal = None  # machine.reset() or deep sleep raised inside a task
+        self.set_exception_handler(_exception_handler)
+
+    def time(self):
+        return self.clock.now()
+
+    def create_task(self, coro, **kwargs):
+        task = super().create_task(coro, **kwargs)
+        task.add_done_callback(self._check_fatal)
+        return task
+
+    def _check_fatal(self, task):
+        if task.cancelled():
+            return
+        exc = task.exception()
+        if exc is not None and not isinstance(exc, Exception):
+            # Tasks swallow BaseExceptions; the device would have stopped
+            self.fatal = exc
+            self.stop()
+
+    def run_until_complete(self, future):
+        try:
+            return super().run_until_complete(future)
+        except RuntimeError:
+            if self.fatal is not None:
+                raise self.fatal
+            raise
+
+
+def _exception_handler(loop, context):
+    if 'Task was destroyed' in context.get('message', ''):
+        return  # Tasks left pending when the simulation ends
+    exc = context.get('exception')
+    print(f"Task exception wasn't retrieved: {exc!r}" if exc else context['message'])
+
+
+_loop = None
+
+
+def new_event_loop():
+    global _loop
+    _loop = SimEventLoop(world.clock)
+    _asyncio.set_event_loop(_loop)
+    return _loop
+
+
+def get_event_loop():
+    if _loop is None or _loop.is_closed():
+        return new_event_loop()
+    return _loop
+
+
+def run(coro):
+    loop = new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        for task in _asyncio.all_tasks(loop):
+            task.cancel()
+        loop.close()
+
+
+class Stream:
+    """Reader and writer over a socket to a local stand-in"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self._rfile = sock.makefile('rb')
+        self._out = []
+
+    def get_extra_info(self, name):
+        return self.sock.getpeername() if name == 'peername' else None
+
+    def write(self, data):
+        self._out.append(bytes(data))
+
+    async def drain(self):
+        if not self._out:
+            return
+        if not world.net.connected:
+            raise OSError(104, 'ECONNRESET')
+        data = b''.join(self._out)
+        self._out.clear()
+        await sleep(world.net.rtt_ms / 1000)
+        self.sock.sendall(data)
+
+    async def awrite(self, data):
+        self.write(data)
+        await self.drain()
+
+    async def readline(self):
+        return self._rfile.readline()
+
+    async def read(self, n=-1):
+        return self._rfile.read1(n) if n > 0 else self._rfile.read()
+
+    async def readexactly(self, n):
+        data = self._rfile.read(n)
+        if len(data) < n:
+            raise EOFError()
+        return data
+
+    def close(self):
+        try:
+            self._rfile.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+    async def wait_closed(self):
+        pass
+
+    aclose = wait_closed
+
+
+StreamReader = StreamWriter = Stream
+
+
+class LiveStream:
+    """Reader and writer over an asyncio connection on the running loop"""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    def get_extra_info(self, name):
+        return self.writer.get_extra_info(name)
+
+    def write(self, data):
+        self.writer.write(bytes(data))
+
+    async def drain(self):
+        if not world.net.connected:
+            raise OSError(104, 'ECONNRESET')
+        await sleep(world.net.rtt_ms / 1000)
+        await self.writer.drain()
+
+    async def awrite(self, data):
+        self.write(data)
+        await self.drain()
+
+    async def readline(self):
+        return await self.reader.readline()
+
+    async def read(self, n=-1):
+        return await self.reader.read(n)
+
+    async def readexactly(self, n):
+        try:
+            return await self.reader.readexactly(n)
+        except _asyncio.IncompleteReadError:
+            raise EOFError() from None
+
+    def close(self):
+        self.writer.close()
+
+    async def wait_closed(self):
+        try:
+            await self.writer.wait_closed()
+        except OSError:
+            pass
+
+    aclose = wait_closed
+
+
+async def open_connection(host, port, ssl=None, server_hostname=None):
+    """Connect to a firmware host; TLS is folded into the connect time"""
+    if not world.net.connected:
+        raise OSError(113, 'EHOSTUNREACH')
+    # HTTP clients that cache DNS connect to the stand-in's address directly
+    address = world.net.route(host) if host in world.net.hosts else (host, port)
+    await sleep(world.net.connect_ms / 1000)
+    if world.net.live:
+        stream = LiveStream(*await _asyncio.open_connection(*address))
+        return stream, stream
+    sock = _socket.create_connection(address, timeout=10)
+    sock.setsockopt(_socket.IPPROTO_TCP, _socket.TCP_NODELAY, 1)
+    stream = Stream(sock)
+    return stream, stream
@@ -0,0 +1,47 @@
+# `world` is bound by sim.shims.load_modules
+"""esp32 module with NVS kept in the world, so it survives reboots"""
+
+ESP_ERR_NVS_NOT_FOUND = -4354
+HEAP_DATA = 4
+HEAP_EXEC = 1
+
+
+def idf_heap_info(capabilities):
+    """One nominal region, (total, free, largest free block, lowest free)"""
+    return [(256 * 1024, 96 * 1024, 64 * 1024, 80 * 1024)]
+
+
+class NVS:
+    def __init__(self, namespace):
+        self._store = world.nvs.setdefault(namespace, {})
+        self._pending = dict(self._store)
+        self.commits = 0
+
+    def _get(self, key):
+        if key not in self._pending:
+            raise OSError(ESP_ERR_NVS_NOT_FOUND)
+        return self._pending[key]
+
+    def set_i32(self, key, value):
+        self._pending[key] = int(value)
+
+    def get_i32(self, key):
+        return self._get(key)
+
+    def set_blob(self, key, value):
+        self._pending[key] = bytes(value)
+
+    def get_blob(self, key, buffer):
+        value = self._get(key)
+        buffer[:len(value)] = value
+        return len(value)
+
+    def erase_key(self, key):
+        self._get(key)
+        del self._pending[key]
+
+    def commit(self):
+        # Only committed values survive a reset, as on the device
+        self._store.clear()
+        self._store.update(self._pending)
+        self.commits += 1
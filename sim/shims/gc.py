@@ -0,0 +1,55 @@
+# `world` is bound by sim.shims.load_modules
+# CPython has no fixed heap, so these numbers come from the host memory
+# traced by tracemalloc (python -m sim --heap). MicroPython only gets memory
+# back when it collects, while CPython frees an object with its last
+# reference, so memory freed between two calls is kept as garbage until
+# collect() or a full nominal heap. Memory allocated and freed again below
+# an earlier peak goes unseen, so mem_alloc() deltas are lower bounds.
+# CPython objects are several times larger than MicroPython's, so only
+# compare these numbers with each other.
+import gc as _gc
+import tracemalloc
+
+HEAP_SIZE = 8 * 160 * 1024  # UIFlow2 leaves scripts about 160 KB, scaled for CPython
+
+enable = _gc.enable
+disable = _gc.disable
+isenabled = _gc.isenabled
+
+_threshold = -1
+
+
+_boot = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+_last = _boot
+_garbage = 0
+
+
+def collect():
+    global _garbage
+    _gc.collect()
+    _garbage = 0
+    mem_alloc()
+
+
+def mem_alloc():
+    global _last, _garbage
+    if not tracemalloc.is_tracing():
+        return 0
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    _garbage += max(0, max(peak, _last) - current)
+    _last = current
+    if current - _boot + _garbage > HEAP_SIZE:
+        _garbage = 0  # An automatic collection
+    return max(0, current - _boot) + _garbage
+
+
+def mem_free():
+    return max(0, HEAP_SIZE - mem_alloc())
+
+
+def threshold(amount=None):
+    global _threshold
+    if amount is None:
+        return _threshold
+    _threshold = amount
@@ -0,0 +1,38 @@
+# `world` is bound by sim.shims.load_modules
+
+
+class RGB:
+    def set_brightness(self, brightness):
+        world.led.brightness = brightness
+
+    def fill_color(self, color):
+        world.led.fill(color)
+
+
+class Pin:
+    IN = 1
+    OUT = 3
+    PULL_UP = 1
+    IRQ_FALLING = 2
+    IRQ_RISING = 1
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self._value = value or 0
+
+    def value(self, value=None):
+        if value is None:
+            if self.id == world.button.PIN:
+                return 0 if world.button.down else 1
+            return self._value
+        self._value = value
+
+    def irq(self, handler=None, trigger=None):
+        if self.id == world.button.PIN:
+            world.button.irq = (handler, self) if handler else None
+
+
+class I2C:
+    def __init__(self, id, scl=None, sda=None, freq=400000):
+        self.id = id
+        self.freq = freq
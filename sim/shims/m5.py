@@ -0,0 +1,38 @@
+# `world` is bound by sim.shims.load_modules
+__all__ = ['BtnA']
+
+
+class _CallbackType:
+    WAS_CLICKED = 0
+    WAS_DOUBLECLICKED = 1
+    WAS_HOLD = 2
+    WAS_PRESSED = 3
+    WAS_RELEASED = 4
+
+
+class _Button:
+    CB_TYPE = _CallbackType
+
+    def __init__(self):
+        self._callbacks = {}
+
+    def setCallback(self, type, cb):
+        self._callbacks[type] = cb
+
+    def _fire(self, name):
+        callback = self._callbacks.get(getattr(_CallbackType, name))
+        if callback:
+            callback(1)
+
+
+BtnA = _Button()
+
+
+def begin():
+    pass
+
+
+def update():
+    world.button.updates += 1
+    while world.button.pending:
+        BtnA._fire(world.button.pending.pop(0))
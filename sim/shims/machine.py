@@ -0,0 +1,112 @@
+# `world` is bound by sim.shims.load_modules
+from sim.world import DeepSleep, DeviceReset
+
+PWRON_RESET = 1
+HARD_RESET = 2
+WDT_RESET = 3
+DEEPSLEEP_RESET = 4
+SOFT_RESET = 5
+
+
+def reset():
+    raise DeviceReset()
+
+
+def soft_reset():
+    raise DeviceReset()
+
+
+def deepsleep(time_ms=0):
+    raise DeepSleep(time_ms)
+
+
+def lightsleep(time_ms=0):
+    world.clock.sleep(time_ms / 1000)
+
+
+def reset_cause():
+    return world.reset_cause
+
+
+def unique_id():
+    return world.mac
+
+
+def freq(hz=None):
+    return 160000000
+
+
+def idle():
+    pass
+
+
+class RTC:
+    """RTC with slow memory that survives deep sleep but not power loss"""
+
+    def memory(self, data=None):
+        if data is None:
+            return world.rtc_memory
+        if len(data) > 2048:
+            raise ValueError('RTC memory is limited to 2048 bytes')
+        world.rtc_memory = bytes(data)
+
+    def datetime(self, datetime=None):
+        return tuple(world.clock.module().localtime()[:7]) + (0,)
+
+
+class Timer:
+    """Hardware timer whose callback fires during the firmware's sleeps"""
+
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id=-1):
+        self.id = id
+        self._timer = None
+
+    def init(self, mode=PERIODIC, period=-1, callback=None):
+        self.deinit()
+        self.mode = mode
+        self.period = period
+        self.callback = callback
+        if callback is not None:
+            self._arm()
+
+    def deinit(self):
+        if self._timer is not None:
+            world.clock.cancel_timer(self._timer)
+            self._timer = None
+
+    def _arm(self):
+        self._timer = world.clock.add_timer(self.period / 1000, self._fire)
+
+    def _fire(self):
+        self._timer = None
+        if self.mode == self.PERIODIC:
+            self._arm()
+        self.callback(self)
+
+
+class Pin:
+    IN = 1
+    OUT = 3
+    PULL_UP = 1
+    IRQ_FALLING = 2
+    IRQ_RISING = 1
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self._value = value or 0
+
+    def value(self, value=None):
+        if value is None:
+            return self._value
+        self._value = value
+
+    def irq(self, handler=None, trigger=None):
+        pass
+
+
+class I2C:
+    def __init__(self, id, scl=None, sda=None, freq=400000):
+        self.id = id
@@ -0,0 +1,39 @@
+# `world` is bound by sim.shims.load_modules
+
+
+def const(value):
+    return value
+
+
+def schedule(func, arg):
+    """Queue func(arg) to run from the main context, like the VM does"""
+    if len(world.scheduled) >= 8:
+        raise RuntimeError('schedule queue full')
+    world.scheduled.append((func, arg))
+
+
+def alloc_emergency_exception_buf(size):
+    pass
+
+
+def opt_level(level=None):
+    return 0
+
+
+def mem_info(verbose=False):
+    print('mem_info not available in the simulator')
+
+
+def heap_lock():
+    return 0
+
+
+def heap_unlock():
+    return 0
+
+
+def native(func):
+    return func
+
+
+viper = native
@@ -0,0 +1,40 @@
+# `world` is bound by sim.shims.load_modules
+STA_IF = 0
+AP_IF = 1
+
+STAT_IDLE = 1000
+STAT_CONNECTING = 1001
+STAT_GOT_IP = 1010
+
+
+class WLAN:
+    def __init__(self, interface=STA_IF):
+        self.interface = interface
+        self._active = False
+
+    def active(self, is_active=None):
+        if is_active is None:
+            return self._active
+        self._active = bool(is_active)
+
+    def isconnected(self):
+        return world.net.connected
+
+    def status(self):
+        return STAT_GOT_IP if world.net.connected else STAT_IDLE
+
+    def connect(self, ssid=None, key=None):
+        self._active = True
+
+    def disconnect(self):
+        pass
+
+    def config(self, *args, **kwargs):
+        if args and args[0] == 'mac':
+            return world.mac
+        return None
+
+    def ifconfig(self):
+        if not world.net.connected:
+            return ('0.0.0.0', '0.0.0.0', '0.0.0.0', '0.0.0.0')
+        return ('192.168.1.50', '255.255.255.0', '192.168.1.1', '192.168.1.1')
@@ -0,0 +1,9 @@
+# `world` is bound by sim.shims.load_modules
+"""ntptime module: settime() sets the device clock to the host's time"""
+import time as _time
+
+
+def settime():
+    if not world.net.connected:
+        raise OSError(-202, 'no route to the NTP server')
+    world.clock.epoch = _time.time() - world.clock.now()
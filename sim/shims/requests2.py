@@ -0,0 +1,78 @@
+# `world` is bound by sim.shims.load_modules
+"""requests2 that sends firmware requests to local stand-ins
+
+Like the real module it opens a new connection for every request, so each
+call is charged the simulated connect time plus one round trip.
+"""
+import http.client
+import json as _json
+from urllib.parse import quote, urlsplit
+
+
+class Response:
+    def __init__(self, status_code, reason, headers, content):
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+    def json(self):
+        return _json.loads(self.content)
+
+    def close(self):
+        pass
+
+
+def urlencode(params):
+    return '&'.join(f'{quote(str(k))}={quote(str(v))}' for k, v in params.items())
+
+
+def request(method, url, data=None, json=None, headers=None, timeout=None):
+    if not world.net.connected:
+        raise OSError(113, 'EHOSTUNREACH')
+    parts = urlsplit(url)
+    address, port = world.net.route(parts.hostname)
+    world.clock.advance((world.net.connect_ms + world.net.rtt_ms) / 1000)
+
+    headers = dict(headers or {})
+    body = data
+    if json is not None:
+        body = _json.dumps(json)
+        headers.setdefault('Content-Type', 'application/json')
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+
+    path = parts.path + (f'?{parts.query}' if parts.query else '')
+    connection = http.client.HTTPConnection(address, port, timeout=timeout or 10)
+    try:
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        content = response.read()
+        return Response(response.status, response.reason,
+                        {k.lower(): v for k, v in response.getheaders()}, content)
+    finally:
+        connection.close()
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+
+def patch(url, **kwargs):
+    return request('PATCH', url, **kwargs)
+
+
+def put(url, **kwargs):
+    return request('PUT', url, **kwargs)
+
+
+def delete(url, **kwargs):
+    return request('DELETE', url, **kwargs)
@@ -0,0 +1,41 @@
+# `world` is bound by sim.shims.load_modules
+"""socket module that routes firmware hosts to local stand-ins
+
+New connections and requests are charged the simulated network's connect
+time and round-trip time on the device clock.
+"""
+import socket as _socket
+
+AF_INET = _socket.AF_INET
+SOCK_STREAM = _socket.SOCK_STREAM
+IPPROTO_TCP = _socket.IPPROTO_TCP
+TCP_NODELAY = _socket.TCP_NODELAY
+SOL_SOCKET = _socket.SOL_SOCKET
+SO_REUSEADDR = _socket.SO_REUSEADDR
+error = OSError
+timeout = _socket.timeout
+
+
+def getaddrinfo(host, port, family=0, type=0, proto=0, flags=0):
+    if not world.net.connected:
+        raise OSError(-202, 'DNS lookup failed')
+    address, port = world.net.route(host)
+    return _socket.getaddrinfo(address, port, family, type, proto, flags)
+
+
+class socket(_socket.socket):
+    def connect(self, address):
+        if not world.net.connected:
+            raise OSError(113, 'EHOSTUNREACH')
+        world.clock.advance(world.net.connect_ms / 1000)
+        super().connect(address)
+
+    def sendall(self, data):
+        if not world.net.connected:
+            raise OSError(104, 'ECONNRESET')
+        world.clock.advance(world.net.rtt_ms / 1000)
+        super().sendall(data)
+
+    def write(self, data):
+        self.sendall(data)
+        return len(data)
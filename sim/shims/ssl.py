@@ -0,0 +1,25 @@
+"""ssl module whose contexts pass sockets through unencrypted
+
+The stand-ins speak plain HTTP; the cost of the TLS handshake is part of
+the simulated network's connect time instead.
+"""
+PROTOCOL_TLS_CLIENT = 16
+PROTOCOL_TLS_SERVER = 17
+CERT_NONE = 0
+CERT_OPTIONAL = 1
+CERT_REQUIRED = 2
+
+
+class SSLContext:
+    def __init__(self, protocol=PROTOCOL_TLS_CLIENT):
+        self.protocol = protocol
+        self.verify_mode = CERT_REQUIRED
+        self.check_hostname = True
+
+    def wrap_socket(self, sock, server_side=False, do_handshake_on_connect=True,
+                    server_hostname=None):
+        return sock
+
+
+def wrap_socket(sock, server_side=False, server_hostname=None, **kwargs):
+    return sock
@@ -0,0 +1,129 @@
+# `world` is bound by sim.shims.load_modules
+FLAG_READ = 0x0002
+FLAG_WRITE_NO_RESPONSE = 0x0004
+FLAG_WRITE = 0x0008
+FLAG_NOTIFY = 0x0010
+FLAG_INDICATE = 0x0020
+
+
+class UUID:
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return isinstance(other, UUID) and str(self.value).lower() == str(other.value).lower()
+
+    def __hash__(self):
+        return hash(str(self.value).lower())
+
+    def __repr__(self):
+        return f'UUID({self.value!r})'
+
+
+class BLE:
+    def __init__(self):
+        self._active = False
+        self.handler = None
+        self._mtu = 23
+
+    @property
+    def _radio(self):
+        return world.radio
+
+    def active(self, is_active=None):
+        if is_active is None:
+            return self._active
+        self._active = bool(is_active)
+        if self._active:
+            self._radio.ble = self
+        elif self._radio.ble is self:
+            self._radio.advertising = None
+            self._radio.connections.clear()
+
+    def _require_active(self):
+        if not self._active:
+            raise OSError(19)  # ENODEV, as on the device
+
+    def irq(self, handler):
+        self.handler = handler
+
+    def config(self, *args, **kwargs):
+        if 'mtu' in kwargs:
+            self._mtu = kwargs['mtu']
+            self._radio.mtu = self._mtu
+        if args:
+            if args[0] == 'mac':
+                return (0, world.mac)
+            if args[0] == 'mtu':
+                return self._mtu
+            if args[0] == 'gap_name':
+                return b'MPY NanoC6'
+        return None
+
+    def gap_advertise(self, interval_us, adv_data=None, resp_data=None, connectable=True):
+        self._require_active()
+        if interval_us is None:
+            self._radio.advertising = None
+            return
+        self._radio.advertising = (interval_us, bytes(adv_data or b''))
+        self._radio.advertise_count += 1
+
+    def gap_disconnect(self, conn_handle):
+        self._require_active()
+        if conn_handle not in self._radio.connections:
+            return False
+        self._radio.connections.discard(conn_handle)
+        if world.central.conn_handle == conn_handle:
+            world.central.conn_handle = None
+        self._radio.irq(2, (conn_handle, 0, bytes(6)))
+        return True
+
+    def gatts_register_services(self, services):
+        self._require_active()
+        radio = self._radio
+        radio.values.clear()
+        radio.characteristics.clear()
+        handle = 0
+        result = []
+        for _, characteristics in services:
+            handle += 1  # Service declaration
+            handles = []
+            for characteristic in characteristics:
+                flags = characteristic[1]
+                handle += 2  # Characteristic declaration and value
+                handles.append(handle)
+                radio.values[handle] = b''
+                radio.characteristics.append(handle)
+                if flags & (FLAG_NOTIFY | FLAG_INDICATE):
+                    handle += 1  # CCCD
+            result.append(tuple(handles))
+        return tuple(result)
+
+    def gatts_read(self, value_handle):
+        self._require_active()
+        return self._radio.values[value_handle]
+
+    def gatts_write(self, value_handle, data, send_update=False):
+        self._require_active()
+        if isinstance(data, str):
+            data = data.encode()
+        self._radio.values[value_handle] = bytes(data)
+        self._radio.written[value_handle] = world.clock.now()
+        if send_update:
+            for conn_handle in self._radio.connections:
+                self.gatts_notify(conn_handle, value_handle)
+
+    def gatts_notify(self, conn_handle, value_handle, data=None):
+        self._require_active()
+        if conn_handle not in self._radio.connections:
+            raise OSError(128)  # ENOTCONN
+        if data is None:
+            data = self._radio.values[value_handle]
+        # The stack silently truncates anything longer than one ATT payload
+        world.central.received(conn_handle, value_handle, bytes(data)[:world.central.mtu - 3])
+
+    def gatts_indicate(self, conn_handle, value_handle, data=None):
+        self.gatts_notify(conn_handle, value_handle, data)
+
+    def gatts_set_buffer(self, value_handle, length, append=False):
+        pass
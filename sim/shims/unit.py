@@ -0,0 +1,36 @@
+# `world` is bound by sim.shims.load_modules
+
+
+class SHT4x:
+    """SHT40: one measurement returns temperature and humidity together"""
+
+    @property
+    def temperature(self):
+        return round(world.sensor.sample()[0], 2)
+
+    @property
+    def relative_humidity(self):
+        return round(world.sensor.sample()[1], 2)
+
+    @property
+    def measurements(self):
+        temperature, humidity, _ = world.sensor.sample()
+        return round(temperature, 2), round(humidity, 2)
+
+
+class ENVUnit:
+    """ENV IV unit: SHT40 for temperature and humidity, BMP280 for pressure"""
+
+    def __init__(self, i2c=None, type=4):
+        self.i2c = i2c
+        self.type = type
+        self.sht4x = SHT4x()
+
+    def read_temperature(self):
+        return self.sht4x.temperature
+
+    def read_humidity(self):
+        return self.sht4x.relative_humidity
+
+    def read_pressure(self):
+        return round(world.sensor.sample()[2], 2)
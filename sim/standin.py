@@ -0,0 +1,450 @@
+"""Local stand-in for the Supabase REST API, with fault injection
+
+  python -m sim.standin --port 8000 --db standin.db --latency lognormal:40,0.6 \
+      --error-rate 0.01 --throttle 50:20 --seed 1
+"""
+import argparse
+import json
+import math
+import random
+import socket
+import sqlite3
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from services.store import ReadingStore, iso_timestamp, parse_timestamp
+
+# PostgREST filter operators the stand-in understands
+OPERATORS = {'eq': '=', 'neq': '<>', 'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<='}
+
+LATENCY_KINDS = ('constant', 'uniform', 'normal', 'lognormal', 'exponential')
+
+
+class ApiError(Exception):
+    """A PostgREST-style error reply"""
+
+    def __init__(self, status, code, message):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+
+
+def error_body(code, message):
+    return {'code': code, 'message': message, 'details': None, 'hint': None}
+
+
+def parse_latency(spec):
+    """'kind:a,b' as (kind, params) in ms, e.g. lognormal:40,0.6 (median ms, sigma)"""
+    kind, _, params = spec.partition(':')
+    if kind not in LATENCY_KINDS:
+        raise ValueError(f'latency kind must be one of {", ".join(LATENCY_KINDS)}')
+    return kind, tuple(float(p) for p in params.split(',') if p)
+
+
+class Faults:
+    """Latency, errors, throttling and dropped connections to inject
+
+    latency      (kind, params) in ms: constant:ms, uniform:low,high,
+                 normal:mean,sd, lognormal:median,sigma or exponential:mean
+    error_rate   fraction of requests answered error_status
+    drop_rate    fraction of connections reset before the request is handled
+    lost_rate    fraction handled, then reset before the reply, so an
+                 insert is stored but the client sees a failure
+    throttle     (requests per second, burst) over all clients; requests
+                 over it are answered 429 with Retry-After
+
+    Draws come from one generator seeded with `seed`, so a run that sends
+    requests in the same order meets the same faults.
+    """
+
+    def __init__(self, latency=None, error_rate=0.0, error_status=503, drop_rate=0.0,
+                 lost_rate=0.0, throttle=None, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.drop_rate = drop_rate
+        self.lost_rate = lost_rate
+        self.throttle = throttle
+        self.seed = seed
+        self.random = random.Random(seed)
+
+    def delay_s(self):
+        if not self.latency:
+            return 0.0
+        kind, params = self.latency
+        draw = self.random
+        if kind == 'constant':
+            ms = params[0]
+        elif kind == 'uniform':
+            ms = draw.uniform(*params)
+        elif kind == 'normal':
+            ms = draw.gauss(*params)
+        elif kind == 'lognormal':
+            ms = draw.lognormvariate(math.log(params[0]), params[1])
+        else:
+            ms = draw.expovariate(1 / params[0])
+        return max(0.0, ms) / 1000
+
+    def roll(self):
+        """(drop, lost, error) for one request, drawn in a fixed order"""
+        draw = self.random.random
+        return draw() < self.drop_rate, draw() < self.lost_rate, draw() < self.error_rate
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # A fleet powering up together connects at once (sim.fleet)
+    request_queue_size = 1024
+
+
+class StandIn:
+    """Stand-in for the Supabase REST endpoints the firmware calls
+
+    Implements the part of PostgREST the firmware and the host services
+    use, for /rest/v1/devices and /rest/v1/readings:
+
+      GET   col=<op>.<value> filters (eq, neq, gt, gte, lt, lte, is.null),
+            select=, order=col.asc|desc[,...], limit= and offset=
+      POST  form or JSON object or array inserts, Prefer: return=representation
+
+    Rows live in SQLite with the schema of services.store, in memory by
+    default or in `db`. Unknown columns and duplicate devices get
+    PostgREST's error codes. Every request is logged with its arrival time,
+    method, path and status (0 when dropped) so load scenarios can look at
+    request rates.
+
+    `clock` timestamps requests and places `outages` and throttling;
+    `sleep` waits out injected latency. Point them at a device's clock,
+    e.g. clock=world.clock.now and sleep=world.clock.advance, to replay a
+    backend outage or a slow backend in simulated time.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, clock=time.monotonic, db=':memory:',
+                 faults=None, sleep=time.sleep):
+        self.store = ReadingStore(db)
+        self.requests = []  # (clock seconds, method, path, status)
+        self.clock = clock
+        self.sleep = sleep
+        self.faults = faults or Faults()
+        self.outage = False  # Answer every request with 503 while set
+        self.outages = []  # (start, end) clock seconds answered with 503
+        self._lock = threading.Lock()
+        self._tokens = None
+        self._refilled = None
+        self._columns = {table: self._table_columns(table) for table in ('devices', 'readings')}
+        self._server = _Server((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def address(self):
+        return self._server.server_address[:2]
+
+    @property
+    def url(self):
+        host, port = self.address
+        return f'http://{host}:{port}/rest/v1'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self.store.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def in_outage(self):
+        if self.outage:
+            return True
+        now = self.clock()
+        return any(start <= now < end for start, end in self.outages)
+
+    def count(self, table):
+        return self.store.count(table)
+
+    def register(self, mac_address, name=None):
+        """Add a device row, as if it had been paired from the web page"""
+        return self.insert('devices', [{'mac_address': mac_address,
+                                        'name': name or f'NanoC6-{mac_address[-6:]}'}])[0]
+
+    def _table_columns(self, table):
+        with self.store.lock:
+            return [row[1] for row in self.store.db.execute(f'PRAGMA table_info({table})')]
+
+    def _check_columns(self, table, names):
+        known = self._columns[table]
+        for name in names:
+            if name not in known:
+                raise ApiError(400, 'PGRST204', f"Could not find the '{name}' column "
+                                                f"of '{table}' in the schema cache")
+
+    def insert(self, table, rows):
+        """Insert row dicts as one statement each, in one transaction; returns the stored rows"""
+        for row in rows:
+            self._check_columns(table, row)
+        created_at = iso_timestamp()
+        db = self.store.db
+        with self.store.lock:
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                ids = []
+                for row in rows:
+                    row = dict(row)
+                    # timestamptz: stored as UTC text whatever offset was sent
+                    try:
+                        row['created_at'] = (parse_timestamp(row['created_at'])
+                                             if row.get('created_at') else created_at)
+                    except (TypeError, ValueError):
+                        raise ApiError(400, '22007', 'invalid input syntax for type timestamp '
+                                                     f'with time zone: {row["created_at"]!r}')
+                    names = ', '.join(row)
+                    marks = ', '.join('?' * len(row))
+                    cursor = db.execute(f'INSERT INTO {table} ({names}) VALUES ({marks})',
+                                        list(row.values()))
+                    ids.append(cursor.lastrowid)
+                db.execute('COMMIT')
+            except sqlite3.IntegrityError as e:
+                db.execute('ROLLBACK')
+                message = str(e)
+                column = message.rpartition('.')[2]
+                if message.startswith('UNIQUE'):
+                    raise ApiError(409, '23505',
+                                   f'duplicate key value violates unique constraint on {table}')
+                if message.startswith('NOT NULL'):
+                    raise ApiError(400, '23502', f'null value in column "{column}" of relation '
+                                                 f'"{table}" violates not-null constraint')
+                raise ApiError(400, '23514', message)
+            except (sqlite3.InterfaceError, sqlite3.ProgrammingError, OverflowError) as e:
+                # A list, object or out-of-range number where a column value goes
+                db.execute('ROLLBACK')
+                raise ApiError(400, 'PGRST102', f'invalid value in body: {e}')
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+            columns = self._columns[table]
+            marks = ', '.join('?' * len(ids))
+            stored = db.execute(f'SELECT * FROM {table} WHERE id IN ({marks}) ORDER BY id',
+                                ids).fetchall()
+        return [dict(zip(columns, row)) for row in stored]
+
+    def select(self, table, query):
+        """Rows matching PostgREST query parameters, as (name, value) pairs"""
+        conditions = []
+        params = []
+        columns = None
+        order = 'id'
+        limit = offset = None
+        for name, value in query:
+            if name == 'select':
+                if value != '*':
+                    columns = value.split(',')
+                    self._check_columns(table, columns)
+            elif name == 'order':
+                order = ', '.join(self._order_term(table, term) for term in value.split(','))
+            elif name == 'limit':
+                limit = int(value)
+            elif name == 'offset':
+                offset = int(value)
+            else:
+                self._check_columns(table, [name])
+                op, _, operand = value.partition('.')
+                if op == 'is' and operand == 'null':
+                    conditions.append(f'{name} IS NULL')
+                elif op in OPERATORS:
+                    conditions.append(f'{name} {OPERATORS[op]} ?')
+                    params.append(operand)
+                else:
+                    raise ApiError(400, 'PGRST100', f'unsupported filter {name}={value}')
+        sql = f'SELECT {", ".join(columns) if columns else "*"} FROM {table}'
+        if conditions:
+            sql += f' WHERE {" AND ".join(conditions)}'
+        sql += f' ORDER BY {order}'
+        if limit is not None or offset is not None:
+            sql += f' LIMIT {-1 if limit is None else limit} OFFSET {offset or 0}'
+        with self.store.lock:
+            cursor = self.store.db.execute(sql, params)
+            names = [column[0] for column in cursor.description]
+            return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def _order_term(self, table, term):
+        name, _, direction = term.partition('.')
+        self._check_columns(table, [name])
+        if direction not in ('', 'asc', 'desc'):
+            raise ApiError(400, 'PGRST100', f'unsupported order {term}')
+        return f'{name} {direction or "asc"}'
+
+    def _throttled(self):
+        """Take a token from the bucket; False when there are none left"""
+        if not self.faults.throttle:
+            return False
+        rate, burst = self.faults.throttle
+        now = self.clock()
+        if self._tokens is None:
+            self._tokens, self._refilled = burst, now
+        self._tokens = min(burst, self._tokens + (now - self._refilled) * rate)
+        self._refilled = now
+        if self._tokens < 1:
+            return True
+        self._tokens -= 1
+        return False
+
+    def _handler(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                self._serve(lambda table, query, body: (200, standin.select(table, query)))
+
+            def do_POST(self):
+                self._serve(self._insert)
+
+            def _insert(self, table, query, body):
+                if self.headers.get('Content-Type', '').startswith('application/json'):
+                    try:
+                        payload = json.loads(body or b'null')
+                    except ValueError:
+                        raise ApiError(400, 'PGRST102', 'Empty or invalid json') from None
+                    rows = payload if isinstance(payload, list) else [payload]
+                else:
+                    rows = [dict(parse_qsl(body.decode('utf-8')))]
+                if not rows or not all(isinstance(row, dict) for row in rows):
+                    raise ApiError(400, 'PGRST102', 'expected an object or array of objects')
+                stored = standin.insert(table, rows)
+                if 'return=representation' in self.headers.get('Prefer', ''):
+                    return 201, stored
+                return 201, None
+
+            def _serve(self, action):
+                body = b''
+                try:
+                    length = int(self.headers.get('Content-Length', 0))
+                    if length < 0:
+                        raise ValueError
+                except ValueError:
+                    # Where the body ends is unknown, so the connection can't be reused
+                    self._reply(standin.clock(), 400,
+                                error_body('PGRST102', 'invalid Content-Length'),
+                                (('Connection', 'close'),))
+                    return
+                if length:
+                    body = self.rfile.read(length)
+                faults = standin.faults
+                with standin._lock:
+                    arrived = standin.clock()
+                    drop, lost, error = faults.roll()
+                    delay = faults.delay_s()
+                    throttled = not drop and standin._throttled()
+                if drop:
+                    self._drop(arrived)
+                    return
+                standin.sleep(delay)
+                parts = urlsplit(self.path)
+                table = parts.path.rsplit('/', 1)[-1]
+                extra = ()
+                try:
+                    if standin.in_outage():
+                        raise ApiError(503, 'PGRST000', 'service unavailable')
+                    if throttled:
+                        extra = (('Retry-After', '1'),)
+                        raise ApiError(429, 'PGRST000', 'too many requests')
+                    if error:
+                        raise ApiError(faults.error_status, 'PGRST000', 'injected error')
+                    if table not in standin._columns:
+                        raise ApiError(404, '42P01', f'relation "public.{table}" does not exist')
+                    status, payload = action(table, parse_qsl(parts.query), body)
+                except ApiError as e:
+                    status, payload = e.status, error_body(e.code, str(e))
+                except ValueError as e:
+                    status, payload = 400, error_body('PGRST100', str(e))
+                except Exception as e:
+                    # Still answered and logged, so a client never just sees the socket close
+                    status, payload = 500, error_body('XX000', f'{type(e).__name__}: {e}')
+                if lost:
+                    self._drop(arrived)
+                    return
+                self._reply(arrived, status, payload, extra)
+
+            def _drop(self, arrived):
+                with standin._lock:
+                    standin.requests.append((arrived, self.command, self.path, 0))
+                # Linger 0 makes close() send a reset rather than a FIN
+                self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER,
+                                           struct.pack('ii', 1, 0))
+                self.close_connection = True
+
+            def _reply(self, arrived, status, payload, extra=()):
+                body = b'' if payload is None else json.dumps(payload).encode('utf-8')
+                with standin._lock:
+                    standin.requests.append((arrived, self.command, self.path, status))
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in extra:
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def add_fault_arguments(parser):
+    """The fault injection flags shared by the stand-in and the simulator"""
+    parser.add_argument('--latency', type=parse_latency, metavar='KIND:PARAMS',
+                        help='added latency in ms, e.g. constant:50, uniform:20,80, '
+                             'normal:50,10, lognormal:40,0.6 or exponential:50')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='fraction of requests answered with --error-status')
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--drop-rate', type=float, default=0.0,
+                        help='fraction of connections reset before the request is handled')
+    parser.add_argument('--lost-rate', type=float, default=0.0,
+                        help='fraction of requests handled and then reset before the reply')
+    parser.add_argument('--throttle', metavar='RPS:BURST',
+                        type=lambda value: tuple(float(v) for v in value.split(':')),
+                        help='answer 429 above RPS requests per second, allowing BURST at once')
+    parser.add_argument('--seed', type=int, default=0, help='seed for the injected faults')
+
+
+def faults_from_args(args):
+    return Faults(latency=args.latency, error_rate=args.error_rate,
+                  error_status=args.error_status, drop_rate=args.drop_rate,
+                  lost_rate=args.lost_rate, throttle=args.throttle, seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the Supabase REST API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--db', default=':memory:', help='SQLite file; in memory by default')
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    standin = StandIn(args.host, args.port, db=args.db, faults=faults_from_args(args))
+    print(f'Stand-in on {standin.url}')
+    try:
+        standin._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        standin._server.server_close()
+        standin.store.close()
+
+
+if __name__ == '__main__':
+    main()
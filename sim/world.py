@@ -0,0 +1,232 @@
+import math
+import random
+import tempfile
+
+from .clock import Clock
+
+SUPABASE_HOST = 'odabslohlhkklziizpeh.supabase.co'
+
+# ubluetooth IRQ events the firmware handles
+IRQ_CENTRAL_CONNECT = 1
+IRQ_CENTRAL_DISCONNECT = 2
+IRQ_GATTS_WRITE = 3
+IRQ_MTU_EXCHANGED = 21
+
+
+class DeviceReset(BaseException):
+    """machine.reset() was called"""
+
+
+class DeepSleep(BaseException):
+    """machine.deepsleep() was called; the device wakes after `ms`"""
+
+    def __init__(self, ms):
+        super().__init__(ms)
+        self.ms = ms
+
+
+class Network:
+    """WiFi link and network conditions seen by one device"""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.up = True
+        self.outages = []  # (start, end) seconds since boot
+        self.connect_ms = 0.0  # DNS, TCP and TLS setup for a new connection
+        self.rtt_ms = 0.0  # One request/response round trip
+        self.hosts = {}  # Firmware host -> (address, port) of a local stand-in
+        self.live = False  # asyncio sockets on the running loop, for real-time fleets
+
+    @property
+    def connected(self):
+        if not self.up:
+            return False
+        now = self.clock.now()
+        return not any(start <= now < end for start, end in self.outages)
+
+    def add_outage(self, start, end):
+        self.outages.append((start, end))
+
+    def route(self, host):
+        """Local address a firmware hostname should reach"""
+        if host not in self.hosts:
+            raise OSError(f'no simulated route to {host}')
+        return self.hosts[host]
+
+
+class Sensor:
+    """Scripted ENV IV readings
+
+    By default values follow a slow daily cycle with a little noise. Set
+    `trace` to a callable taking seconds since boot and returning
+    (temperature, humidity, pressure) to script them instead.
+    """
+
+    def __init__(self, clock, seed=0):
+        self.clock = clock
+        self.trace = None
+        self.failing = False
+        self.transactions = 0  # I2C transactions, one per read call
+        self.read_ms = 0.0  # Conversion time charged to the clock per transaction
+        self._random = random.Random(seed)
+
+    def sample(self):
+        if self.failing:
+            raise OSError('I2C bus error')
+        self.transactions += 1
+        self.clock.advance(self.read_ms / 1000)
+        if self.trace:
+            return self.trace(self.clock.now())
+        day = math.sin(2 * math.pi * self.clock.time() / 86400)
+        noise = self._random.gauss
+        return (21.0 + 2.0 * day + noise(0, 0.05),
+                45.0 - 5.0 * day + noise(0, 0.2),
+                1013.0 + noise(0, 0.1))
+
+
+class Button:
+    """BtnA; hold() fires the WAS_HOLD callback on the next M5.update()
+
+    It also drives the button's GPIO: the pin reads low until the release,
+    and an IRQ the firmware set on it runs as the button goes down.
+    """
+
+    PIN = 9  # GPIO of BtnA on the NanoC6, pulled up
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.pending = []
+        self.updates = 0
+        self.irq = None  # (handler, Pin) the firmware set on the pin
+        self.released_at = 0.0
+
+    @property
+    def down(self):
+        return self.clock.now() < self.released_at
+
+    def hold(self, seconds=1.0):
+        self.pending.append('WAS_HOLD')
+        self._push(seconds)
+
+    def press(self, seconds=0.1):
+        self.pending.append('WAS_PRESSED')
+        self._push(seconds)
+
+    def _push(self, seconds):
+        self.released_at = self.clock.now() + seconds
+        if self.irq:
+            handler, pin = self.irq
+            handler(pin)
+
+
+class Led:
+    def __init__(self, clock):
+        self.clock = clock
+        self.color = 0
+        self.brightness = 0
+        self.writes = 0
+        self.history = []  # (seconds since boot, colour) on each change
+
+    def fill(self, color):
+        self.writes += 1
+        if color != self.color or not self.history:
+            self.history.append((self.clock.now(), color))
+        self.color = color
+
+
+class Radio:
+    """Server-side BLE state shared by every ubluetooth.BLE() instance"""
+
+    def __init__(self):
+        self.ble = None  # Active BLE object with its IRQ handler
+        self.values = {}  # Attribute handle -> value
+        self.written = {}  # Attribute handle -> device time of the firmware's last write
+        self.characteristics = []  # Value handles in registration order
+        self.connections = set()
+        self.advertising = None  # (interval_us, adv_data) while advertising
+        self.advertise_count = 0
+        self.mtu = 23
+
+    def irq(self, event, data):
+        if self.ble is not None and self.ble.active() and self.ble.handler:
+            self.ble.handler(event, data)
+
+
+class Central:
+    """Virtual BLE central, e.g. the web registration page"""
+
+    def __init__(self, world):
+        self.world = world
+        self.notifications = []  # (seconds since boot, conn_handle, value handle, data)
+        self.conn_handle = None
+        self.mtu = 23
+        self._next_handle = 64
+
+    @property
+    def radio(self):
+        return self.world.radio
+
+    def connect(self):
+        if self.radio.advertising is None:
+            raise OSError('peripheral is not advertising')
+        self.conn_handle = self._next_handle
+        self._next_handle += 1
+        self.radio.advertising = None
+        self.radio.connections.add(self.conn_handle)
+        self.radio.irq(IRQ_CENTRAL_CONNECT, (self.conn_handle, 0, bytes(6)))
+        return self.conn_handle
+
+    def exchange_mtu(self, mtu):
+        self.mtu = min(mtu, self.radio.mtu)
+        self.radio.irq(IRQ_MTU_EXCHANGED, (self.conn_handle, self.mtu))
+        return self.mtu
+
+    def write(self, data, handle=None):
+        handle = self.radio.characteristics[0] if handle is None else handle
+        self.radio.values[handle] = bytes(data)
+        self.radio.irq(IRQ_GATTS_WRITE, (self.conn_handle, handle))
+
+    def read(self, handle=None):
+        handle = self.radio.characteristics[0] if handle is None else handle
+        return self.radio.values.get(handle, b'')
+
+    def disconnect(self):
+        conn_handle, self.conn_handle = self.conn_handle, None
+        if conn_handle in self.radio.connections:
+            self.radio.connections.discard(conn_handle)
+            self.radio.irq(IRQ_CENTRAL_DISCONNECT, (conn_handle, 0, bytes(6)))
+
+    def received(self, conn_handle, handle, data):
+        self.notifications.append((self.world.clock.now(), conn_handle, handle, bytes(data)))
+
+
+class World:
+    """Everything outside the firmware that one simulated NanoC6 can see"""
+
+    def __init__(self, mac=b'\x24\x58\x7c\xaa\xbb\xcc', fast_forward=True, seed=0,
+                 flash_dir=None, epoch=None):
+        self.mac = bytes(mac)
+        self.clock = Clock(fast_forward, epoch)
+        self.net = Network(self.clock)
+        self.sensor = Sensor(self.clock, seed)
+        self.button = Button(self.clock)
+        self.led = Led(self.clock)
+        self.radio = Radio()
+        self.central = Central(self)
+        self.rtc_memory = b''
+        self.nvs = {}  # namespace -> {key: value}
+        self.reset_cause = 1  # machine.PWRON_RESET
+        self.resets = []  # (seconds since boot, cause, detail)
+        self.scheduled = []  # micropython.schedule() callbacks
+        self.flash_dir = flash_dir or tempfile.mkdtemp(prefix='nanoc6-flash-')
+        self.clock.on_sleep.append(self.run_scheduled)
+
+    @property
+    def mac_address(self):
+        return ''.join('{:02X}'.format(b) for b in self.mac)
+
+    def run_scheduled(self):
+        """Run micropython.schedule() callbacks, as the VM does between bytecodes"""
+        while self.scheduled:
+            func, arg = self.scheduled.pop(0)
+            func(arg)
@@ -0,0 +1,41 @@
+// Reassembly of fragmented BLE notifications from the NanoC6 firmware.
+// Header layout must match src/nanoc6/ble_stream.py.
+
+const FRAGMENT = 0x80;
+const LAST = 0x40;
+const INDEX_MASK = 0x3f;
+const HEADER_SIZE = 2;
+
+export class Reassembler {
+	private seq: number | null = null;
+	private parts: Uint8Array[] = [];
+
+	/** Return the complete payload once its last fragment arrives, else null */
+	feed(view: DataView): DataView | null {
+		const first = view.byteLength ? view.getUint8(0) : 0;
+		if (!(first & FRAGMENT)) return view;
+		const index = first & INDEX_MASK;
+		const seq = view.getUint8(1);
+		if (index === 0) {
+			this.seq = seq;
+			this.parts = [];
+		} else if (seq !== this.seq || index !== this.parts.length) {
+			// A fragment went missing, wait for the next message
+			this.seq = null;
+			this.parts = [];
+			return null;
+		}
+		const start = view.byteOffset + HEADER_SIZE;
+		this.parts.push(new Uint8Array(view.buffer.slice(start, view.byteOffset + view.byteLength)));
+		if (!(first & LAST)) return null;
+		const payload = new Uint8Array(this.parts.reduce((n, part) => n + part.length, 0));
+		let offset = 0;
+		for (const part of this.parts) {
+			payload.set(part, offset);
+			offset += part.length;
+		}
+		this.seq = null;
+		this.parts = [];
+		return new DataView(payload.buffer);
+	}
+}
@@ -0,0 +1,43 @@
+// Decoder for the packed BLE readings payload sent by the NanoC6 firmware.
+// Layout must match src/nanoc6/readings_codec.py.
+
+export const READINGS_VERSION = 1;
+export const READINGS_PAYLOAD_SIZE = 15;
+
+export interface Readings {
+	seq: number;
+	timestamp: Date;
+	temperature: number;
+	humidity: number;
+	pressure: number;
+}
+
+/** Decode a readings payload, or return null for anything else (e.g. 'REGISTERED') */
+export const decodeReadings = (view: DataView): Readings | null => {
+	if (view.byteLength < READINGS_PAYLOAD_SIZE || view.getUint8(0) !== READINGS_VERSION)
+		return null;
+	return {
+		seq: view.getUint16(1, true),
+		timestamp: new Date(view.getUint32(3, true) * 1000),
+		temperature: view.getInt16(7, true) / 100,
+		humidity: view.getUint16(9, true) / 100,
+		pressure: view.getUint32(11, true) / 100
+	};
+};
+
+/** Decode a stream frame of back-to-back readings payloads */
+export const decodeReadingsFrame = (view: DataView): Readings[] => {
+	const readings: Readings[] = [];
+	for (
+		let offset = 0;
+		offset + READINGS_PAYLOAD_SIZE <= view.byteLength;
+		offset += READINGS_PAYLOAD_SIZE
+	) {
+		const reading = decodeReadings(
+			new DataView(view.buffer, view.byteOffset + offset, READINGS_PAYLOAD_SIZE)
+		);
+		if (!reading) break;
+		readings.push(reading);
+	}
+	return readings;
+};
@@ -0,0 +1,40 @@
+import random
+import time
+
+
+class Backoff:
+    """Exponential backoff with full jitter
+
+    After n consecutive failures the next attempt waits a random time
+    between 0 and min(cap_ms, base_ms * 2**n), so a fleet that failed
+    together spreads its retries out instead of retrying in lockstep.
+    success() resets it.
+    """
+
+    def __init__(self, base_ms=1000, cap_ms=300000):
+        self.base_ms = base_ms
+        self.cap_ms = cap_ms
+        self.failures = 0
+        self.delay_ms = 0  # Last delay handed out
+        self._until = 0
+
+    def ready(self):
+        """True once the current backoff delay has passed"""
+        return not self.failures or time.ticks_diff(time.ticks_ms(), self._until) >= 0
+
+    def remaining_ms(self):
+        if not self.failures:
+            return 0
+        return max(0, time.ticks_diff(self._until, time.ticks_ms()))
+
+    def failure(self):
+        """Record a failure and return the ms to wait before trying again"""
+        ceiling = min(self.cap_ms, self.base_ms << min(self.failures, 16))
+        self.failures += 1
+        self.delay_ms = random.randint(0, ceiling)
+        self._until = time.ticks_add(time.ticks_ms(), self.delay_ms)
+        return self.delay_ms
+
+    def success(self):
+        self.failures = 0
+        self.delay_ms = 0
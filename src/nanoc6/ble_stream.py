@@ -0,0 +1,52 @@
+# Notifications longer than one ATT payload (MTU - 3) are split into
+# fragments, each with a 2-byte header:
+#   byte 0  0x80 | 0x40 on the last fragment | fragment index (0-63)
+#   byte 1  message sequence number, wraps at 256
+# Payloads that fit go out unchanged. Readings payloads start with their
+# version byte and text replies are ASCII, so neither has bit 7 set.
+FRAGMENT = 0x80
+LAST = 0x40
+INDEX_MASK = 0x3F
+HEADER_SIZE = 2
+DEFAULT_MTU = 23
+
+
+def fragment(payload, msg_seq, max_len):
+    """Yield the notifications needed to send payload in max_len pieces"""
+    if len(payload) <= max_len:
+        yield payload
+        return
+    chunk = max_len - HEADER_SIZE
+    count = (len(payload) + chunk - 1) // chunk
+    if count > INDEX_MASK + 1:
+        raise ValueError('payload too large for MTU')
+    view = memoryview(payload)
+    for index in range(count):
+        header = FRAGMENT | index | (LAST if index == count - 1 else 0)
+        yield bytes((header, msg_seq & 0xFF)) + view[index * chunk:(index + 1) * chunk]
+
+
+class Reassembler:
+    """Rebuild payloads from notifications, dropping incomplete messages"""
+
+    def __init__(self):
+        self._seq = None
+        self._parts = []
+
+    def feed(self, data):
+        """Return the complete payload once its last fragment arrives, else None"""
+        if not data or not data[0] & FRAGMENT:
+            return bytes(data)
+        index, seq = data[0] & INDEX_MASK, data[1]
+        if index == 0:
+            self._seq, self._parts = seq, []
+        elif seq != self._seq or index != len(self._parts):
+            # A fragment went missing, wait for the next message
+            self._seq, self._parts = None, []
+            return None
+        self._parts.append(bytes(data[HEADER_SIZE:]))
+        if not data[0] & LAST:
+            return None
+        payload = b''.join(self._parts)
+        self._seq, self._parts = None, []
+        return payload
@@ -0,0 +1,103 @@
+"""Time and heap used by each import and setup() stage during boot
+
+main.py calls start() before importing the firmware. The firmware calls
+mark('import') as setup() begins, mark() after each setup() stage and
+report() once setup is done. While the profiler is off, mark() and
+report() do nothing.
+"""
+import gc
+import sys
+import time
+
+try:
+    import builtins
+except ImportError:
+    builtins = None
+
+_records = []  # (kind, name, depth, us, heap bytes allocated)
+_active = False
+_import = None
+_depth = 0
+_started = 0
+_last = 0
+_last_alloc = 0
+
+
+def _mem_alloc():
+    return gc.mem_alloc() if hasattr(gc, 'mem_alloc') else 0
+
+
+def _profiled_import(name, globals=None, locals=None, fromlist=(), level=0):
+    global _depth
+    label = name
+    # Only a module's first import loads it; the rest are dict lookups. For
+    # `from package import module` the package may be loaded already.
+    if name in sys.modules:
+        module = sys.modules[name]
+        new = [f'{name}.{item}' for item in fromlist or ()
+               if item != '*' and not hasattr(module, item)]
+        if not new:
+            return _import(name, globals, locals, fromlist, level)
+        label = ', '.join(new)
+    # Reserve the row now so a module is listed before the ones it imports
+    row = len(_records)
+    _records.append(None)
+    _depth += 1
+    start = time.ticks_us()
+    alloc = _mem_alloc()
+    try:
+        return _import(name, globals, locals, fromlist, level)
+    finally:
+        _depth -= 1
+        _records[row] = ('import', label, _depth, time.ticks_diff(time.ticks_us(), start),
+                         _mem_alloc() - alloc)
+
+
+def start(imports=True):
+    """Start profiling; with imports, time every module loaded from now on"""
+    global _active, _import, _started, _last, _last_alloc
+    del _records[:]
+    gc.collect()
+    _active = True
+    _started = _last = time.ticks_us()
+    _last_alloc = _mem_alloc()
+    if imports and builtins and _import is None:
+        _import = builtins.__import__
+        builtins.__import__ = _profiled_import
+
+
+def mark(stage):
+    """Record the time and heap used since the previous mark"""
+    global _last, _last_alloc
+    if not _active:
+        return
+    now = time.ticks_us()
+    alloc = _mem_alloc()
+    _records.append(('stage', stage, 0, time.ticks_diff(now, _last), alloc - _last_alloc))
+    _last = time.ticks_us()
+    _last_alloc = _mem_alloc()
+
+
+def stop():
+    """Stop profiling and return the records"""
+    global _active, _import
+    _active = False
+    if _import is not None:
+        builtins.__import__ = _import
+        _import = None
+    return _records
+
+
+def report():
+    """Print the boot profile and stop profiling"""
+    if not _active:
+        return
+    total = time.ticks_diff(time.ticks_us(), _started)
+    stop()
+    gc.collect()
+    print('--- boot profile ---')
+    print(f'{"":7} {"ms":>8} {"heap KB":>8}')
+    for kind, name, depth, us, heap in _records:
+        print(f'{kind:7} {us / 1000:8.1f} {heap / 1024:8.1f}  {"  " * depth}{name}')
+    free = f', {gc.mem_free() // 1024} KB heap free' if hasattr(gc, 'mem_free') else ''
+    print(f'boot    {total / 1000:8.1f} ms{free}')
@@ -0,0 +1,121 @@
+from array import array
+import time
+
+
+class EventRing:
+    """Fixed-size FIFO that carries BLE IRQ events to the main context
+
+    Every slot is allocated up front. push() only copies the event in, so
+    the IRQ handler returns at once and never runs a command itself. The
+    IRQ only moves the tail and the dispatcher only moves the head, so
+    neither needs to lock out the other. When the ring is full new events
+    are dropped and counted rather than blocking the BLE stack.
+    """
+
+    def __init__(self, capacity=16, data_size=20):
+        self.capacity = capacity
+        self.data_size = data_size  # Longer writes are truncated
+        self._events = array('B', bytes(capacity))
+        self._handles = array('H', bytes(2 * capacity))
+        self._args = array('H', bytes(2 * capacity))
+        self._lengths = array('B', bytes(capacity))
+        self._times = array('I', bytes(4 * capacity))
+        self._data = bytearray(capacity * data_size)
+        self._head = 0  # Events popped so far
+        self._tail = 0  # Events pushed so far
+        # The event pop_into() returned last
+        self.conn_handle = 0
+        self.arg = 0
+        self.length = 0
+        # Counters
+        self.pushed = 0
+        self.handled = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.max_latency_ms = 0
+        self.total_latency_ms = 0
+
+    @property
+    def depth(self):
+        return self._tail - self._head
+
+    def push(self, event, conn_handle=0, arg=0, data=None):
+        """Queue an event from the IRQ handler; False if the ring was full"""
+        depth = self._tail - self._head
+        if depth >= self.capacity:
+            self.dropped += 1
+            return False
+        i = self._tail % self.capacity
+        self._events[i] = event
+        self._handles[i] = conn_handle
+        self._args[i] = arg
+        self._times[i] = time.ticks_ms()
+        length = 0
+        if data:
+            length = min(len(data), self.data_size)
+            start = i * self.data_size
+            self._data[start:start + length] = data[:length] if length < len(data) else data
+        self._lengths[i] = length
+        self._tail += 1
+        self.pushed += 1
+        if depth + 1 > self.max_depth:
+            self.max_depth = depth + 1
+        return True
+
+    def pop(self):
+        """Oldest event as (event, conn_handle, arg, data), or None if empty"""
+        if self._head == self._tail:
+            return None
+        i = self._head % self.capacity
+        start = i * self.data_size
+        event = (self._events[i], self._handles[i], self._args[i],
+                 bytes(self._data[start:start + self._lengths[i]]))
+        self._advance(i)
+        return event
+
+    def pop_into(self, value):
+        """pop() without allocating: the oldest event's code, or 0 if empty
+
+        The data is copied into value, a bytearray of at least data_size
+        bytes, and conn_handle, arg and length describe the event until
+        the next call.
+        """
+        if self._head == self._tail:
+            return 0
+        i = self._head % self.capacity
+        start = i * self.data_size
+        length = self._lengths[i]
+        data = self._data
+        for j in range(length):
+            value[j] = data[start + j]
+        event = self._events[i]
+        self.conn_handle = self._handles[i]
+        self.arg = self._args[i]
+        self.length = length
+        self._advance(i)
+        return event
+
+    def _advance(self, i):
+        latency = time.ticks_diff(time.ticks_ms(), self._times[i])
+        self._head += 1
+        self.handled += 1
+        self.total_latency_ms += latency
+        if latency > self.max_latency_ms:
+            self.max_latency_ms = latency
+
+    def clear(self):
+        """Drop queued events, e.g. once BLE is off"""
+        self._head = self._tail
+
+    def stats(self):
+        """Counters for diagnostics"""
+        handled = self.handled
+        return {
+            'depth': self.depth,
+            'max_depth': self.max_depth,
+            'pushed': self.pushed,
+            'handled': handled,
+            'dropped': self.dropped,
+            'mean_latency_ms': self.total_latency_ms // handled if handled else 0,
+            'max_latency_ms': self.max_latency_ms,
+        }
@@ -0,0 +1,121 @@
+import asyncio
+import socket
+
+from nanoc6.http_pool import (HTTPPool, Response, _StaleConnection, _ticks_diff, _ticks_ms,
+                              body_framing, parse_header_line, parse_status_line)
+
+
+class AsyncHTTPPool(HTTPPool):
+    """HTTPPool for asyncio, so a slow server only stalls the task waiting on it
+
+    get(), post(), patch() and request() are coroutines. The TLS handshake
+    and every read yield to other tasks. Requests from several tasks take
+    turns on the one keep-alive connection, and each exchange is bounded
+    by the timeout so a stalled server can't hold the connection forever.
+    The address is resolved once and reused, as in HTTPPool; that one
+    lookup still blocks.
+    """
+
+    def __init__(self, base_url, timeout=10, idle_timeout_ms=30000):
+        super().__init__(base_url, timeout, idle_timeout_ms)
+        self._lock = asyncio.Lock()
+
+    async def request(self, method, url, data=None, json_data=None, headers=None):
+        """Send a request over the pooled connection and read the response"""
+        async with self._lock:
+            # The request buffer is shared, so only pack it once it's our turn
+            request = self._prepare(method, url, data, json_data, headers)
+            if self._sock and _ticks_diff(_ticks_ms(), self._last_used) > self.idle_timeout_ms:
+                self.close()
+
+            try:
+                response = await asyncio.wait_for_ms(self._send(request),
+                                                     int(self.timeout * 1000))
+            except Exception:
+                self.close()
+                raise
+
+            self._finish(response)
+            return response
+
+    async def _connect(self):
+        if self._addr is None:
+            self._addr = socket.getaddrinfo(self.host, self.port, 0, socket.SOCK_STREAM)[0]
+        address = self._addr[-1]
+        try:
+            # Reader and writer are the same stream object on MicroPython
+            self._sock, _ = await asyncio.open_connection(
+                address[0], address[1], ssl=self._tls_context() if self.tls else None,
+                server_hostname=self.host)
+        except Exception:
+            self._addr = None
+            raise
+        self.connects += 1
+        self._rfile = self._sock
+
+    async def _send(self, request):
+        if self._sock is None:
+            await self._connect()
+            return await self._exchange(request)
+        try:
+            return await self._exchange(request)
+        except _StaleConnection:
+            # The server never saw the request, so it is safe to send again
+            self.close()
+            await self._connect()
+            return await self._exchange(request)
+
+    async def _exchange(self, request):
+        try:
+            self._sock.write(request)
+            await self._sock.drain()
+        except OSError:
+            raise _StaleConnection()
+        # As in HTTPPool, a failed or timed-out read isn't retried, as the
+        # server may have acted on the request; only a close before any byte
+        status_line = await self._sock.readline()
+        if not status_line:
+            raise _StaleConnection()
+        return await self._read_response(status_line)
+
+    async def _read_response(self, status_line):
+        status_code, reason = parse_status_line(status_line)
+
+        headers = {}
+        while True:
+            line = await self._sock.readline()
+            if not line or line == b'\r\n':
+                break
+            parse_header_line(line, headers)
+
+        framing = body_framing(status_code, headers)
+        if framing == 'chunked':
+            content = await self._read_chunked()
+        elif framing == 'length':
+            content = await self._read_exact(int(headers['content-length']))
+        elif framing == 'none':
+            content = b''
+        else:
+            content = await self._sock.read()
+        return Response(status_code, reason, headers, content)
+
+    async def _read_exact(self, size):
+        chunks = []
+        while size > 0:
+            chunk = await self._sock.read(size)
+            if not chunk:
+                raise OSError('connection closed mid-response')
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b''.join(chunks)
+
+    async def _read_chunked(self):
+        chunks = []
+        while True:
+            size = int((await self._sock.readline()).split(b';', 1)[0], 16)
+            if not size:
+                while (await self._sock.readline()) not in (b'\r\n', b''):
+                    pass
+                return b''.join(chunks)
+            chunks.append(await self._read_exact(size))
+            await self._sock.readline()
@@ -0,0 +1,333 @@
+import socket
+import ssl
+import json
+import time
+
+try:
+    _ticks_ms = time.ticks_ms
+    _ticks_diff = time.ticks_diff
+except AttributeError:  # CPython, e.g. when benchmarking on a host
+    def _ticks_ms():
+        return int(time.monotonic() * 1000)
+
+    def _ticks_diff(a, b):
+        return a - b
+
+
+class _StaleConnection(OSError):
+    pass
+
+
+class Response:
+    """Fully read HTTP response with the parts of the requests2 API we use"""
+
+    def __init__(self, status_code, reason, headers, content):
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+    def json(self):
+        return json.loads(self.content)
+
+    def close(self):
+        # The body has already been read and the socket stays in the pool
+        pass
+
+
+def parse_status_line(line):
+    """Status code and reason from b'HTTP/1.1 200 OK\\r\\n'"""
+    parts = line.split(None, 2)
+    return int(parts[1]), parts[2].strip().decode('utf-8') if len(parts) > 2 else ''
+
+
+def parse_header_line(line, headers):
+    key, _, value = line.decode('utf-8').partition(':')
+    headers[key.strip().lower()] = value.strip()
+
+
+def body_framing(status_code, headers):
+    """How the body is delimited: 'chunked', 'length', 'none' or 'close'"""
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        return 'chunked'
+    if 'content-length' in headers:
+        return 'length'
+    if status_code in (204, 304) or 100 <= status_code < 200:
+        return 'none'
+    # No framing: the body runs until the server closes
+    headers['connection'] = 'close'
+    return 'close'
+
+
+def _put_int(buffer, pos, value):
+    """Write a non-negative int as ASCII digits at pos; returns the end"""
+    end = pos + 1
+    rest = value // 10
+    while rest:
+        end += 1
+        rest //= 10
+    i = end
+    while True:
+        i -= 1
+        buffer[i] = 0x30 + value % 10
+        value //= 10
+        if not value:
+            return end
+
+
+class HTTPPool:
+    """Keep-alive HTTP(S) client holding one connection to a single host
+
+    The resolved address and TLS session are cached, so even a reconnect
+    after the server drops the idle connection skips DNS and resumes TLS
+    where the stack supports it. A request that fails on a reused
+    connection before any response arrives is retried once on a new one.
+
+    Each request is packed into one buffer that is kept between requests.
+    Request heads are encoded once per method, URL and headers object, so
+    callers that keep their headers dicts around send repeated requests
+    without building any strings.
+    """
+
+    HEAD_CACHE_SIZE = 8
+
+    def __init__(self, base_url, timeout=10, idle_timeout_ms=30000):
+        scheme, _, rest = base_url.partition('://')
+        netloc = rest.split('/', 1)[0]
+        self.tls = scheme == 'https'
+        self.host, _, port = netloc.partition(':')
+        self.port = int(port) if port else (443 if self.tls else 80)
+        self.origin = f'{scheme}://{netloc}'
+        self.timeout = timeout
+        self.idle_timeout_ms = idle_timeout_ms
+        self._addr = None
+        self._context = None
+        self._session = None
+        self._sock = None
+        self._rfile = None
+        self._last_used = 0
+        self._heads = []  # (method, url, headers, json, encoded head), newest last
+        self._out = bytearray(512)  # Grown to fit the largest request
+        self._out_view = memoryview(self._out)
+        # Counters for benchmarking and diagnostics
+        self.requests = 0
+        self.connects = 0
+        self.resumed = 0
+
+    def get(self, url, headers=None):
+        return self.request('GET', url, headers=headers)
+
+    def post(self, url, data=None, json=None, headers=None):
+        return self.request('POST', url, data, json, headers)
+
+    def patch(self, url, data=None, json=None, headers=None):
+        return self.request('PATCH', url, data, json, headers)
+
+    def request(self, method, url, data=None, json_data=None, headers=None):
+        """Send a request over the pooled connection and read the response"""
+        request = self._prepare(method, url, data, json_data, headers)
+
+        if self._sock and _ticks_diff(_ticks_ms(), self._last_used) > self.idle_timeout_ms:
+            # The server has probably dropped it; don't find out mid-request
+            self.close()
+
+        try:
+            response = self._send(request)
+        except Exception:
+            self.close()
+            raise
+
+        self._finish(response)
+        return response
+
+    def _prepare(self, method, url, data, json_data, headers):
+        """Pack the request head and body into the request buffer, returning a view of it"""
+        body = data
+        if json_data is not None:
+            body = json.dumps(json_data)
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        head = self._head(method, url, headers, json_data is not None)
+        length = len(body) if body else 0
+
+        # Head, Content-Length digits, blank line and body
+        size = len(head) + 24 + length
+        if size > len(self._out):
+            self._out = bytearray(size)
+            self._out_view = memoryview(self._out)
+        out = self._out
+        end = len(head)
+        out[:end] = head
+        end = _put_int(out, end, length)
+        out[end:end + 4] = b'\r\n\r\n'
+        end += 4
+        if length:
+            out[end:end + length] = body
+            end += length
+        return self._out_view[:end]
+
+    def _head(self, method, url, headers, json):
+        """Encoded request head up to the Content-Length value, cached"""
+        for entry in self._heads:
+            if entry[2] is headers and entry[3] == json and entry[0] == method and entry[1] == url:
+                return entry[4]
+        if not url.startswith(self.origin):
+            raise ValueError(f'{url} is not on {self.origin}')
+        head = self._encode(method, url[len(self.origin):] or '/', headers, json)
+        if len(self._heads) >= self.HEAD_CACHE_SIZE:
+            self._heads.pop(0)
+        # Holding on to headers keeps its id from being reused by another dict
+        self._heads.append((method, url, headers, json, head))
+        return head
+
+    def _finish(self, response):
+        self.requests += 1
+        self._last_used = _ticks_ms()
+        self._save_session()
+        if response.headers.get('connection', '').lower() == 'close':
+            self.close()
+
+    def close(self):
+        """Close the pooled connection, keeping the address and TLS session"""
+        if self._sock:
+            self._save_session()
+            try:
+                if self._rfile is not self._sock:
+                    self._rfile.close()
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._rfile = None
+
+    def _encode(self, method, path, headers, json):
+        lines = [f'{method} {path} HTTP/1.1', f'Host: {self.host}', 'Connection: keep-alive']
+        for key, value in (headers or {}).items():
+            lines.append(f'{key}: {value}')
+        if json and not any(key.lower() == 'content-type' for key in headers or ()):
+            lines.append('Content-Type: application/json')
+        lines.append('Content-Length: ')
+        return '\r\n'.join(lines).encode('utf-8')
+
+    def _connect(self):
+        if self._addr is None:
+            self._addr = socket.getaddrinfo(self.host, self.port, 0, socket.SOCK_STREAM)[0]
+        family, socktype, proto, _, address = self._addr
+        sock = socket.socket(family, socktype, proto)
+        try:
+            sock.settimeout(self.timeout)
+            if hasattr(socket, 'TCP_NODELAY'):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.connect(address)
+            if self.tls:
+                sock = self._wrap(sock)
+        except Exception:
+            sock.close()
+            # The cached address may be what went stale
+            self._addr = None
+            raise
+        self.connects += 1
+        self._sock = sock
+        self._rfile = sock.makefile('rb') if hasattr(sock, 'makefile') else sock
+
+    def _tls_context(self):
+        if self._context is None:
+            # Devices carry no CA bundle, matching requests2's behaviour
+            self._context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+            if hasattr(self._context, 'check_hostname'):
+                self._context.check_hostname = False
+            self._context.verify_mode = ssl.CERT_NONE
+        return self._context
+
+    def _wrap(self, sock):
+        if not hasattr(ssl, 'SSLContext'):
+            return ssl.wrap_socket(sock, server_hostname=self.host)
+        context = self._tls_context()
+        if self._session is not None:
+            sock = context.wrap_socket(sock, server_hostname=self.host, session=self._session)
+            if getattr(sock, 'session_reused', False):
+                self.resumed += 1
+            return sock
+        return context.wrap_socket(sock, server_hostname=self.host)
+
+    def _save_session(self):
+        session = getattr(self._sock, 'session', None)
+        if session is not None:
+            self._session = session
+
+    def _send(self, request):
+        if self._sock is None:
+            self._connect()
+            return self._exchange(request)
+        try:
+            return self._exchange(request)
+        except _StaleConnection:
+            # The server never saw the request, so it is safe to send again
+            self.close()
+            self._connect()
+            return self._exchange(request)
+
+    def _exchange(self, request):
+        try:
+            # One write, so the body isn't held back waiting for an ACK
+            self._write(request)
+        except OSError:
+            raise _StaleConnection()
+        # Once sent, the server may have acted on it: a POST may be committed
+        # even if the reply times out, so only a close before any byte of the
+        # reply, how servers drop an idle connection, counts as stale
+        status_line = self._rfile.readline()
+        if not status_line:
+            raise _StaleConnection()
+        return self._read_response(status_line)
+
+    def _write(self, data):
+        send = getattr(self._sock, 'sendall', None) or self._sock.write
+        send(data)
+
+    def _read_response(self, status_line):
+        status_code, reason = parse_status_line(status_line)
+
+        headers = {}
+        while True:
+            line = self._rfile.readline()
+            if not line or line == b'\r\n':
+                break
+            parse_header_line(line, headers)
+
+        framing = body_framing(status_code, headers)
+        if framing == 'chunked':
+            content = self._read_chunked()
+        elif framing == 'length':
+            content = self._read_exact(int(headers['content-length']))
+        elif framing == 'none':
+            content = b''
+        else:
+            content = self._rfile.read()
+        return Response(status_code, reason, headers, content)
+
+    def _read_exact(self, size):
+        chunks = []
+        while size > 0:
+            chunk = self._rfile.read(size)
+            if not chunk:
+                raise OSError('connection closed mid-response')
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b''.join(chunks)
+
+    def _read_chunked(self):
+        chunks = []
+        while True:
+            size = int(self._rfile.readline().split(b';', 1)[0], 16)
+            if not size:
+                # Skip trailers up to the blank line
+                while self._rfile.readline() not in (b'\r\n', b''):
+                    pass
+                return b''.join(chunks)
+            chunks.append(self._read_exact(size))
+            self._rfile.readline()
@@ -0,0 +1,201 @@
+"""Heap, GC and hot-function counters that the firmware can report
+
+tick() once per main loop iteration records how many heap bytes the
+iteration allocated; a drop in gc.mem_alloc() between ticks means an
+automatic collection ran. collect() runs and times a collection, so the
+firmware can collect while idle instead of in the middle of a request.
+@timed and @timed_async count calls, time and heap bytes of a function.
+snapshot() gathers everything into one dict for a BLE command or an
+upload.
+
+Allocation figures are gc.mem_alloc() differences, so they are only
+exact when no collection ran in between; such samples are skipped.
+"""
+import gc
+import time
+
+try:
+    import esp32
+except ImportError:
+    esp32 = None
+
+_functions = {}  # name -> [calls, errors, total us, max us, total bytes, max bytes]
+_started = time.ticks_ms()
+
+# Loop iterations
+_iterations = 0
+_last_alloc = None
+_loop_bytes = 0
+_loop_samples = 0
+_loop_max = 0
+
+# Collections
+_auto_collections = 0
+_collections = 0
+_gc_total_us = 0
+_gc_max_us = 0
+_min_free = None
+
+
+def _mem_alloc():
+    return gc.mem_alloc() if hasattr(gc, 'mem_alloc') else 0
+
+
+def _mem_free():
+    return gc.mem_free() if hasattr(gc, 'mem_free') else 0
+
+
+def tick():
+    """Record the heap allocated since the previous tick"""
+    global _iterations, _last_alloc, _loop_bytes, _loop_samples, _loop_max, _auto_collections
+    global _min_free
+    alloc = _mem_alloc()
+    _iterations += 1
+    if _last_alloc is not None:
+        used = alloc - _last_alloc
+        if used < 0:
+            _auto_collections += 1
+        else:
+            _loop_bytes += used
+            _loop_samples += 1
+            if used > _loop_max:
+                _loop_max = used
+    free = _mem_free()
+    if _min_free is None or free < _min_free:
+        _min_free = free
+    # Read again so the bookkeeping above isn't charged to the next iteration
+    _last_alloc = _mem_alloc()
+
+
+def collect():
+    """Run a timed collection; returns the pause in microseconds"""
+    global _collections, _gc_total_us, _gc_max_us, _last_alloc
+    start = time.ticks_us()
+    gc.collect()
+    pause = time.ticks_diff(time.ticks_us(), start)
+    _collections += 1
+    _gc_total_us += pause
+    if pause > _gc_max_us:
+        _gc_max_us = pause
+    _last_alloc = None  # The next tick would otherwise count this as automatic
+    return pause
+
+
+def _record(name, start_us, start_alloc, failed):
+    us = time.ticks_diff(time.ticks_us(), start_us)
+    used = _mem_alloc() - start_alloc
+    entry = _functions[name]
+    entry[0] += 1
+    if failed:
+        entry[1] += 1
+    entry[2] += us
+    if us > entry[3]:
+        entry[3] = us
+    if used > 0:
+        entry[4] += used
+        if used > entry[5]:
+            entry[5] = used
+
+
+def timed(name):
+    """Decorator counting calls, time and heap bytes of a function"""
+    def decorator(func):
+        _functions[name] = [0, 0, 0, 0, 0, 0]
+
+        def wrapper(*args, **kwargs):
+            start_alloc = _mem_alloc()
+            start = time.ticks_us()
+            failed = True
+            try:
+                result = func(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                _record(name, start, start_alloc, failed)
+        return wrapper
+    return decorator
+
+
+def timed_async(name):
+    """timed() for coroutines; the time includes what they await"""
+    def decorator(func):
+        _functions[name] = [0, 0, 0, 0, 0, 0]
+
+        async def wrapper(*args, **kwargs):
+            start_alloc = _mem_alloc()
+            start = time.ticks_us()
+            failed = True
+            try:
+                result = await func(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                _record(name, start, start_alloc, failed)
+        return wrapper
+    return decorator
+
+
+def largest_free_block():
+    """Largest heap block one allocation can get, after a collection
+
+    Found by bisecting with trial allocations; a failed allocation makes
+    MicroPython collect before it gives up, so this takes several
+    collections and belongs in diagnostics, not the main loop.
+    """
+    global _last_alloc
+    gc.collect()
+    low, high = 0, _mem_free()
+    while low < high:
+        size = (low + high + 1) // 2
+        try:
+            bytearray(size)  # Freed straight away; only whether it fits matters
+            low = size
+        except MemoryError:
+            high = size - 1
+    _last_alloc = None
+    return low
+
+
+def idf_heap():
+    """(free, largest block, lowest free) of the ESP-IDF data heap
+
+    WiFi, BLE and TLS allocate from this heap rather than the Python one,
+    so a TLS handshake can fail here while gc.mem_free() looks healthy.
+    """
+    if esp32 is None or not hasattr(esp32, 'idf_heap_info'):
+        return 0, 0, 0
+    regions = esp32.idf_heap_info(esp32.HEAP_DATA)
+    return (sum(region[1] for region in regions),
+            max((region[2] for region in regions), default=0),
+            sum(region[3] for region in regions))
+
+
+def snapshot(largest=False):
+    """All counters as a dict of plain numbers; largest adds the costly block probe"""
+    idf_free, idf_largest, idf_min_free = idf_heap()
+    stats = {
+        'uptime_s': time.ticks_diff(time.ticks_ms(), _started) // 1000,
+        'heap_free': _mem_free(),
+        'heap_alloc': _mem_alloc(),
+        'heap_min_free': _min_free or 0,
+        'idf_free': idf_free,
+        'idf_largest': idf_largest,
+        'idf_min_free': idf_min_free,
+        'loops': _iterations,
+        'loop_alloc_mean': _loop_bytes // _loop_samples if _loop_samples else 0,
+        'loop_alloc_max': _loop_max,
+        'gc_auto': _auto_collections,
+        'gc_runs': _collections,
+        'gc_mean_us': _gc_total_us // _collections if _collections else 0,
+        'gc_max_us': _gc_max_us,
+    }
+    if largest:
+        stats['heap_largest'] = largest_free_block()
+    functions = {}
+    for name, (calls, errors, total_us, max_us, total_bytes, max_bytes) in _functions.items():
+        if calls:
+            # calls, errors, mean us, max us, mean bytes, max bytes
+            functions[name] = [calls, errors, total_us // calls, max_us,
+                               total_bytes // calls, max_bytes]
+    stats['functions'] = functions
+    return stats
@@ -0,0 +1,41 @@
+from nanoc6.http_pool import _put_int
+
+
+class ReadingForm:
+    """URL-encoded reading rows packed into one buffer that is kept
+
+    The device's MAC address and sensor name never change, so they are
+    encoded once. pack() writes the three values after them as fixed-point
+    decimals with two places, which is all the ENV unit resolves, and
+    returns a view of the body that stays valid until the next pack().
+    """
+
+    def __init__(self, mac_address, sensor, size=128):
+        prefix = f'mac_address={mac_address}&sensor={sensor}'.encode()
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        self._buffer[:len(prefix)] = prefix
+        self._prefix_len = len(prefix)
+
+    def pack(self, temperature, humidity, pressure):
+        """Encode one reading and return a view of the whole body"""
+        end = self._field(self._prefix_len, b'&temperature=', temperature)
+        end = self._field(end, b'&humidity=', humidity)
+        end = self._field(end, b'&pressure=', pressure)
+        return self._view[:end]
+
+    def _field(self, pos, name, value):
+        buffer = self._buffer
+        end = pos + len(name)
+        buffer[pos:end] = name
+        hundredths = int(round(value * 100))
+        if hundredths < 0:
+            buffer[end] = 0x2D  # '-'
+            end += 1
+            hundredths = -hundredths
+        end = _put_int(buffer, end, hundredths // 100)
+        buffer[end] = 0x2E  # '.'
+        fraction = hundredths % 100
+        buffer[end + 1] = 0x30 + fraction // 10
+        buffer[end + 2] = 0x30 + fraction % 10
+        return end + 3
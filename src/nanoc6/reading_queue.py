@@ -0,0 +1,213 @@
+import os
+import struct
+import binascii
+
+# Fixed-size record: sequence, timestamp, temperature, humidity, pressure, CRC32
+_RECORD_FORMAT = '<IIfffI'
+RECORD_SIZE = struct.calcsize(_RECORD_FORMAT)
+_BODY_SIZE = RECORD_SIZE - 4
+_ACK_FORMAT = '<II'  # acknowledged sequence, CRC32
+
+
+def _exists(path):
+    try:
+        os.stat(path)
+        return True
+    except OSError:
+        return False
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _replace(src, dst):
+    """Rename src over dst, even on filesystems that won't overwrite"""
+    try:
+        os.rename(src, dst)
+    except OSError:
+        _remove(dst)
+        os.rename(src, dst)
+
+
+class ReadingQueue:
+    """Append-only store-and-forward log of readings on flash
+
+    Readings are appended as fixed-size, checksummed records. Confirmed
+    uploads only advance an acknowledgement cursor kept in a separate file,
+    so a power cut at any point leaves either the old or the new state.
+    """
+
+    def __init__(self, path='readings.q', max_records=1024):
+        self.path = path
+        self.ack_path = path + '.ack'
+        self.max_records = max_records
+        self.acked = 0  # Highest sequence confirmed by the cloud
+        self.next_seq = 1
+        self.pending = 0  # Records not yet confirmed
+        self._records = 0  # Records in the log file, confirmed or not
+        self._head = 0  # Byte offset of the oldest pending record
+        self._buf = bytearray(RECORD_SIZE)
+        self._recover()
+
+    def _recover(self):
+        """Rebuild queue state from flash after boot or power loss"""
+        # A compaction interrupted after removing the old log left a complete copy
+        tmp_path = self.path + '.tmp'
+        if _exists(self.path):
+            _remove(tmp_path)
+        elif _exists(tmp_path):
+            os.rename(tmp_path, self.path)
+
+        self.acked = self._read_ack(self.ack_path)
+        if not self.acked:
+            self.acked = self._read_ack(self.ack_path + '.tmp')
+
+        last_seq = self.acked
+        damaged = False
+        self._records = 0
+        self.pending = 0
+        self._head = -1
+        try:
+            with open(self.path, 'rb') as f:
+                offset = 0
+                while True:
+                    n = f.readinto(self._buf)
+                    if not n:
+                        break
+                    if n < RECORD_SIZE or not self._valid(self._buf):
+                        # Torn write at the tail or a corrupt record
+                        damaged = True
+                        break
+                    seq = struct.unpack_from('<I', self._buf)[0]
+                    if seq <= last_seq and seq > self.acked:
+                        damaged = True
+                        break
+                    if seq > self.acked:
+                        if self._head < 0:
+                            self._head = offset
+                        self.pending += 1
+                    last_seq = max(last_seq, seq)
+                    self._records += 1
+                    offset += RECORD_SIZE
+        except OSError:
+            pass
+
+        if self._head < 0:
+            self._head = self._records * RECORD_SIZE
+        self.next_seq = last_seq + 1
+
+        if damaged:
+            print('Reading queue damaged, recovering valid records')
+            self._compact()
+        elif self._records and not self.pending:
+            self._clear_log()
+        print(f'Reading queue: {self.pending} pending')
+
+    def _read_ack(self, path):
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            seq, crc = struct.unpack(_ACK_FORMAT, data)
+            if binascii.crc32(data[:4]) & 0xffffffff == crc:
+                return seq
+        except (OSError, ValueError):
+            pass
+        return 0
+
+    def _valid(self, buf):
+        crc = struct.unpack_from('<I', buf, _BODY_SIZE)[0]
+        return binascii.crc32(memoryview(buf)[:_BODY_SIZE]) & 0xffffffff == crc
+
+    def _write_ack(self, seq):
+        data = bytearray(struct.calcsize(_ACK_FORMAT))
+        struct.pack_into('<I', data, 0, seq)
+        struct.pack_into('<I', data, 4, binascii.crc32(memoryview(data)[:4]) & 0xffffffff)
+        tmp_path = self.ack_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        _replace(tmp_path, self.ack_path)
+
+    def _clear_log(self):
+        _remove(self.path)
+        self._records = 0
+        self._head = 0
+
+    def _compact(self):
+        """Rewrite the log so it holds only valid pending records"""
+        tmp_path = self.path + '.tmp'
+        kept = 0
+        with open(tmp_path, 'wb') as out:
+            for record in self._iter_records(0):
+                if record[0] > self.acked:
+                    out.write(self._pack(*record))
+                    kept += 1
+        _replace(tmp_path, self.path)
+        self._records = kept
+        self.pending = kept
+        self._head = 0
+
+    def _iter_records(self, offset):
+        """Yield valid records starting at a byte offset"""
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                while f.readinto(self._buf) == RECORD_SIZE:
+                    if not self._valid(self._buf):
+                        return
+                    yield struct.unpack_from(_RECORD_FORMAT, self._buf)[:5]
+        except OSError:
+            return
+
+    def _pack(self, seq, timestamp, temperature, humidity, pressure):
+        struct.pack_into(_RECORD_FORMAT[:-1], self._buf, 0,
+                         seq, timestamp, temperature, humidity, pressure)
+        struct.pack_into('<I', self._buf, _BODY_SIZE,
+                         binascii.crc32(memoryview(self._buf)[:_BODY_SIZE]) & 0xffffffff)
+        return self._buf
+
+    def append(self, timestamp, temperature, humidity, pressure):
+        """Persist a reading and return its sequence number"""
+        if self.pending >= self.max_records:
+            # Bounded: give up the oldest eighth of the backlog
+            drop = max(1, self.max_records // 8)
+            print(f'Reading queue full, dropping {drop} oldest readings')
+            self.acked = self.next_seq - self.pending + drop - 1
+            self._write_ack(self.acked)
+            self._compact()
+        elif self._records >= self.max_records:
+            self._compact()
+
+        seq = self.next_seq
+        with open(self.path, 'ab') as f:
+            f.write(self._pack(seq, int(timestamp), temperature, humidity, pressure))
+        self.next_seq += 1
+        self._records += 1
+        self.pending += 1
+        return seq
+
+    def peek(self, limit):
+        """Return up to limit of the oldest pending records"""
+        records = []
+        for record in self._iter_records(self._head):
+            if record[0] > self.acked:
+                records.append(record)
+                if len(records) >= limit:
+                    break
+        return records
+
+    def ack(self, seq):
+        """Confirm every record up to and including seq as uploaded"""
+        if seq <= self.acked:
+            return
+        self.pending -= min(self.pending, seq - self.acked)
+        self.acked = seq
+        self._write_ack(seq)
+        if not self.pending:
+            self._clear_log()
+        else:
+            # Pending records are always the newest, contiguous tail of the log
+            self._head = (self._records - self.pending) * RECORD_SIZE
@@ -0,0 +1,68 @@
+import struct
+import time
+
+# Version 1 payload, little-endian, 15 bytes:
+#   B  version
+#   H  sequence number, wraps at 65536
+#   I  timestamp, Unix seconds
+#   h  temperature, hundredths of a degree C
+#   H  relative humidity, hundredths of a percent
+#   I  pressure, Pa (hundredths of a hPa)
+VERSION = 1
+PAYLOAD_FORMAT = '<BHIhHI'
+PAYLOAD_SIZE = struct.calcsize(PAYLOAD_FORMAT)  # Fits one default-MTU (23) notification
+
+# Ports with a 2000 epoch report time.time() 30 years behind Unix time
+UNIX_EPOCH_OFFSET = 946684800 if time.gmtime(0)[0] == 2000 else 0
+
+
+def _clamp(value, low, high):
+    return low if value < low else high if value > high else value
+
+
+def encode(seq, timestamp, temperature, humidity, pressure, buffer=None):
+    """Pack one reading, into buffer when given to avoid allocating
+
+    timestamp is in device seconds as returned by time.time() and
+    pressure is in hPa, as the ENV unit reports it.
+    """
+    if buffer is None:
+        buffer = bytearray(PAYLOAD_SIZE)
+    struct.pack_into(
+        PAYLOAD_FORMAT, buffer, 0, VERSION, seq & 0xFFFF,
+        int(timestamp) + UNIX_EPOCH_OFFSET,
+        _clamp(int(round(temperature * 100)), -32768, 32767),
+        _clamp(int(round(humidity * 100)), 0, 65535),
+        _clamp(int(round(pressure * 100)), 0, 0xFFFFFFFF))
+    return buffer
+
+
+def stamp(seq, timestamp, buffer):
+    """Renumber and re-timestamp an encoded payload in place, for a repeated sample"""
+    struct.pack_into('<HI', buffer, 1, seq & 0xFFFF, int(timestamp) + UNIX_EPOCH_OFFSET)
+    return buffer
+
+
+def decode(data):
+    """Unpack a payload into a dict, or None if it isn't a known version"""
+    if len(data) < PAYLOAD_SIZE or data[0] != VERSION:
+        return None
+    _, seq, timestamp, temperature, humidity, pressure = struct.unpack_from(PAYLOAD_FORMAT, data)
+    return {
+        'seq': seq,
+        'timestamp': timestamp,
+        'temperature': temperature / 100,
+        'humidity': humidity / 100,
+        'pressure': pressure / 100,
+    }
+
+
+def decode_frame(data):
+    """Unpack a stream frame of back-to-back payloads into a list of dicts"""
+    readings = []
+    for offset in range(0, len(data) - PAYLOAD_SIZE + 1, PAYLOAD_SIZE):
+        reading = decode(data[offset:offset + PAYLOAD_SIZE])
+        if reading is None:
+            break
+        readings.append(reading)
+    return readings
@@ -0,0 +1,85 @@
+import os
+import struct
+import time
+
+try:
+    import esp32
+except ImportError:
+    esp32 = None
+
+_FORMAT = '<BII'  # registered, device id, confirmed at (device epoch s)
+_SIZE = struct.calcsize(_FORMAT)
+_KEY = 'registration'
+
+
+class RegistrationCache:
+    """Last confirmed registration state, kept in NVS or a flash file
+
+    Lets boot trust the previous answer from Supabase instead of blocking
+    on WiFi and a GET. Writes are skipped while nothing has changed and
+    the stored confirmation is younger than refresh_s, to spare the flash.
+    """
+
+    def __init__(self, namespace='nanoc6', path='registration.bin', refresh_s=86400):
+        self.path = path
+        self.refresh_s = refresh_s
+        self.registered = False
+        self.device_id = 0
+        self.confirmed_at = 0
+        self._nvs = None
+        if esp32:
+            try:
+                self._nvs = esp32.NVS(namespace)
+            except Exception:
+                pass
+
+    def load(self):
+        """Read the stored state, returning True if there was one"""
+        data = self._read()
+        if not data or len(data) != _SIZE:
+            return False
+        registered, self.device_id, self.confirmed_at = struct.unpack(_FORMAT, data)
+        self.registered = bool(registered)
+        return True
+
+    def save(self, registered, device_id=0):
+        """Store a state confirmed by the cloud"""
+        device_id = device_id or 0
+        now = time.time()
+        if registered == self.registered and device_id == self.device_id and \
+                self.confirmed_at and now - self.confirmed_at < self.refresh_s:
+            return
+        self.registered = registered
+        self.device_id = device_id
+        self.confirmed_at = now
+        try:
+            self._write(struct.pack(_FORMAT, 1 if registered else 0, device_id, now))
+        except Exception as e:
+            print(f'Registration cache write failed: {e}')
+
+    def _read(self):
+        if self._nvs:
+            buffer = bytearray(_SIZE)
+            try:
+                return buffer[:self._nvs.get_blob(_KEY, buffer)]
+            except OSError:
+                return None  # Nothing stored yet
+        try:
+            with open(self.path, 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write(self, data):
+        if self._nvs:
+            self._nvs.set_blob(_KEY, data)
+            self._nvs.commit()
+            return
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        try:
+            os.rename(tmp, self.path)
+        except OSError:
+            os.remove(self.path)
+            os.rename(tmp, self.path)
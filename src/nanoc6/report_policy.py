@@ -0,0 +1,33 @@
+import time
+
+
+class ReportPolicy:
+    """Deadband and heartbeat rule for when a reading is worth uploading
+
+    A sample is due when any metric has moved at least its deadband away
+    from the last reported value, or when heartbeat_ms has passed since
+    the last report. Otherwise it is counted as suppressed.
+    """
+
+    def __init__(self, deadbands, heartbeat_ms):
+        self.deadbands = deadbands  # One threshold per metric, in the sample's order
+        self.heartbeat_ms = heartbeat_ms
+        self.suppressed = 0
+        self._last = None
+        self._reported_at = 0
+
+    def due(self, sample):
+        if self._last is None:
+            return True
+        if time.ticks_diff(time.ticks_ms(), self._reported_at) >= self.heartbeat_ms:
+            return True
+        for value, last, deadband in zip(sample, self._last, self.deadbands):
+            if abs(value - last) >= deadband:
+                return True
+        self.suppressed += 1
+        return False
+
+    def reported(self, sample):
+        """Record a sample the cloud has accepted as the new reference"""
+        self._last = tuple(sample)
+        self._reported_at = time.ticks_ms()
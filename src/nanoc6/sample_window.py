@@ -0,0 +1,63 @@
+from array import array
+import math
+
+METRICS = ('temperature', 'humidity', 'pressure')
+
+
+class SampleWindow:
+    """Fixed-size ring buffer of readings between two uploads
+
+    Samples are stored in preallocated float arrays, so add() never
+    allocates. Once the buffer is full the oldest samples are overwritten.
+    summary() reduces the window to per-metric mean, min, max and
+    (population) standard deviation.
+    """
+
+    def __init__(self, capacity=128):
+        self.capacity = capacity
+        self.count = 0
+        self.overwritten = 0  # Samples lost because the window was full
+        self._next = 0
+        self._columns = [array('f', bytes(4 * capacity)) for _ in METRICS]
+
+    def add(self, temperature, humidity, pressure):
+        i = self._next
+        columns = self._columns
+        columns[0][i] = temperature
+        columns[1][i] = humidity
+        columns[2][i] = pressure
+        self._next = i + 1 if i + 1 < self.capacity else 0
+        if self.count < self.capacity:
+            self.count += 1
+        else:
+            self.overwritten += 1
+
+    def clear(self):
+        self.count = 0
+        self._next = 0
+
+    def summary(self):
+        """Row fields for the window: <metric> (mean), <metric>_min/_max/_std, sample_count"""
+        n = self.count
+        if not n:
+            return None
+        row = {'sample_count': n}
+        for name, column in zip(METRICS, self._columns):
+            # The valid samples are always the first n slots, in some order
+            low = high = total = column[0]
+            for i in range(1, n):
+                value = column[i]
+                total += value
+                if value < low:
+                    low = value
+                elif value > high:
+                    high = value
+            mean = total / n
+            squares = 0.0
+            for i in range(n):
+                squares += (column[i] - mean) ** 2
+            row[name] = round(mean, 2)
+            row[name + '_min'] = round(low, 2)
+            row[name + '_max'] = round(high, 2)
+            row[name + '_std'] = round(math.sqrt(squares / n), 3)
+        return row
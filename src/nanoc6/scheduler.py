@@ -0,0 +1,47 @@
+import time
+
+
+class Scheduler:
+    """Timer queue that runs each job at its deadline
+
+    A job returns the delay in ms until it should run next, or None to keep
+    its regular period. run_pending() returns how long the caller can sleep
+    before the earliest deadline, so the main loop only wakes when there is
+    work to do.
+    """
+
+    def __init__(self, idle_ms=1000):
+        self.idle_ms = idle_ms  # Sleep used when no jobs are registered
+        self._jobs = {}  # name -> [deadline, period_ms, func]
+
+    def add(self, name, func, period_ms, delay_ms=0):
+        """Register or replace a job, first running it after delay_ms"""
+        self._jobs[name] = [time.ticks_add(time.ticks_ms(), delay_ms), period_ms, func]
+
+    def remove(self, name):
+        self._jobs.pop(name, None)
+
+    def __contains__(self, name):
+        return name in self._jobs
+
+    def run_in(self, name, delay_ms=0):
+        """Move a job's next deadline, e.g. to run it immediately"""
+        job = self._jobs.get(name)
+        if job:
+            job[0] = time.ticks_add(time.ticks_ms(), delay_ms)
+
+    def run_pending(self):
+        """Run every due job and return ms until the next deadline"""
+        for job in list(self._jobs.values()):
+            if time.ticks_diff(job[0], time.ticks_ms()) > 0:
+                continue
+            # Reschedule first so a failing job doesn't run again at once
+            job[0] = time.ticks_add(time.ticks_ms(), job[1])
+            delay = job[2]()
+            if delay is not None:
+                job[0] = time.ticks_add(time.ticks_ms(), delay)
+
+        if not self._jobs:
+            return self.idle_ms
+        now = time.ticks_ms()
+        return max(0, min(time.ticks_diff(job[0], now) for job in self._jobs.values()))
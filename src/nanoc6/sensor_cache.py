@@ -0,0 +1,56 @@
+import time
+
+
+class SensorCache:
+    """Owns the ENV unit and serves every reader from the latest sample
+
+    A sample younger than max_age_ms is returned as is. Otherwise the
+    sensor is read once: temperature and humidity come from a single SHT4x
+    measurement where the driver exposes one, pressure from the BMP280. A
+    request that arrives while a read is already on the bus, e.g. a BLE
+    IRQ during an upload, gets the previous sample instead of starting a
+    second transaction.
+    """
+
+    def __init__(self, unit, max_age_ms=2000):
+        self.unit = unit
+        self.max_age_ms = max_age_ms
+        self.reads = 0  # Sensor reads that went to the bus
+        self.hits = 0  # Requests answered from the cache
+        self._sample = None  # (temperature, humidity, pressure)
+        self._taken = 0
+        self._busy = False
+        sht = getattr(unit, 'sht4x', None)
+        # Look on the class: hasattr() on the instance would run a measurement
+        self._sht = sht if sht is not None and hasattr(type(sht), 'measurements') else None
+
+    @property
+    def age_ms(self):
+        """Age of the cached sample, or None before the first read"""
+        if self._sample is None:
+            return None
+        return time.ticks_diff(time.ticks_ms(), self._taken)
+
+    def sample(self, max_age_ms=None):
+        """Return (temperature, humidity, pressure), reading the sensor if stale"""
+        if max_age_ms is None:
+            max_age_ms = self.max_age_ms
+        if self._sample is not None and (self._busy or self.age_ms <= max_age_ms):
+            self.hits += 1
+            return self._sample
+        if self._busy:
+            raise OSError('sensor busy')
+        self._busy = True
+        try:
+            if self._sht:
+                temperature, humidity = self._sht.measurements
+            else:
+                temperature = self.unit.read_temperature()
+                humidity = self.unit.read_humidity()
+            pressure = self.unit.read_pressure()
+        finally:
+            self._busy = False
+        self.reads += 1
+        self._sample = (temperature, humidity, pressure)
+        self._taken = time.ticks_ms()
+        return self._sample
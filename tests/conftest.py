@@ -0,0 +1,6 @@
+"""Tests run the firmware under the host simulator, reusing the bench scenarios"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'bench')]
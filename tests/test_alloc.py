@@ -0,0 +1,50 @@
+"""Heap allocated per event by the optimized firmware's hot paths
+
+Runs the events of bench/alloc_bench.py under tracemalloc. An event must
+keep nothing allocated once warmed up, and the bytes it allocates along
+the way, counted line by line, must stay under a bound. CPython boxes
+every float and most ints, so those aren't zero; the bounds sit about one
+small object above today's figures, so an event that goes back to
+building a dict, string or payload crosses them.
+"""
+import contextlib
+import tracemalloc
+
+import pytest
+
+from alloc_bench import RETAINED_SLACK, Discard, boot, events, measure
+from sim import StandIn
+
+ALLOCATED_BOUNDS = {
+    'advertise': 768,
+    'get_readings': 1216,
+    'stream_sample': 1344,
+    'upload_request': 2240,
+}
+
+
+@pytest.fixture(scope='module')
+def results():
+    tracemalloc.start()
+    try:
+        with StandIn() as standin:
+            with contextlib.redirect_stdout(Discard()):
+                device = boot(standin)
+            return {name: measure(device, action, 100)
+                    for name, action in events(device).items()}
+    finally:
+        tracemalloc.stop()
+
+
+def test_every_event_is_bounded(results):
+    assert set(results) == set(ALLOCATED_BOUNDS)
+
+
+@pytest.mark.parametrize('event', sorted(ALLOCATED_BOUNDS))
+def test_event_keeps_nothing(results, event):
+    assert results[event]['retained_bytes'] <= RETAINED_SLACK
+
+
+@pytest.mark.parametrize('event', sorted(ALLOCATED_BOUNDS))
+def test_event_allocations_within_bound(results, event):
+    assert results[event]['allocated_bytes'] <= ALLOCATED_BOUNDS[event]
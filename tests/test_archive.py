@@ -0,0 +1,116 @@
+"""services.archive: what goes in comes back out exactly
+
+A store is filled with readings that exercise each encoding: hundredths
+and arbitrary floats, NULLs, infinities, whole-second and millisecond
+times, repeated times and a block of a single row. It is exported in
+small blocks and every device is read back, whole and by time range, and
+compared value for value with the rows in the store.
+"""
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from services.archive import ArchiveReader, export, store_pages  # noqa: E402
+from services.store import METRICS, READING_NAMES, ReadingStore, iso_timestamp  # noqa: E402
+
+START = datetime(2025, 8, 1, tzinfo=timezone.utc)
+PADDING = (None,) * (len(READING_NAMES) - 6)
+
+
+def history(seed=3):
+    """Rows per device, each device stressing one encoding"""
+    rng = random.Random(seed)
+    rows = []
+
+    def add(mac, seconds, values):
+        rows.append((mac, 'm5_env_4') + tuple(values)
+                    + (iso_timestamp(START + timedelta(seconds=seconds)),) + PADDING)
+
+    # Hundredths on a fixed 5 minute interval, with some jitter and a gap
+    for n in range(700):
+        add('24587C000001', n * 300 + (rng.randrange(3) if n % 50 == 0 else 0) + 86400 * (n > 400),
+            (round(rng.uniform(-10, 30), 2), round(rng.uniform(0, 100), 2),
+             round(rng.uniform(995, 1025), 2)))
+    # Full-precision floats, NULLs and infinities at millisecond times
+    for n in range(300):
+        values = [rng.uniform(-40, 120), rng.uniform(0, 100), rng.uniform(300, 1100)]
+        if n % 7 == 0:
+            values[n % 3] = None
+        if n == 150:
+            values[0] = float('inf')
+        add('24587C000002', n * 61.237, values)
+    # Several readings at the same instant, and a device with a single row
+    for n in range(5):
+        add('24587C000003', 3600, (20.0 + n, 40.0, 1000.0))
+    add('24587C000004', 7200, (None, None, None))
+    # Metric values whose hundredths overflow a float64 mantissa
+    for n in range(3):
+        add('24587C000005', n * 600, (1e300 * (n + 1), 50.0, 1000.0))
+    return rows
+
+
+def stored(store, mac_address):
+    """(ms, values) of one device in created_at, id order, NULL as NaN"""
+    rows = store.db.execute(
+        f"SELECT CAST(round((julianday(created_at) - 2440587.5) * 86400000.0) AS INTEGER), "
+        f"{', '.join(METRICS)} FROM readings WHERE mac_address = ? ORDER BY created_at, id",
+        (mac_address,)).fetchall()
+    table = np.array(rows, dtype=np.float64)
+    return table[:, 0].astype(np.int64), table[:, 1:].T
+
+
+def assert_same(series, t, values):
+    assert series['t'].astype(np.int64).tolist() == t.tolist()
+    for name, column in zip(METRICS, values):
+        np.testing.assert_array_equal(series[name], column)
+
+
+@pytest.fixture(scope='module')
+def archived(tmp_path_factory):
+    store = ReadingStore()
+    rows = history()
+    store.insert_readings(rows)
+    path = tmp_path_factory.mktemp('archive') / 'readings.nc6a'
+    assert export(store_pages(store, page_rows=97), path, block_rows=64) == len(rows)
+    yield store, ArchiveReader(path), path
+    store.close()
+
+
+def test_round_trip_is_exact(archived):
+    store, reader, _ = archived
+    macs = [row[0] for row in store.db.execute('SELECT DISTINCT mac_address FROM readings')]
+    assert reader.devices() == sorted(macs)
+    assert reader.rows == store.count()
+    for mac_address in macs:
+        assert_same(reader.read(mac_address), *stored(store, mac_address))
+
+
+def test_range_reads_match_the_store(archived):
+    store, reader, _ = archived
+    mac_address = '24587C000001'
+    t, values = stored(store, mac_address)
+    rng = random.Random(5)
+    for _ in range(20):
+        start, end = sorted(rng.sample(t.tolist(), 2))
+        series = reader.read(mac_address, start, end)
+        selected = (t >= start) & (t < end)
+        assert_same(series, t[selected], values[:, selected])
+    assert len(reader.read(mac_address, 0, 1)['t']) == 0
+
+
+def test_scan_covers_every_device(archived):
+    store, reader, _ = archived
+    scanned = dict(reader.scan())
+    assert sorted(scanned) == reader.devices()
+    assert sum(len(series['t']) for series in scanned.values()) == store.count()
+
+
+def test_truncated_archive_is_refused(archived, tmp_path):
+    _, _, path = archived
+    cut = tmp_path / 'cut.nc6a'
+    cut.write_bytes(path.read_bytes()[:-4])
+    with pytest.raises(ValueError):
+        ArchiveReader(cut)
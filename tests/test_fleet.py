@@ -0,0 +1,63 @@
+"""sim.fleet: a small fleet against an in-process stand-in
+
+Boots a handful of unmodified optimized-firmware devices together for a
+few seconds of real time. Every device must boot, each registered one
+must deliver its first reading once, the unregistered ones must only poll
+their registration, and the report must account for every request.
+"""
+import asyncio
+
+import pytest
+
+from sim import StandIn
+from sim.fleet import Fleet, register_at, report
+
+DEVICES = 10
+SECONDS = 4.0
+
+
+def run_fleet(tmp_path, **options):
+    with StandIn() as standin:
+        fleet = Fleet(standin.address, DEVICES, flash_dir=str(tmp_path), **options)
+        fleet.build()
+        for mac_address in fleet.registered_macs:
+            standin.register(mac_address)
+        asyncio.run(fleet.run(SECONDS))
+        rows = standin.select('readings', [])
+    return fleet, rows, report(fleet, SECONDS, storm_s=2.0, bin_s=0.5)
+
+
+@pytest.mark.parametrize('cold', [False, True])
+def test_fleet_boots_and_reports_once(tmp_path, cold):
+    fleet, rows, result = run_fleet(tmp_path, unregistered=0.2, cold=cold, seed=1)
+    assert result['booted'] == DEVICES and result['boot_errors'] == 0
+    registered = fleet.registered_macs
+    assert len(registered) == DEVICES - 2
+    # One boot reading from each registered device, and none from the others
+    assert sorted(row['mac_address'] for row in rows) == sorted(registered)
+    endpoints = result['endpoints']
+    assert endpoints['POST readings']['statuses'] == {201: len(registered)}
+    # Every device checks its registration, but a warm boot reads first and
+    # confirms its cached registration REVALIDATE_DELAY_MS later
+    checks = endpoints['GET devices']['requests']
+    assert checks == DEVICES
+    early = [record for record in fleet.records if record[0] < 1.0]
+    assert sum(record[2] == 'GET devices' for record in early) == (DEVICES if cold else 2)
+    assert result['requests'] == len(fleet.records) == checks + len(registered)
+    assert sum(rate * result['bin_s'] for rate in result['rates']) == result['requests']
+    assert result['storm']['requests'] + result['after_storm']['requests'] == result['requests']
+    assert result['storm']['failed'] == 0
+
+
+def test_config_must_exist(tmp_path):
+    fleet = Fleet(('127.0.0.1', 9), 1, config=[('NO_SUCH_SETTING', 1)], flash_dir=str(tmp_path))
+    with pytest.raises(ValueError):
+        fleet.build()
+
+
+def test_register_at_counts_existing_devices():
+    with StandIn() as standin:
+        standin.register('24587C000001')
+        macs = ['24587C000001', '24587C000002']
+        assert register_at(standin.url, macs) == 2
+        assert standin.count('devices') == 2
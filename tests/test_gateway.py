@@ -0,0 +1,167 @@
+"""services.gateway: what it refuses, and what a refusal costs other requests
+
+Requests go straight to Gateway.handle with the flushers running, so
+batching, the writer thread and the store are real; only the socket is
+skipped. Bad requests must get a 400 without reaching the database, a row
+the database refuses must not take its batch down with it, and a full
+queue or a failing database must answer 503 with Retry-After.
+"""
+import asyncio
+import json
+import sqlite3
+
+import pytest
+
+from services.gateway import Gateway
+from services.http import RequestError, read_request
+from services.store import ReadingStore
+
+MAC = '24587CAABBCC'
+READING = {'mac_address': MAC, 'temperature': 21.5, 'humidity': 40.0, 'pressure': 1013.0}
+JSON = {'content-type': 'application/json'}
+FORM = {'content-type': 'application/x-www-form-urlencoded'}
+
+
+def post(gateway, payload, headers=JSON):
+    body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+    return gateway.handle('POST', '/rest/v1/readings', headers, body)
+
+
+def run(test, store=None, **options):
+    """test(gateway, store) under a running gateway, closed afterwards"""
+    store = store or ReadingStore()
+
+    async def main():
+        gateway = await Gateway(store, flush_ms=10, **options).start()
+        try:
+            return await test(gateway, store)
+        finally:
+            await gateway.close()
+
+    try:
+        return asyncio.run(main())
+    finally:
+        store.close()
+
+
+class RefusingStore(ReadingStore):
+    """Refuses, as a constraint would, any batch holding a row from `sensor`"""
+
+    def __init__(self, sensor):
+        super().__init__()
+        self.sensor = sensor
+        self.batches = []
+
+    def insert_readings(self, rows):
+        self.batches.append(len(rows))
+        if any(row[1] == self.sensor for row in rows):
+            raise sqlite3.IntegrityError('CHECK constraint failed: sensor')
+        return super().insert_readings(rows)
+
+
+class LockedStore(ReadingStore):
+    """A database that can't take a write right now"""
+
+    def insert_readings(self, rows):
+        raise sqlite3.OperationalError('database is locked')
+
+
+@pytest.mark.parametrize('payload', [
+    dict(READING, temperature=500),
+    dict(READING, humidity=-1),
+    dict(READING, pressure=float('nan')),
+    dict(READING, temperature=True),
+    dict(READING, mac_address='24:58:7C:AA:BB:CC'),
+    dict(READING, sample_count=0),
+    dict(READING, heap_free=1 << 63),
+    dict(READING, created_at='yesterday'),
+    dict(READING, colour='red'),
+    {'mac_address': MAC, 'temperature': 21.5},
+    [],
+    [READING, 'not a row'],
+    b'{"mac_address": ',
+])
+def test_invalid_request_is_refused(payload):
+    async def test(gateway, store):
+        status, body, _ = await post(gateway, payload)
+        assert status == 400 and body['message']
+        assert gateway.stats()['rejected'] == 1
+        assert store.count() == 0
+
+    run(test)
+
+
+def test_invalid_form_is_refused():
+    async def test(gateway, store):
+        status, _, _ = await post(gateway, b'mac_address=' + MAC.encode() + b'&temperature',
+                                  FORM)
+        assert status == 400
+        status, _, _ = await post(gateway, b'mac_address=' + MAC.encode()
+                                  + b'&temperature=hot&humidity=40&pressure=1013', FORM)
+        assert status == 400
+        assert store.count() == 0
+
+    run(test)
+
+
+def test_valid_requests_are_stored():
+    async def test(gateway, store):
+        form = f'mac_address={MAC}&temperature=20.5&humidity=41&pressure=1012.5'.encode()
+        assert (await post(gateway, form, FORM))[0] == 201
+        assert (await post(gateway, [READING, READING]))[0] == 201
+        status, rows, _ = await post(gateway, READING, dict(JSON, prefer='return=representation'))
+        assert status == 201 and rows[0]['id'] == 4 and rows[0]['temperature'] == 21.5
+        assert store.count() == 4
+
+    run(test)
+
+
+def test_refused_request_does_not_sink_its_batch():
+    async def test(gateway, store):
+        good = [dict(READING, sensor='env4', temperature=20 + i) for i in range(5)]
+        bad = dict(READING, sensor='bad')
+        rows = good[:3] + [bad] + good[3:]
+        results = await asyncio.gather(*(post(gateway, row) for row in rows))
+        statuses = [status for status, _, _ in results]
+        assert statuses == [201, 201, 201, 400, 201, 201]
+        # All six went to the database together, then one at a time
+        assert store.batches[0] == 6 and len(store.batches) == 7
+        assert store.count() == 5
+        assert gateway.stats()['dropped_rows'] == 1
+
+    run(test, RefusingStore('bad'), shards=1)
+
+
+def test_failed_write_answers_503():
+    async def test(gateway, store):
+        status, body, extra = await post(gateway, READING)
+        assert status == 503
+        assert dict(extra) == {'Retry-After': '7'}
+        assert gateway.stats()['failed_batches'] == 1
+
+    run(test, LockedStore(), retry_after=7)
+
+
+def test_full_queue_answers_503():
+    async def test(gateway, store):
+        status, _, extra = await post(gateway, [READING] * 3)
+        assert status == 503 and dict(extra) == {'Retry-After': '5'}
+        assert gateway.stats()['throttled'] == 1
+        assert (await post(gateway, [READING] * 2))[0] == 201
+        assert store.count() == 2
+
+    run(test, max_pending=2)
+
+
+@pytest.mark.parametrize('length', ['-1', 'ten'])
+def test_bad_content_length_is_refused(length):
+    async def test():
+        reader = asyncio.StreamReader()
+        reader.feed_data(f'POST /rest/v1/readings HTTP/1.1\r\nContent-Length: {length}\r\n\r\n'
+                         .encode())
+        reader.feed_eof()
+        with pytest.raises(RequestError) as refused:
+            await read_request(reader, 1 << 20)
+        assert refused.value.status == 400
+
+    asyncio.run(test())
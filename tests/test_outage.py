@@ -0,0 +1,49 @@
+"""Store-and-forward through outages, with bench/outage_scenario.py's fleet
+
+Readings taken while WiFi or the backend is down wait in the flash queue.
+Once the outage ends every one of them must reach the backend exactly once:
+nothing still queued, one stored row per reading taken, no row twice.
+"""
+import argparse
+
+import pytest
+
+from outage_scenario import run_device, scenario
+from sim import StandIn
+
+DEVICES = 3
+MINUTES = 80
+OUTAGE = (5 * 60, 45 * 60)
+
+
+def stored(standin, device):
+    rows = standin.select('readings', [('mac_address', f'eq.{device.world.mac_address}')])
+    return [row['created_at'] for row in rows]
+
+
+@pytest.mark.parametrize('down', ['wifi', 'backend'])
+@pytest.mark.parametrize('mode', ['fixed', 'backoff'])
+def test_queued_readings_delivered_once(down, mode):
+    with StandIn() as standin:
+        if down == 'backend':
+            standin.outages = [OUTAGE]
+        devices = [run_device('compact', serial, standin, MINUTES * 60, True, mode,
+                              wifi_outage=OUTAGE if down == 'wifi' else None)
+                   for serial in range(DEVICES)]
+        for device in devices:
+            queue = device.module.reading_queue
+            taken = queue.next_seq - 1
+            # At least the readings of the outage had to wait in the queue
+            assert taken >= (OUTAGE[1] - OUTAGE[0]) // 600
+            assert queue.pending == 0
+            created = stored(standin, device)
+            assert len(created) == taken
+            assert len(set(created)) == taken
+
+
+def test_backoff_spares_the_backend():
+    args = argparse.Namespace(script='compact', devices=20, unregistered=0.2,
+                              minutes=40, outage='10:30', bin=10)
+    fixed, backoff = scenario(args, 'fixed'), scenario(args, 'backoff')
+    assert backoff['requests_during_outage'] < fixed['requests_during_outage'] / 2
+    assert backoff['stored_readings'] == fixed['stored_readings']
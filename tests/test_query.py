@@ -0,0 +1,153 @@
+"""services.query: LTTB, gap splitting and the /series handler
+
+lttb is checked against a plain one-series-at-a-time version of the
+algorithm, as written in Steinarsson's thesis; downsample and the handler
+against what the dashboard relies on: segments split at gaps, no more
+points than asked for plus one per gap, and a 400 for any query it can't
+answer rather than a dropped connection.
+"""
+import asyncio
+import math
+import random
+from datetime import datetime, timezone
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from services.query import SeriesQuery, downsample, lttb, split_gaps  # noqa: E402
+from services.rollup import Rollup  # noqa: E402
+from services.store import METRICS, READING_NAMES, ReadingStore, iso_timestamp  # noqa: E402
+
+START = 1754006400  # 2025-08-01T00:00:00Z
+MAC = '24587CAABBCC'
+
+
+def reference_lttb(x, y, n_out):
+    """Indices kept for one series, bucket by bucket in plain Python"""
+    n = len(x)
+    if n_out >= n:
+        return list(range(n))
+    # Bucket b starts at 1 + b * (n - 2) / (n_out - 2), rounded down
+    edges = [1 + b * (n - 2) // (n_out - 2) for b in range(n_out - 1)] + [n]
+    kept = [0]
+    a = 0
+    for b in range(n_out - 2):
+        low, high = edges[b], edges[b + 1]
+        next_low, next_high = edges[b + 1], edges[b + 2]
+        next_x = sum(x[next_low:next_high]) / (next_high - next_low)
+        next_y = sum(y[next_low:next_high]) / (next_high - next_low)
+        best, best_area = low, -1.0
+        for i in range(low, high):
+            area = abs((x[a] - next_x) * (y[i] - y[a]) - (x[a] - x[i]) * (next_y - y[a]))
+            if area > best_area:
+                best, best_area = i, area
+        kept.append(best)
+        a = best
+    kept.append(n - 1)
+    return kept
+
+
+@pytest.mark.parametrize('n, n_out', [(1000, 50), (1000, 3), (101, 100), (37, 10), (5000, 800)])
+def test_lttb_matches_reference(n, n_out):
+    rng = np.random.default_rng(n + n_out)
+    x = np.cumsum(rng.uniform(1, 600, n))
+    y = np.cumsum(rng.normal(0, 1, (3, n)), axis=1)
+    kept = lttb(x, y, n_out)
+    assert kept.shape == (3, n_out)
+    for series in range(3):
+        assert kept[series].tolist() == reference_lttb(x.tolist(), y[series].tolist(), n_out)
+
+
+def test_lttb_small_outputs():
+    x = np.arange(10.0)
+    y = np.arange(10.0)[None, :]
+    assert lttb(x, y, 20).tolist() == [list(range(10))]
+    assert lttb(x, y, 2).tolist() == [[0, 9]]
+    assert lttb(x, y, 1).tolist() == [[0]]
+
+
+def test_lttb_keeps_a_spike():
+    x = np.arange(1000.0)
+    y = np.zeros((1, 1000))
+    y[0, 613] = 50.0
+    assert 613 in lttb(x, y, 20)[0]
+
+
+def test_split_gaps():
+    t = np.array([0, 60, 120, 120 + 1801, 120 + 1801 + 1800, 10000.0])
+    assert split_gaps(t, 1800) == [(0, 3), (3, 5), (5, 6)]
+    assert split_gaps(t[:1], 1800) == [(0, 1)]
+    assert split_gaps(np.array([]), 1800) == [(0, 0)]
+
+
+def test_downsample_splits_and_bounds_points():
+    # Three runs of 600 readings a minute apart, separated by hour-long gaps
+    t = np.concatenate([START + run * 40000 + np.arange(600) * 60.0 for run in range(3)])
+    values = np.vstack([np.sin(t / 3000), np.cos(t / 3000), np.full(len(t), 1000.0)])
+    values[1, 5] = np.nan
+    result = downsample(t, values, 90)
+    assert len(result) == len(METRICS)
+    for segments in result:
+        assert len(segments) == 3
+        assert sum(len(segment['t']) for segment in segments) <= 90 + 3
+        for (start, _), segment in zip(split_gaps(t, 1800), segments):
+            assert segment['t'][0] == int(t[start] * 1000)
+            assert segment['t'] == sorted(segment['t'])
+    assert result[1][0]['v'][0] == round(math.cos(START / 3000), 2)
+    assert all(not isinstance(v, float) or math.isfinite(v)
+               for segment in result[1] for v in segment['v'])
+
+
+def store_with(rows):
+    store = ReadingStore()
+    padding = (None,) * (len(READING_NAMES) - 6)
+    store.insert_readings([(MAC, 'm5_env_4', 20.0 + i % 7, 40.0, 1000.0,
+                            iso_timestamp(datetime.fromtimestamp(seconds, timezone.utc)))
+                           + padding for i, seconds in enumerate(rows)])
+    return store
+
+
+def get(query, target):
+    return asyncio.run(query.handle('GET', target, {}, b''))
+
+
+@pytest.mark.parametrize('params', [
+    'end=9999-12-31T23:59:59-14:00',
+    'start=0001-01-01T00:00:00%2B14:00&end=2025-08-02T00:00:00',
+    'start=yesterday',
+    'start=2025-08-02T00:00:00&end=2025-08-01T00:00:00',
+    'points=1',
+    'points=many',
+])
+def test_series_refuses_bad_query(params):
+    status, body, _ = get(SeriesQuery(ReadingStore()), f'/series?{params}')
+    assert status == 400 and body['message']
+
+
+def test_series_from_raw_rows():
+    store = store_with([START + i * 300 for i in range(288)] + [START + 90000])
+    status, body, _ = get(SeriesQuery(store), f'/series?mac_address={MAC}&points=50'
+                          '&start=2025-08-01T00:00:00Z&end=2025-08-02T12:00:00Z')
+    assert status == 200 and body['source'] == 'raw'
+    device = body['devices'][MAC]
+    assert device['rows'] == 289
+    assert [len(segment['t']) for segment in device['temperature']] == [49, 1]
+
+
+def test_series_from_rollups_over_long_spans():
+    store = store_with([START + i * 3600 for i in range(24 * 60)])
+    Rollup(store).catch_up()
+    query = SeriesQuery(store, max_raw=2000)
+    status, body, _ = get(query, '/series?start=2025-08-01T00:00:00Z&end=2025-10-01T00:00:00Z')
+    assert status == 200 and body['source'] == '1h'
+    device = body['devices'][MAC]
+    # Hourly buckets an hour apart are one run, not 1440 gaps
+    assert device['rows'] == 24 * 60 and len(device['temperature']) == 1
+
+
+def test_lttb_reference_on_irregular_times():
+    rng = random.Random(7)
+    x = sorted(rng.uniform(0, 1e6) for _ in range(300))
+    y = [rng.gauss(0, 1) for _ in x]
+    assert lttb(np.array(x), np.array([y]), 30)[0].tolist() == reference_lttb(x, y, 30)
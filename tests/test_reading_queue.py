@@ -0,0 +1,173 @@
+"""nanoc6.reading_queue on the host filesystem: recovery and replay
+
+The queue must survive power cuts: a torn last record or a corrupt one is
+dropped with everything after it, an interrupted compaction is finished,
+and a random mix of appends, uploads, reboots and torn writes must hand
+every surviving reading to the uploader exactly once and in order. A full
+queue gives up its oldest readings, never its newest.
+"""
+import importlib.util
+import os
+import random
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Loaded on its own, so the simulator's per-device nanoc6 imports stay untouched
+_spec = importlib.util.spec_from_file_location(
+    'reading_queue', os.path.join(ROOT, 'src', 'nanoc6', 'reading_queue.py'))
+reading_queue = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(reading_queue)
+ReadingQueue = reading_queue.ReadingQueue
+RECORD_SIZE = reading_queue.RECORD_SIZE
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'readings.q')
+
+
+def fill(queue, count, first=0):
+    """Append readings whose timestamps, first onwards, identify them"""
+    return [queue.append(first + n, 20.5, 40.0, 1000.0 + n) for n in range(count)]
+
+
+def timestamps(queue):
+    return [record[1] for record in queue.peek(1 << 20)]
+
+
+def test_append_peek_ack(path):
+    queue = ReadingQueue(path)
+    assert fill(queue, 5) == [1, 2, 3, 4, 5]
+    assert queue.peek(2) == [(1, 0, 20.5, 40.0, 1000.0), (2, 1, 20.5, 40.0, 1001.0)]
+    queue.ack(2)
+    assert queue.pending == 3 and timestamps(queue) == [2, 3, 4]
+    queue.ack(1)  # Stale acks change nothing
+    assert queue.pending == 3
+    reopened = ReadingQueue(path)
+    assert (reopened.acked, reopened.pending, reopened.next_seq) == (2, 3, 6)
+    assert timestamps(reopened) == [2, 3, 4]
+    reopened.ack(5)
+    assert not os.path.exists(path) and reopened.pending == 0
+    assert ReadingQueue(path).next_seq == 6
+
+
+@pytest.mark.parametrize('cut', [1, RECORD_SIZE // 2, RECORD_SIZE - 1])
+def test_torn_tail_is_dropped(path, cut):
+    fill(ReadingQueue(path), 10)
+    with open(path, 'r+b') as f:
+        f.truncate(10 * RECORD_SIZE - cut)
+    queue = ReadingQueue(path)
+    assert queue.pending == 9 and timestamps(queue) == list(range(9))
+    # Recovery rewrote the log without the torn record
+    assert os.path.getsize(path) == 9 * RECORD_SIZE
+    assert queue.append(9, 20.5, 40.0, 1009.0) == 10
+    assert timestamps(ReadingQueue(path)) == list(range(10))
+
+
+def test_corrupt_record_drops_it_and_what_follows(path):
+    queue = ReadingQueue(path)
+    fill(queue, 10)
+    queue.ack(2)
+    with open(path, 'r+b') as f:
+        f.seek(5 * RECORD_SIZE + 9)
+        byte = f.read(1)
+        f.seek(-1, os.SEEK_CUR)
+        f.write(bytes([byte[0] ^ 0x40]))
+    queue = ReadingQueue(path)
+    # Sequences after a bad record can't be trusted to follow on from it
+    assert timestamps(queue) == [2, 3, 4]
+    assert os.path.getsize(path) == 3 * RECORD_SIZE
+    assert queue.next_seq == 6
+
+
+def test_corrupt_ack_falls_back_to_the_last_one_written(path):
+    queue = ReadingQueue(path)
+    fill(queue, 6)
+    queue.ack(3)
+    with open(path + '.ack', 'rb') as f:
+        good = f.read()
+    with open(path + '.ack.tmp', 'wb') as f:
+        f.write(good)  # A rename that didn't complete
+    with open(path + '.ack', 'r+b') as f:
+        f.write(b'\xff')
+    assert timestamps(ReadingQueue(path)) == [3, 4, 5]
+
+
+def test_interrupted_compaction_is_finished(path):
+    queue = ReadingQueue(path)
+    fill(queue, 4)
+    queue.ack(1)
+    queue._compact()
+    # Power lost after the old log was removed, before the rename
+    os.rename(path, path + '.tmp')
+    assert timestamps(ReadingQueue(path)) == [1, 2, 3]
+    # Or before the old log was removed: the copy is dropped
+    with open(path + '.tmp', 'wb') as f:
+        f.write(b'\0' * RECORD_SIZE)
+    assert timestamps(ReadingQueue(path)) == [1, 2, 3]
+    assert not os.path.exists(path + '.tmp')
+
+
+def test_compaction_keeps_only_pending(path):
+    queue = ReadingQueue(path, max_records=8)
+    fill(queue, 8)
+    queue.ack(5)
+    assert os.path.getsize(path) == 8 * RECORD_SIZE
+    fill(queue, 1, first=8)
+    # The log was full of records, so the acknowledged ones were rewritten away
+    assert os.path.getsize(path) == 4 * RECORD_SIZE
+    assert timestamps(queue) == [5, 6, 7, 8]
+    assert timestamps(ReadingQueue(path, max_records=8)) == [5, 6, 7, 8]
+
+
+def test_full_queue_drops_the_oldest(path):
+    queue = ReadingQueue(path, max_records=16)
+    fill(queue, 16)
+    assert queue.pending == 16
+    fill(queue, 1, first=16)
+    # An eighth of the backlog makes room, oldest first
+    assert queue.pending == 15 and queue.acked == 2
+    assert timestamps(queue) == list(range(2, 17))
+    # Every other append finds the queue full again
+    fill(queue, 10, first=17)
+    assert queue.pending == 15 and timestamps(queue) == list(range(12, 27))
+    reopened = ReadingQueue(path, max_records=16)
+    assert reopened.pending == 15 and timestamps(reopened) == list(range(12, 27))
+    assert reopened.next_seq == 28
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_random_crashes_replay_exactly_once(path, seed):
+    rng = random.Random(seed)
+    queue = ReadingQueue(path, max_records=64)
+    pending = []  # Timestamps not yet delivered, oldest first
+    delivered = []
+    torn = []
+    taken = 0
+    for _ in range(400):
+        action = rng.random()
+        if action < 0.45:
+            queue.append(taken, 20.5, 40.0, 1000.0)
+            pending.append(taken)
+            taken += 1
+        elif action < 0.75:
+            batch = queue.peek(rng.randint(1, 8))
+            delivered.extend(record[1] for record in batch)
+            if batch:
+                queue.ack(batch[-1][0])
+            del pending[:len(batch)]
+        elif action < 0.9:
+            queue = ReadingQueue(path, max_records=64)
+        elif pending and os.path.exists(path):
+            # Power lost while the newest record was being written
+            with open(path, 'r+b') as f:
+                f.truncate(os.path.getsize(path) - rng.randint(1, RECORD_SIZE - 1))
+            torn.append(pending.pop())
+            queue = ReadingQueue(path, max_records=64)
+        assert timestamps(queue) == pending
+        assert queue.pending == len(pending)
+    delivered.extend(timestamps(queue))
+    assert torn
+    assert delivered == [n for n in range(taken) if n not in torn]
@@ -0,0 +1,201 @@
+"""sim.standin over HTTP: PostgREST filters, error codes and injected faults
+
+The firmware and the host services are only as well tested as the
+stand-in is faithful, so its filters are checked against the same rows
+filtered in Python, its errors against the status and code PostgREST
+would answer, and each fault against what a client sees on the wire.
+"""
+import http.client
+import json
+import socket
+
+import pytest
+
+from sim.standin import Faults, StandIn
+
+MACS = ('24587C000001', '24587C000002', '24587C000003')
+
+
+def request(standin, method, path, body=None, headers=None):
+    """(status, JSON body or None, headers) of one request on a new connection"""
+    host, port = standin.address
+    connection = http.client.HTTPConnection(host, port, timeout=5)
+    try:
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body)
+            headers = dict(headers or {}, **{'Content-Type': 'application/json'})
+        connection.request(method, f'/rest/v1/{path}', body, headers or {})
+        response = connection.getresponse()
+        data = response.read()
+        return response.status, json.loads(data) if data else None, dict(response.getheaders())
+    finally:
+        connection.close()
+
+
+@pytest.fixture(scope='module')
+def standin():
+    """Twelve readings from three devices and one registered device, read-only"""
+    with StandIn() as standin:
+        standin.register(MACS[0])
+        for n, mac_address in enumerate(MACS * 4):
+            standin.insert('readings', [{
+                'mac_address': mac_address, 'temperature': 20.0 + n, 'humidity': 40.0,
+                'pressure': None if n % 5 == 0 else 1000.0 + n,
+                'created_at': f'2025-08-01T00:{n:02d}:00Z'}])
+        yield standin
+
+
+@pytest.mark.parametrize('query, keep', [
+    (f'mac_address=eq.{MACS[1]}', lambda row: row['mac_address'] == MACS[1]),
+    (f'mac_address=neq.{MACS[1]}', lambda row: row['mac_address'] != MACS[1]),
+    ('temperature=gt.25', lambda row: row['temperature'] > 25),
+    ('temperature=gte.25', lambda row: row['temperature'] >= 25),
+    ('temperature=lt.25', lambda row: row['temperature'] < 25),
+    ('temperature=lte.25', lambda row: row['temperature'] <= 25),
+    ('pressure=is.null', lambda row: row['pressure'] is None),
+    ('created_at=gte.2025-08-01T00:05:00.000000%2B00:00&temperature=lt.30',
+     lambda row: '00:05:00' <= row['created_at'][11:19] and row['temperature'] < 30),
+])
+def test_filters_match_python(standin, query, keep):
+    everything = standin.select('readings', [])
+    status, rows, _ = request(standin, 'GET', f'readings?{query}')
+    assert status == 200
+    assert rows == [row for row in everything if keep(row)]
+    assert rows
+
+
+def test_select_order_limit_offset(standin):
+    status, rows, _ = request(standin, 'GET', 'readings?select=mac_address,temperature'
+                              '&order=mac_address.desc,temperature.asc&limit=5&offset=2')
+    assert status == 200
+    everything = sorted(standin.select('readings', []),
+                        key=lambda row: (-int(row['mac_address'], 16), row['temperature']))
+    assert rows == [{'mac_address': row['mac_address'], 'temperature': row['temperature']}
+                    for row in everything[2:7]]
+
+
+def test_insert_returns_representation():
+    reading = {'mac_address': MACS[0], 'temperature': 21.5, 'humidity': 40.0,
+               'pressure': 1000.0, 'created_at': '2025-08-01T02:00:00+02:00'}
+    with StandIn() as standin:
+        status, rows, _ = request(standin, 'POST', 'readings', [reading, reading],
+                                  {'Prefer': 'return=representation'})
+        assert status == 201 and len(rows) == 2
+        assert rows[0]['created_at'] == '2025-08-01T00:00:00.000000+00:00'
+        assert rows[1]['id'] == rows[0]['id'] + 1
+        form = f'mac_address={MACS[0]}&temperature=21.5&humidity=40&pressure=1000'
+        status, body, _ = request(standin, 'POST', 'readings', form,
+                                  {'Content-Type': 'application/x-www-form-urlencoded'})
+        assert status == 201 and body is None
+        assert standin.count('readings') == 3
+
+
+@pytest.mark.parametrize('method, path, body, status, code', [
+    ('GET', 'readings?colour=eq.red', None, 400, 'PGRST204'),
+    ('GET', 'readings?select=id,colour', None, 400, 'PGRST204'),
+    ('GET', 'readings?order=colour.asc', None, 400, 'PGRST204'),
+    ('GET', 'readings?order=id.sideways', None, 400, 'PGRST100'),
+    ('GET', 'readings?temperature=like.2*', None, 400, 'PGRST100'),
+    ('GET', 'readings?limit=ten', None, 400, 'PGRST100'),
+    ('GET', 'sensors', None, 404, '42P01'),
+    ('POST', 'readings', {'mac_address': MACS[0], 'colour': 'red'}, 400, 'PGRST204'),
+    ('POST', 'readings', {'mac_address': MACS[0], 'created_at': 'yesterday'}, 400, '22007'),
+    ('POST', 'readings', {'mac_address': MACS[0], 'temperature': [21.5]}, 400, 'PGRST102'),
+    ('POST', 'readings', {'mac_address': MACS[0], 'heap_free': 1 << 64}, 400, 'PGRST102'),
+    ('POST', 'readings', [], 400, 'PGRST102'),
+    ('POST', 'readings', '{"mac_address": ', 400, 'PGRST102'),
+    ('POST', 'devices', {'name': 'NanoC6'}, 400, '23502'),
+    ('POST', 'devices', {'mac_address': MACS[0]}, 409, '23505'),
+])
+def test_errors_use_postgrest_codes(standin, method, path, body, status, code):
+    headers = {'Content-Type': 'application/json'} if isinstance(body, str) else None
+    answer = request(standin, method, path, body, headers)
+    assert answer[:2] == (status, {'code': code, 'message': answer[1]['message'],
+                                   'details': None, 'hint': None})
+    assert standin.count('readings') == 12 and standin.count('devices') == 1
+
+
+def test_negative_content_length_closes_the_connection(standin):
+    with socket.create_connection(standin.address, timeout=5) as connection:
+        connection.sendall(b'POST /rest/v1/readings HTTP/1.1\r\nHost: x\r\n'
+                           b'Content-Length: -1\r\n\r\n')
+        reply = connection.makefile('rb').read()
+    assert reply.startswith(b'HTTP/1.1 400 ')
+    assert b'PGRST102' in reply and b'Connection: close' in reply
+
+
+def fake_clock():
+    now = [0.0]
+    return now, lambda: now[0]
+
+
+def test_outages_answer_503():
+    now, clock = fake_clock()
+    with StandIn(clock=clock) as standin:
+        standin.outages = [(10, 20)]
+        assert request(standin, 'GET', 'devices')[0] == 200
+        now[0] = 10
+        status, body, _ = request(standin, 'GET', 'devices')
+        assert status == 503 and body['code'] == 'PGRST000'
+        now[0] = 20
+        assert request(standin, 'GET', 'devices')[0] == 200
+        standin.outage = True
+        assert request(standin, 'GET', 'devices')[0] == 503
+        assert [status for _, _, _, status in standin.requests] == [200, 503, 200, 503]
+
+
+def test_throttle_refills_with_the_clock():
+    now, clock = fake_clock()
+    with StandIn(clock=clock, faults=Faults(throttle=(2, 3))) as standin:
+        statuses = [request(standin, 'GET', 'devices')[0] for _ in range(4)]
+        assert statuses == [200, 200, 200, 429]
+        status, _, headers = request(standin, 'GET', 'devices')
+        assert status == 429 and headers['Retry-After'] == '1'
+        now[0] = 0.5  # One token back at 2 per second
+        assert [request(standin, 'GET', 'devices')[0] for _ in range(2)] == [200, 429]
+
+
+def test_injected_errors_use_error_status():
+    with StandIn(faults=Faults(error_rate=1.0, error_status=500)) as standin:
+        status, body, _ = request(standin, 'POST', 'devices', {'mac_address': MACS[0]})
+        assert status == 500 and body['message'] == 'injected error'
+        assert standin.count('devices') == 0
+
+
+def test_dropped_request_is_never_handled():
+    with StandIn(faults=Faults(drop_rate=1.0)) as standin:
+        with pytest.raises(ConnectionError):
+            request(standin, 'POST', 'devices', {'mac_address': MACS[0]})
+        assert standin.count('devices') == 0
+        assert standin.requests[0][3] == 0
+
+
+def test_lost_reply_still_stores_the_insert():
+    with StandIn(faults=Faults(lost_rate=1.0)) as standin:
+        with pytest.raises(ConnectionError):
+            request(standin, 'POST', 'devices', {'mac_address': MACS[0]})
+        assert standin.count('devices') == 1
+        assert standin.requests[0][3] == 0
+
+
+def test_latency_waits_through_sleep():
+    slept = []
+    faults = Faults(latency=('uniform', (20, 80)), seed=4)
+    with StandIn(faults=faults, sleep=slept.append) as standin:
+        for _ in range(5):
+            assert request(standin, 'GET', 'devices')[0] == 200
+    assert len(slept) == 5 and all(0.02 <= seconds <= 0.08 for seconds in slept)
+    again = Faults(latency=('uniform', (20, 80)), seed=4)
+    replayed = []
+    for _ in range(5):
+        again.roll()
+        replayed.append(again.delay_s())
+    assert replayed == slept
+
+
+def test_same_seed_meets_the_same_faults():
+    first, second = (Faults(error_rate=0.3, drop_rate=0.2, lost_rate=0.1, seed=9)
+                     for _ in range(2))
+    rolls = [first.roll() for _ in range(200)]
+    assert rolls == [second.roll() for _ in range(200)]
+    assert any(drop for drop, _, _ in rolls) and any(error for _, _, error in rolls)
@@ -0,0 +1,147 @@
+"""Precompile the firmware to .mpy so the NanoC6 doesn't compile it at boot
+
+Compiles the shared nanoc6 package and one firmware variant, renamed to
+app, with mpy-cross into build/firmware/<variant>/, next to a small
+main.py that imports app and calls app.main(). Copy the whole directory
+to the device's filesystem root, and delete any .py copies of the same
+modules there first: MicroPython imports foo.py ahead of foo.mpy.
+
+  python tools/build_firmware.py optimized --profile
+  mpremote cp -r build/firmware/optimized/. :
+
+With --profile, main.py starts nanoc6.boot_profile before importing app,
+so the boot log lists the time and heap taken by each import and setup()
+stage. Run it once from source and once from .mpy to see what the build
+saves; the host can only report sizes. With --frozen, a manifest.py is
+written as well, for building the modules into the firmware image itself
+(FROZEN_MANIFEST=.../manifest.py), where they run from flash and take no
+heap for their bytecode at all.
+
+mpy-cross must produce the .mpy version of the MicroPython release the
+firmware is built on; pip install mpy-cross==<that release> provides it.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(ROOT, 'src')
+PACKAGE = 'nanoc6'
+
+VARIANTS = {
+    'optimized': 'ble-readings-server-optimized.py',
+    'compact': 'ble-readings-server-compact.py',
+    'legacy': 'ble-readings-server.py',
+}
+
+MAIN = """# Generated by tools/build_firmware.py from {source}
+import app
+app.main()
+"""
+
+MAIN_PROFILED = """# Generated by tools/build_firmware.py from {source}
+from nanoc6 import boot_profile
+boot_profile.start()
+import app
+app.main()
+"""
+
+MANIFEST = """# Generated by tools/build_firmware.py from {source}
+# Freezes the NanoC6 firmware into a MicroPython build:
+#   make BOARD=... FROZEN_MANIFEST={path}
+include('$(PORT_DIR)/boards/manifest.py')
+package('{package}', base_path='{src}')
+module('app.py', base_path='{out}')
+"""
+
+
+def find_mpy_cross(path=None):
+    """Command that runs mpy-cross: the given path, one on PATH, or the pip module"""
+    if path:
+        return [path]
+    found = shutil.which('mpy-cross')
+    if found:
+        return [found]
+    try:
+        import mpy_cross  # noqa: F401
+    except ImportError:
+        sys.exit('mpy-cross not found: pip install mpy-cross, or pass --mpy-cross PATH')
+    return [sys.executable, '-m', 'mpy_cross']
+
+
+def compile_module(mpy_cross, source, target, name, opt):
+    """Compile one source file to .mpy, keeping `name` for tracebacks"""
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    command = mpy_cross + [f'-O{opt}', '-s', name, '-o', target, source]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode:
+        sys.exit(f'mpy-cross failed on {source}:\n{result.stderr or result.stdout}')
+
+
+def package_modules():
+    """(source path, path relative to the device root) for the shared package"""
+    package_dir = os.path.join(SRC_DIR, PACKAGE)
+    return [(os.path.join(package_dir, name), f'{PACKAGE}/{name}')
+            for name in sorted(os.listdir(package_dir)) if name.endswith('.py')]
+
+
+def build(variant, out_dir, mpy_cross, opt=0, profile=False, frozen=False):
+    """Build one variant into out_dir; returns (device path, source bytes, built bytes)"""
+    source = VARIANTS[variant]
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.makedirs(out_dir)
+    modules = package_modules() + [(os.path.join(SRC_DIR, source), 'app.py')]
+
+    sizes = []
+    for path, name in modules:
+        target = os.path.join(out_dir, name[:-3] + '.mpy')
+        compile_module(mpy_cross, path, target, name, opt)
+        sizes.append((name[:-3] + '.mpy', os.path.getsize(path), os.path.getsize(target)))
+
+    with open(os.path.join(out_dir, 'main.py'), 'w') as f:
+        f.write((MAIN_PROFILED if profile else MAIN).format(source=source))
+
+    if frozen:
+        # Frozen modules are compiled by the firmware build, so it needs the sources
+        shutil.copy(os.path.join(SRC_DIR, source), os.path.join(out_dir, 'app.py'))
+        manifest = os.path.join(out_dir, 'manifest.py')
+        with open(manifest, 'w') as f:
+            f.write(MANIFEST.format(source=source, path=manifest, package=PACKAGE,
+                                    src=SRC_DIR, out=out_dir))
+    return sizes
+
+
+def print_sizes(sizes):
+    print(f'{"module":32} {"source":>8} {".mpy":>8}')
+    for name, source, built in sizes:
+        print(f'{name:32} {source:8} {built:8}')
+    source = sum(size[1] for size in sizes)
+    built = sum(size[2] for size in sizes)
+    print(f'{"total":32} {source:8} {built:8}  ({100 * built / source:.0f}% of source)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompile NanoC6 firmware to .mpy')
+    parser.add_argument('variant', nargs='?', default='optimized', choices=sorted(VARIANTS))
+    parser.add_argument('--out', default=os.path.join(ROOT, 'build', 'firmware'),
+                        help='build directory; each variant gets a subdirectory')
+    parser.add_argument('--mpy-cross', metavar='PATH', help='mpy-cross binary to use')
+    parser.add_argument('--opt', type=int, default=0, choices=range(4),
+                        help='mpy-cross optimisation level; 1 and up drop asserts')
+    parser.add_argument('--profile', action='store_true',
+                        help='start nanoc6.boot_profile from main.py')
+    parser.add_argument('--frozen', action='store_true',
+                        help='also write a manifest.py for freezing into a firmware image')
+    args = parser.parse_args()
+
+    out_dir = os.path.join(os.path.abspath(args.out), args.variant)
+    sizes = build(args.variant, out_dir, find_mpy_cross(args.mpy_cross), args.opt,
+                  args.profile, args.frozen)
+    print_sizes(sizes)
+    print(f'Built {args.variant} into {out_dir}')
+
+
+if __name__ == '__main__':
+    main()